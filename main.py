@@ -1,16 +1,26 @@
 # main.py
 import os
 import base64
+import codecs
+import html
 import json
 import re
 import secrets
+import string
 import time
 import hashlib
+import math
 import uuid
 import random
 import threading
 import copy
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextlib
+import datetime
+import sqlite3
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+import httpx
 from dotenv import load_dotenv
 import flask
 
@@ -26,6 +36,7 @@ from google.api_core import client_options
 from google.api_core.exceptions import ResourceExhausted, InvalidArgument
 from bs4 import BeautifulSoup
 from google.auth.transport.requests import Request, AuthorizedSession
+from cryptography.fernet import Fernet, InvalidToken
 import google.auth.transport.requests 
 from werkzeug.middleware.proxy_fix import ProxyFix
 import psycopg2 
@@ -141,10 +152,111 @@ SCOPES = [
 CLIENT_SECRETS_FILE = "client_secrets.json"
 SETTINGS_FILE = "user_settings.json"
 CACHE_FILE = "cache.json"
-CACHE_TTL_SECONDS = 900
+# Upper bound on a cached analysis' age; within it, freshness is checked against the Gmail message set
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", 6 * 3600))
 _cache_lock = threading.Lock()
 _worker_thread_locals = threading.local()
 
+# --- Gmail Fetch Configuration ---
+GMAIL_API_BASE = "https://gmail.googleapis.com"
+GMAIL_BATCH_URL = f"{GMAIL_API_BASE}/batch/gmail/v1"
+# Gmail accepts at most 100 calls per batch request
+GMAIL_BATCH_SIZE = 100
+# "batch" packs messages.get calls into multipart batch requests, "threads" issues one GET per message,
+# "async" multiplexes GETs from every request over one shared HTTP/2 connection pool
+GMAIL_FETCH_MODE = os.environ.get("GMAIL_FETCH_MODE", "batch").lower()
+GMAIL_SEARCH_PAGE_SIZE = 100
+# Hard stop for very large windows; the token budget usually ends the search well before this
+GMAIL_MAX_MESSAGES = 1000
+
+# --- LLM Input Limits ---
+MAX_LLM_INPUT_CHARS = 1500000
+# Briefings larger than this many estimated tokens are analyzed in parallel shards of this size and merged
+ANALYSIS_SHARD_TOKENS = int(os.environ.get("ANALYSIS_SHARD_TOKENS", 60000))
+ANALYSIS_MAX_SHARDS = int(os.environ.get("ANALYSIS_MAX_SHARDS", 24))
+# Cost ceiling rather than a model limit: no single call ever sees more than one shard
+MAX_LLM_INPUT_TOKENS = ANALYSIS_SHARD_TOKENS * ANALYSIS_MAX_SHARDS
+# Input tokens a briefing's newsletters are fitted into; lower it for faster, cheaper analysis
+BRIEFING_TOKEN_BUDGET = int(os.environ.get("BRIEFING_TOKEN_BUDGET", MAX_LLM_INPUT_CHARS // 4))
+# Bodies are downloaded until this multiple of the budget, so the allocator has lower-ranked mail to trim
+BUDGET_FETCH_HEADROOM = 2
+
+# --- Token Estimation ---
+# Linear model over cheap text features. The defaults below are uncalibrated: they were
+# hand-tuned to roughly 4 characters per token on English prose, not fitted to Gemini.
+# Run scripts/calibrate_token_estimator.py to fit them to count_tokens; the file it
+# writes overrides the defaults.
+TOKEN_CALIBRATION_PATH = os.environ.get(
+    "TOKEN_CALIBRATION_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_calibration.json")
+)
+_TOKEN_FEATURES = ('words', 'chars', 'punctuation', 'digits', 'non_ascii', 'urls')
+_DEFAULT_TOKEN_COEFFICIENTS = {
+    'words': 0.55, 'chars': 0.16, 'punctuation': 0.55, 'digits': 0.3, 'non_ascii': 0.35, 'urls': 4.0,
+}
+# The memo holds the strings themselves, so it is bounded by total characters
+TOKEN_ESTIMATE_CACHE_MAX_CHARS = 16_000_000
+# Strings shorter than this are cheaper to measure than to look up
+_TOKEN_ESTIMATE_CACHE_MIN_CHARS = 256
+_PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+_DIGITS_TABLE = str.maketrans('', '', string.digits)
+
+def _load_token_coefficients(path=None):
+    coefficients = dict(_DEFAULT_TOKEN_COEFFICIENTS)
+    try:
+        with open(path or TOKEN_CALIBRATION_PATH, 'r') as f:
+            calibrated = json.load(f).get('coefficients', {})
+        coefficients.update({k: float(v) for k, v in calibrated.items() if k in coefficients})
+    except (OSError, ValueError, AttributeError):
+        pass
+    return coefficients
+
+_token_coefficients = _load_token_coefficients()
+_token_estimate_cache = {}
+_token_estimate_cache_chars = 0
+# Estimates run on the worker and LLM pools at once; the lock covers the memo and its size counter
+_token_estimate_lock = threading.Lock()
+
+def _token_features(text):
+    """Feature counts for the token model, using only C-level str operations."""
+    length = len(text)
+    # Extracted text is whitespace-normalized, so counting separators stands in for a (much slower) split()
+    separators = text.count(' ') + text.count('\n')
+    return {
+        'words': separators + 1 if length else 0,
+        'chars': length - separators,
+        'punctuation': length - len(text.translate(_PUNCTUATION_TABLE)),
+        'digits': length - len(text.translate(_DIGITS_TABLE)),
+        # Extra UTF-8 bytes: 1 per accented Latin letter, 2 per CJK character, 3 per emoji
+        'non_ascii': 0 if text.isascii() else len(text.encode('utf-8', 'surrogatepass')) - length,
+        'urls': text.count('://'),
+    }
+
+def _estimate_tokens(text):
+    """Estimated Gemini token count for `text`, offline.
+
+    ⚡ Bolt: Results are memoized with the string itself as the key (Python caches a str's
+    hash on the object, and the same object compares by identity), so repeat estimates of
+    the same newsletter are a dict lookup and two texts can never share an entry.
+    """
+    global _token_estimate_cache_chars
+    if len(text) < _TOKEN_ESTIMATE_CACHE_MIN_CHARS:
+        features = _token_features(text)
+        return int(sum(_token_coefficients[k] * features[k] for k in _TOKEN_FEATURES))
+    with _token_estimate_lock:
+        tokens = _token_estimate_cache.get(text)
+    if tokens is None:
+        features = _token_features(text)
+        tokens = int(sum(_token_coefficients[k] * features[k] for k in _TOKEN_FEATURES))
+        with _token_estimate_lock:
+            # Another thread may have measured the same text meanwhile; count it once
+            if text not in _token_estimate_cache:
+                if _token_estimate_cache_chars + len(text) > TOKEN_ESTIMATE_CACHE_MAX_CHARS:
+                    _token_estimate_cache.clear()
+                    _token_estimate_cache_chars = 0
+                _token_estimate_cache[text] = tokens
+                _token_estimate_cache_chars += len(text)
+    return tokens
+
 # ⚡ Bolt: Caching user settings from file to reduce I/O and JSON parsing overhead
 _file_settings_cache = None
 _file_settings_mtime = 0
@@ -229,6 +341,18 @@ def init_db():
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
             """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS sender_boilerplate (
+                    sender VARCHAR(255) PRIMARY KEY,
+                    model JSONB
+                );
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS briefing_schedules (
+                    user_email VARCHAR(255) PRIMARY KEY,
+                    schedule JSONB
+                );
+            """)
             conn.commit()
             cur.close()
             print(" * Database connection successful.")
@@ -252,6 +376,10 @@ def anonymize_user(email):
 def get_credentials_from_session(creds_data):
     if not creds_data:
         return None
+    creds_data = dict(creds_data)
+    if creds_data.get('expiry'):
+        # Stored as an ISO string (naive UTC, as google-auth expects) so the session stays JSON
+        creds_data['expiry'] = datetime.datetime.fromisoformat(creds_data['expiry'])
     try:
         config = get_client_secrets_config()
         if isinstance(config, dict):
@@ -450,7 +578,6 @@ else:
     model = None
 
 _RE_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]')
-_RE_SCRIPT_STYLE = re.compile(r'<(script|style).*?>.*?</\1>', flags=re.IGNORECASE | re.DOTALL)
 _RE_HTML_TAGS = re.compile(r'<[^>]+>')
 _RE_JSON_MATCH = re.compile(r'\{.*\}', flags=re.DOTALL)
 
@@ -458,17 +585,154 @@ def sanitize_for_llm(text):
     text = _RE_CONTROL_CHARS.sub('', text)
     return text.replace('\\', '\\\\').replace('"', '\\"')
 
+# Elements whose content is never visible text, and the tag that ends each one
+_RE_SKIP_OPEN = re.compile(r'<(script|style)|<(head)(?=[\s/>])', flags=re.IGNORECASE)
+_RE_SKIP_CLOSE = {
+    'script': re.compile(r'</script>', flags=re.IGNORECASE),
+    'style': re.compile(r'</style>', flags=re.IGNORECASE),
+    # A missing </head> ends at <body>, which is left in place to be stripped like any other tag
+    'head': re.compile(r'</head\s*>|(?=<body[\s/>])', flags=re.IGNORECASE),
+}
+_RE_TRAILING_WORD = re.compile(r'\S*\Z')
+_EXTRACT_BLOCK_CHARS = 16384
+
+class _HtmlTextExtractor:
+    """Incremental HTML-to-text state machine that stops once `max_chars` of text is produced.
+
+    Feed it the document in pieces; each piece is scanned once. Text outside tags is
+    entity-decoded and whitespace-collapsed as it is emitted, <script>, <style> and <head>
+    content is skipped, and feed() returns True as soon as the budget is full so callers
+    can stop reading. Only an unfinished tag, word or closing tag is carried between pieces.
+    """
+
+    def __init__(self, max_chars=15000):
+        self.max_chars = max_chars
+        self.done = max_chars <= 0
+        self._buf = ''
+        self._skip = None
+        self._pieces = []
+        self._length = 0
+        # True when the last emitted text ended mid-word, so the next text continues that word
+        self._open_word = False
+
+    def feed(self, chunk):
+        if self.done:
+            return True
+        buf = self._buf + chunk
+        while buf and not self.done:
+            if self._skip is not None:
+                closer = _RE_SKIP_CLOSE[self._skip]
+                match = closer.search(buf)
+                if match is None:
+                    # Keep just enough to recognise a closing tag split across pieces
+                    buf = buf[-16:]
+                    break
+                buf = buf[match.end():]
+                self._skip = None
+                continue
+            match = _RE_SKIP_OPEN.search(buf)
+            if match is not None:
+                self._emit(buf[:match.start()])
+                tag_end = buf.find('>', match.end())
+                if tag_end == -1:
+                    buf = buf[match.start():]
+                    break
+                self._skip = (match.group(1) or match.group(2)).lower()
+                buf = buf[tag_end + 1:]
+                continue
+            # No skipped element starts here: emit up to the last complete tag, or the last
+            # whitespace when there is no tag left open, and carry the rest to the next piece
+            cut = buf.rfind('>') + 1
+            rest = buf[cut:]
+            if '<' not in rest:
+                cut += _RE_TRAILING_WORD.search(rest).start()
+            self._emit(buf[:cut])
+            buf = buf[cut:]
+            break
+        self._buf = '' if self.done else buf
+        return self.done
+
+    def close(self):
+        """Flush whatever is buffered and return the extracted text."""
+        if not self.done and self._skip is None:
+            self._emit(self._buf)
+        self._buf = ''
+        return ' '.join(self._pieces)[:self.max_chars]
+
+    def _emit(self, segment):
+        if not segment or self.done:
+            return
+        text = _RE_HTML_TAGS.sub(' ', segment)
+        if '&' in text:
+            text = html.unescape(text)
+        self._append(text)
+
+    def _append(self, text):
+        words = text.split()
+        if words:
+            piece = ' '.join(words)
+            if self._open_word and not text[0].isspace():
+                self._pieces[-1] += piece
+                self._length += len(piece)
+            else:
+                self._pieces.append(piece)
+                self._length += len(piece) + 1
+            if self._length > self.max_chars:
+                self.done = True
+        self._open_word = not text[-1].isspace()
+
+_RE_PLAIN_URL = re.compile(r'[<\[(]?https?://[^\s>\])]+[>\])]?')
+
+class _PlainTextExtractor(_HtmlTextExtractor):
+    """text/plain counterpart of _HtmlTextExtractor: no tags to strip, so it only drops
+    bare links (invisible in the HTML version too) and collapses whitespace."""
+
+    def feed(self, chunk):
+        if self.done:
+            return True
+        buf = self._buf + chunk
+        cut = _RE_TRAILING_WORD.search(buf).start()
+        if cut:
+            self._append(_RE_PLAIN_URL.sub(' ', buf[:cut]))
+        self._buf = '' if self.done else buf[cut:]
+        return self.done
+
+    def close(self):
+        if not self.done and self._buf:
+            self._append(_RE_PLAIN_URL.sub(' ', self._buf))
+        self._buf = ''
+        return ' '.join(self._pieces)[:self.max_chars]
+
 def optimize_newsletter_for_llm(html_content: str, max_chars: int = 15000) -> str:
     """Strips HTML tags and extra whitespace to massively reduce LLM token usage."""
-    # ⚡ Bolt: Regex is >50x faster than BeautifulSoup for this and handles <script>/<style> removal correctly.
-    # Remove script and style tags and their contents
-    no_scripts = _RE_SCRIPT_STYLE.sub('', html_content)
-    # Remove all other HTML tags
-    text_only = _RE_HTML_TAGS.sub(' ', no_scripts)
-    # Remove extra whitespace (newline, tabs)
-    clean_text = ' '.join(text_only.split())
-    # Truncate to save tokens if it's too long
-    return clean_text[:max_chars]
+    # ⚡ Bolt: One incremental pass that stops as soon as max_chars of text exists,
+    # instead of stripping and collapsing the whole document and then truncating it.
+    extractor = _HtmlTextExtractor(max_chars)
+    for start in range(0, len(html_content), _EXTRACT_BLOCK_CHARS):
+        if extractor.feed(html_content[start:start + _EXTRACT_BLOCK_CHARS]):
+            break
+    return extractor.close()
+
+# base64 characters per decoded block; a multiple of 4 so every block decodes on its own
+_BASE64_BLOCK_CHARS = 16384
+
+def extract_text_from_base64(body_data: str, max_chars: int = 15000, plain: bool = False) -> str:
+    """Decode a base64url HTML (or, with plain=True, text/plain) body block by block straight into the text extractor.
+
+    Stops decoding once max_chars of text has been produced, so only the part of a large
+    newsletter that is actually kept is ever decoded.
+    """
+    extractor = _PlainTextExtractor(max_chars) if plain else _HtmlTextExtractor(max_chars)
+    utf8 = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    for start in range(0, len(body_data), _BASE64_BLOCK_CHARS):
+        block = body_data[start:start + _BASE64_BLOCK_CHARS]
+        if start + _BASE64_BLOCK_CHARS >= len(body_data):
+            # Gmail sometimes omits the trailing padding
+            block += '=' * (-len(block) % 4)
+        if extractor.feed(utf8.decode(base64.urlsafe_b64decode(block))):
+            return extractor.close()
+    extractor.feed(utf8.decode(b'', final=True))
+    return extractor.close()
 
 def generate_script_from_analysis(analysis_json, style="anchor"):
     persona = PERSONAS.get(style, PERSONAS["anchor"])
@@ -536,8 +800,8 @@ ANALYSIS_PROMPT_TEMPLATE = """
     Content: ---
     """
 
-def _process_llm_response(response):
-    # Check finish reason
+def _finish_reason_error(response):
+    """User-facing error for a response that stopped abnormally, else None."""
     if response.candidates:
         finish_reason = response.candidates[0].finish_reason
         if finish_reason == 2: # MAX_TOKENS
@@ -546,38 +810,470 @@ def _process_llm_response(response):
             return {"error": "The analysis was blocked due to safety filters."}
         elif finish_reason not in [1, 0] and hasattr(finish_reason, 'value') and finish_reason.value not in [1, 0]:
             return {"error": "The AI encountered an unexpected interruption. Please try again."}
+    return None
 
-    text = getattr(response, 'text', None)
+def _parse_analysis_text(text):
     if not text:
         return {"error": "AI analysis failed."}
     match = _RE_JSON_MATCH.search(text)
     if match: return json.loads(match.group(0))
     else: raise ValueError("No valid JSON found.")
 
-def analyze_news_with_llm(newsletters_text):
+def _process_llm_response(response):
+    # Check finish reason
+    error = _finish_reason_error(response)
+    if error:
+        return error
+    return _parse_analysis_text(getattr(response, 'text', None))
+
+def _llm_error(e):
+    """Map an exception from a Gemini analysis call to the error shown to the user."""
+    if isinstance(e, json.JSONDecodeError):
+        return {"error": "The AI failed to format the analysis correctly. Please try again."}
+    if isinstance(e, ResourceExhausted):
+        return {"error": "AI service is currently overloaded. Please wait a minute before trying again."}
+    if isinstance(e, InvalidArgument):
+        return {"error": "The newsletter content is too large for the current AI model capacity."}
+    print(f"LLM analysis error: {e}")
+    err_str = str(e).lower()
+    if "quota" in err_str:
+        return {"error": "AI rate limit reached. Please try again in a few minutes."}
+    return {"error": "AI analysis failed."}
+
+def _generate_analysis(prompt):
+    """One Gemini analysis call. Returns the parsed JSON, or {"error": ...} for the user."""
+    try:
+        generation_config = genai.types.GenerationConfig(max_output_tokens=16384, temperature=0.2)
+        response = model.generate_content(prompt, generation_config=generation_config)
+        return _process_llm_response(response)
+    except Exception as e:
+        return _llm_error(e)
+
+def analyze_news_with_llm(newsletters_text, user_key=None, identifiers=(), issue_sources=None):
     if not model: raise Exception("Gemini API model is not configured.")
 
     # Pre-validation check
-    if len(newsletters_text) > 1500000:
+    input_tokens = _estimate_tokens(newsletters_text)
+    if input_tokens > MAX_LLM_INPUT_TOKENS:
         return {"error": "Too much newsletter content to process at once. Please reduce your lookback window in settings."}
 
-    prompt = ANALYSIS_PROMPT_TEMPLATE + newsletters_text
+    if _uses_issue_summaries(newsletters_text):
+        issues = _summarize_issues(newsletters_text, user_key, identifiers, issue_sources)
+        if issues is not None:
+            return _generate_analysis(_merge_issues_prompt(issues))
+    if input_tokens <= ANALYSIS_SHARD_TOKENS:
+        return _generate_analysis(ANALYSIS_PROMPT_TEMPLATE + newsletters_text)
+    # ⚡ Bolt: Large windows are analyzed as parallel shards and merged, instead of one slow call that can hit the size limit
+    return _analyze_in_shards(newsletters_text, user_key)
+
+# --- Sharded Analysis ---
+RECONCILE_PROMPT_TEMPLATE = """
+    You are an elite media analyst. The newsletters were analyzed in separate batches and the partial results below
+    were pre-merged. Produce the final briefing from them.
+    Task:
+    1. Merge groups that still describe the same news event; combine their `stories` and rewrite the `consensus_summary` to cover all of them.
+    2. Keep each story's `headline`, `source` and `angle` verbatim.
+    3. **Remaining Stories**: Top 5 only. One-sentence summary.
+    4. **Limit**: Top 10 groups max, ranked by importance and number of sources. For each group, include the top 5 most relevant sources max.
+
+    Output JSON in exactly the same format as the input.
+
+    Partial analysis: ---
+    """
+_RE_NEWSLETTER_START = re.compile(r'(?:\*\*\* PRIORITY SOURCE \*\*\*\n)?\n\n--- Newsletter from: ')
+_RE_HEADLINE_WORD = re.compile(r'[a-z0-9]{3,}')
+_HEADLINE_STOPWORDS = frozenset(
+    "the and for with from that this into over after about amid says said will new its their are was were has have "
+    "but not who what how why more than".split()
+)
+# Partial groups whose headline and summary words overlap this much are treated as one event
+STORY_GROUP_MERGE_SIMILARITY = 0.35
+MAX_STORY_GROUPS = 10
+MAX_STORIES_PER_GROUP = 5
+MAX_REMAINING_STORIES = 5
+
+def _split_newsletter_blocks(newsletters_text):
+    """The consolidated briefing text split back into its per-newsletter blocks."""
+    starts = [m.start() for m in _RE_NEWSLETTER_START.finditer(newsletters_text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return [newsletters_text[a:b] for a, b in zip(starts, starts[1:] + [len(newsletters_text)])]
+
+def _split_into_shards(newsletters_text, shard_tokens):
+    """Pack whole newsletter blocks into shards of at most `shard_tokens` estimated tokens.
+
+    A block larger than a shard on its own (never produced by the fetch pipeline, which caps
+    each message) is cut at whitespace.
+    """
+    shards = []
+    current, current_tokens = [], 0
+    for block in _split_newsletter_blocks(newsletters_text):
+        block_tokens = _estimate_tokens(block)
+        while block_tokens > shard_tokens:
+            # 10% slack for uneven token density within the block
+            cut = len(block) * shard_tokens * 9 // (block_tokens * 10)
+            cut = block.rfind(' ', 0, cut) + 1 or cut
+            shards.append(block[:cut])
+            block = block[cut:]
+            block_tokens = _estimate_tokens(block)
+        if current and current_tokens + block_tokens > shard_tokens:
+            shards.append(''.join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += block_tokens
+    if current:
+        shards.append(''.join(current))
+    return [shard for shard in shards if shard.strip()]
+
+def _headline_words(*texts):
+    return {w for t in texts for w in _RE_HEADLINE_WORD.findall((t or '').lower())} - _HEADLINE_STOPWORDS
+
+def _merge_partial_analyses(partials):
+    """Locally merge per-shard analyses: union similar story groups, dedupe stories and remaining stories."""
+    groups = [g for p in partials for g in p.get('story_groups', []) if isinstance(g, dict)]
+    words = [_headline_words(g.get('group_headline'), g.get('consensus_summary')) for g in groups]
+    parent = list(range(len(groups)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(groups)):
+        for j in range(i):
+            union = words[i] | words[j]
+            if union and len(words[i] & words[j]) / len(union) >= STORY_GROUP_MERGE_SIMILARITY:
+                parent[root(i)] = root(j)
+
+    clusters = OrderedDict()
+    for i, group in enumerate(groups):
+        clusters.setdefault(root(i), []).append(group)
+    merged = []
+    for members in clusters.values():
+        # The member with the most sources names the event; the others contribute their stories
+        members.sort(key=lambda g: -len(g.get('stories', [])))
+        stories, seen_sources = [], set()
+        for group in members:
+            for story in group.get('stories', []):
+                source_key = str(story.get('source', '')).strip().lower()
+                if source_key in seen_sources:
+                    continue
+                seen_sources.add(source_key)
+                stories.append(story)
+        merged.append(dict(members[0], stories=stories))
+    merged.sort(key=lambda g: -len(g['stories']))
+
+    remaining, seen_headlines = [], set()
+    for partial in partials:
+        for story in partial.get('remaining_stories', []):
+            key = frozenset(_headline_words(story.get('headline')))
+            if key not in seen_headlines:
+                seen_headlines.add(key)
+                remaining.append(story)
+    return {'story_groups': merged, 'remaining_stories': remaining}
+
+def _finalize_analysis(analysis):
+    """Apply the briefing limits the single-call prompt asks the model for."""
+    groups = [dict(g, stories=g.get('stories', [])[:MAX_STORIES_PER_GROUP])
+              for g in analysis.get('story_groups', [])[:MAX_STORY_GROUPS]]
+    return {'story_groups': groups, 'remaining_stories': analysis.get('remaining_stories', [])[:MAX_REMAINING_STORIES]}
+
+def _map_shards(newsletters_text, user_key=None):
+    """Map step: analyze shards in parallel on the LLM pool and merge them locally.
+
+    Returns the merged analysis, or the first shard's error if every shard failed.
+    """
+    shards = _split_into_shards(newsletters_text, ANALYSIS_SHARD_TOKENS)
+    t_start = time.time()
+    prompts = [ANALYSIS_PROMPT_TEMPLATE + shard for shard in shards]
+    results = list(_llm_pool.for_user(user_key).map(_generate_analysis, prompts))
+    partials = [r for r in results if not r.get('error')]
+    print(f" * [Analysis] {len(shards)} shards, {len(shards) - len(partials)} failed, "
+          f"map took {int((time.time() - t_start) * 1000)}ms")
+    if not partials:
+        return results[0]
+    return _merge_partial_analyses(partials)
+
+def _reconciled_analysis(merged, reconciled):
+    if reconciled.get('error') or not reconciled.get('story_groups'):
+        print(f" * [Analysis] Reconcile failed ({reconciled.get('error')}), using the local merge")
+        reconciled = merged
+    return _finalize_analysis(reconciled)
+
+def _analyze_in_shards(newsletters_text, user_key=None):
+    """Map-reduce analysis: shards are analyzed in parallel, merged locally, then reconciled
+    by one small LLM call over the merged JSON (not the newsletters)."""
+    merged = _map_shards(newsletters_text, user_key)
+    if merged.get('error'):
+        return merged
+    return _reconciled_analysis(merged, _generate_analysis(RECONCILE_PROMPT_TEMPLATE + json.dumps(merged, ensure_ascii=False)))
+
+# --- Per-Issue Summaries ---
+# ⚡ Bolt: Each newsletter issue is summarized into story candidates once, whoever receives it; a user's
+# briefing is then a small merge over those summaries instead of a pass over every raw newsletter.
+# Off by default: a cold briefing costs one call per issue plus the merge, and the saving depends on
+# how many users share issues. Enable with ISSUE_SUMMARIES=true once that trade-off has been measured.
+ISSUE_SUMMARIES_ENABLED = os.environ.get("ISSUE_SUMMARIES", "false").lower() == "true"
+# Each issue is summarized from at most this many tokens of its text, the same cut for every user
+ISSUE_SUMMARY_MAX_TOKENS = int(os.environ.get("ISSUE_SUMMARY_MAX_TOKENS", 2000))
+# Below this many newsletters a single direct call is as cheap as summarize-then-merge
+ISSUE_SUMMARY_MIN_NEWSLETTERS = 3
+ISSUE_SUMMARY_PROMPT_TEMPLATE = """
+    You are an elite media analyst. Extract the news stories from this single newsletter issue.
+    Task:
+    1. List each distinct news story (max 12). Ignore ads/fluff, sponsor blocks and housekeeping.
+    2. `headline`: a neutral headline. `summary`: 2-3 sentences of the core facts.
+    3. `angle`: this newsletter's specific perspective or unique facts (1-2 sentences. Start with a verb like "Argues...", "Cites...", "Reveals...").
+
+    Output JSON format exactly:
+    {
+      "stories": [
+        { "headline": "...", "summary": "...", "angle": "..." }
+      ]
+    }
+
+    Newsletter: ---
+    """
+MERGE_ISSUES_PROMPT_TEMPLATE = """
+    You are an elite media analyst. Below are the stories already extracted from each newsletter in a reader's inbox.
+    Task:
+    1. Group related stories from DIFFERENT newsletters into a single distinct news event.
+    2. Create a neutral headline for the group (`group_headline`).
+    3. Write a `consensus_summary`: A 3-4 sentence summary of the core facts that all sources agree on.
+    4. For each story in a group use the newsletter's `source` and keep its `angle`.
+    5. Newsletters marked `"priority": true` are the reader's priority sources; favour their stories.
+       Newsletters given as `text` instead of `stories` were not pre-summarized; extract their stories yourself.
+    6. **Remaining Stories**: Top 5 only. One-sentence summary.
+    7. **Limit**: Top 10 groups max. For each group, include the top 5 most relevant sources max.
+
+    Output JSON format exactly:
+    {
+      "story_groups": [
+        {
+          "group_headline": "...",
+          "consensus_summary": "...",
+          "stories": [
+            { "headline": "...", "source": "...", "angle": "..." }
+          ]
+        }
+      ],
+      "remaining_stories": [
+        { "headline": "..." }
+      ]
+    }
+
+    Newsletters: ---
+    """
+_PRIORITY_MARKER = "*** PRIORITY SOURCE ***\n"
+_RE_BLOCK_HEADER = re.compile(r'--- Newsletter from: (.*?) ---\n--- Subject: (.*?) ---\n')
+
+def _summarize_issue(issue_text):
+    """Story candidates for one newsletter issue, or None if the call failed."""
+    summary = _generate_analysis(ISSUE_SUMMARY_PROMPT_TEMPLATE + issue_text)
+    stories = summary.get('stories')
+    if summary.get('error') or not isinstance(stories, list):
+        return None
+    return {'stories': [s for s in stories if isinstance(s, dict)]}
+
+def _summarize_issues(newsletters_text, user_key=None, identifiers=(), issue_sources=None):
+    """Per-issue layer. Returns [{source, subject, priority, stories}] for every newsletter block,
+    from the shared issue cache or summarized now in parallel on the LLM pool.
+
+    `issue_sources` (from _process_email_messages) gives each block a (key, text) pair for the
+    issue as it was before any per-user dedupe or trimming. The shared summary is made from that
+    text, so users whose copies were shaped differently still share one summary of the whole
+    issue; without them a block is keyed by, and summarized from, its own text. Either text is cut
+    to ISSUE_SUMMARY_MAX_TOKENS, and if the summary inputs together exceed MAX_LLM_INPUT_TOKENS the
+    layer is skipped (None), as if no issue could be summarized.
+
+    A failed summary is retried once; an issue that still fails is passed on as {..., text}
+    for the merge call to read directly. None if no issue could be summarized at all.
+    """
+    issues = []
+    blocks = _split_newsletter_blocks(newsletters_text)
+    if not issue_sources or len(issue_sources) != len(blocks):
+        issue_sources = [(None, None)] * len(blocks)
+    for block, (issue_key, issue_text) in zip(blocks, issue_sources):
+        priority = block.startswith(_PRIORITY_MARKER)
+        body = block[len(_PRIORITY_MARKER):] if priority else block
+        header = _RE_BLOCK_HEADER.search(body)
+        if not header:
+            continue
+        # The key covers only the issue itself, never the per-user priority marker
+        fingerprint = issue_key or hashlib.sha256(body.strip().encode('utf-8')).hexdigest()
+        # The untrimmed issue text skips this user's dedupe and budget, so each call is capped instead
+        issues.append({'source': header.group(1), 'subject': header.group(2), 'priority': priority,
+                       'fingerprint': fingerprint, 'body': body,
+                       'issue_text': _trim_to_tokens(issue_text or body, ISSUE_SUMMARY_MAX_TOKENS)})
+    if sum(_estimate_tokens(issue['issue_text']) for issue in issues) > MAX_LLM_INPUT_TOKENS:
+        return None
+
+    summaries = {issue['fingerprint']: _issue_summary_cache.get(issue['fingerprint']) for issue in issues}
+    missing = OrderedDict((i['fingerprint'], i['issue_text']) for i in issues if summaries[i['fingerprint']] is None)
+    t_start = time.time()
+    pending = list(missing)
+    # ⚡ Bolt: One retry for transient failures, so a single bad call does not send the whole briefing back to raw analysis
+    for _attempt in range(2):
+        if not pending:
+            break
+        fresh = _llm_pool.for_user(user_key).map(_summarize_issue, [missing[fingerprint] for fingerprint in pending])
+        for fingerprint, summary in zip(pending, list(fresh)):
+            summaries[fingerprint] = summary
+            if summary is not None:
+                _issue_summary_cache.put(fingerprint, summary, identifiers)
+        pending = [fingerprint for fingerprint in pending if summaries[fingerprint] is None]
+    print(f" * [Analysis] {len(issues)} issues, {len(issues) - len(missing)} summaries reused, "
+          f"{len(missing) - len(pending)} summarized, {len(pending)} failed in {int((time.time() - t_start) * 1000)}ms")
+    if len(pending) == len(issues):
+        return None
+    merged = []
+    for issue in issues:
+        entry = {'source': issue['source'], 'subject': issue['subject'], 'priority': issue['priority']}
+        summary = summaries[issue['fingerprint']]
+        if summary is not None:
+            entry['stories'] = summary['stories']
+        else:
+            entry['text'] = issue['body']
+        merged.append(entry)
+    return merged
+
+def _merge_issues_prompt(issues):
+    return MERGE_ISSUES_PROMPT_TEMPLATE + json.dumps(issues, ensure_ascii=False)
+
+def _uses_issue_summaries(newsletters_text):
+    return (ISSUE_SUMMARIES_ENABLED
+            and len(_RE_NEWSLETTER_START.findall(newsletters_text)) >= ISSUE_SUMMARY_MIN_NEWSLETTERS)
+
+# --- Streaming Analysis ---
+_RE_JSON_STRUCTURAL = re.compile(r'["\\{}\[\]]')
+_STREAM_EVENT_TYPES = {'story_groups': 'story_group', 'remaining_stories': 'remaining_story'}
+
+class _AnalysisStreamParser:
+    """Incremental JSON scanner for a streamed analysis.
+
+    Fed the model's output piece by piece, `feed` returns each object in the top-level
+    arrays (`story_groups`, `remaining_stories`) as soon as its closing brace arrives.
+    Only structural characters are visited, so strings are skipped in C by the regex.
+    Text before the first '{' (a preamble the model sometimes writes) is ignored.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape_pending = False
+        self._key_parts = None
+        self._last_key = None
+        self._array_key = None
+        self._element_parts = None
+
+    def feed(self, chunk):
+        """Consume the next piece of output. Returns [(array_key, element), ...] completed by it."""
+        completed = []
+        key_start = element_start = 0
+        skip = 0 if self._escape_pending else -1
+        self._escape_pending = False
+        for match in _RE_JSON_STRUCTURAL.finditer(chunk):
+            i = match.start()
+            ch = chunk[i]
+            if i == skip or (not self._started and ch != '{'):
+                continue
+            if self._in_string:
+                if ch == '\\':
+                    if i + 1 == len(chunk):
+                        self._escape_pending = True
+                    skip = i + 1
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_parts is not None:
+                        self._key_parts.append(chunk[key_start:i])
+                        self._last_key = ''.join(self._key_parts)
+                        self._key_parts = None
+                continue
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._key_parts, key_start = [], i + 1
+            elif ch in '{[':
+                self._started = True
+                self._depth += 1
+                if self._depth == 2 and ch == '[':
+                    self._array_key = self._last_key
+                elif self._depth == 3 and ch == '{' and self._array_key is not None:
+                    self._element_parts, element_start = [], i
+            else:
+                if self._depth == 3 and self._element_parts is not None:
+                    self._element_parts.append(chunk[element_start:i + 1])
+                    try:
+                        completed.append((self._array_key, json.loads(''.join(self._element_parts))))
+                    except ValueError:
+                        pass
+                    self._element_parts = None
+                self._depth -= 1
+                if self._depth <= 1:
+                    self._array_key = None
+        if self._element_parts is not None:
+            self._element_parts.append(chunk[element_start:])
+        if self._key_parts is not None:
+            self._key_parts.append(chunk[key_start:])
+        return completed
+
+def _stream_analysis(prompt):
+    """Streamed variant of _generate_analysis.
+
+    Yields ('story_group', group) / ('remaining_story', story) as each one closes in the
+    model's output and returns the same value _generate_analysis would.
+    """
+    parser = _AnalysisStreamParser()
+    text_parts = []
     try:
         generation_config = genai.types.GenerationConfig(max_output_tokens=16384, temperature=0.2)
-        response = model.generate_content(prompt, generation_config=generation_config)
-        return _process_llm_response(response)
-    except json.JSONDecodeError:
-        return {"error": "The AI failed to format the analysis correctly. Please try again."}
-    except ResourceExhausted:
-        return {"error": "AI service is currently overloaded. Please wait a minute before trying again."}
-    except InvalidArgument:
-        return {"error": "The newsletter content is too large for the current AI model capacity."}
+        response = model.generate_content(prompt, generation_config=generation_config, stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text or ''
+            except ValueError:
+                # Chunks without text parts (e.g. the final safety/finish metadata)
+                continue
+            text_parts.append(text)
+            for key, element in parser.feed(text):
+                if key in _STREAM_EVENT_TYPES:
+                    yield _STREAM_EVENT_TYPES[key], element
+        return _finish_reason_error(response) or _parse_analysis_text(''.join(text_parts))
     except Exception as e:
-        print(f"LLM analysis error: {e}")
-        err_str = str(e).lower()
-        if "quota" in err_str:
-            return {"error": "AI rate limit reached. Please try again in a few minutes."}
-        return {"error": "AI analysis failed."}
+        return _llm_error(e)
+
+def analyze_news_with_llm_stream(newsletters_text, user_key=None, identifiers=(), issue_sources=None):
+    """Streaming analyze_news_with_llm.
+
+    Yields ('story_group', group) and ('remaining_story', story) events while Gemini is
+    still writing, then ('result', analysis) with exactly what analyze_news_with_llm returns.
+    Per-issue and sharded briefings stream their final merge call, once the issue summaries
+    or the map step are done.
+    """
+    if not model: raise Exception("Gemini API model is not configured.")
+
+    input_tokens = _estimate_tokens(newsletters_text)
+    if input_tokens > MAX_LLM_INPUT_TOKENS:
+        yield 'result', {"error": "Too much newsletter content to process at once. Please reduce your lookback window in settings."}
+        return
+    if _uses_issue_summaries(newsletters_text):
+        issues = _summarize_issues(newsletters_text, user_key, identifiers, issue_sources)
+        if issues is not None:
+            analysis = yield from _stream_analysis(_merge_issues_prompt(issues))
+            yield 'result', analysis
+            return
+    if input_tokens <= ANALYSIS_SHARD_TOKENS:
+        analysis = yield from _stream_analysis(ANALYSIS_PROMPT_TEMPLATE + newsletters_text)
+        yield 'result', analysis
+        return
+    merged = _map_shards(newsletters_text, user_key)
+    if merged.get('error'):
+        yield 'result', merged
+        return
+    reconciled = yield from _stream_analysis(RECONCILE_PROMPT_TEMPLATE + json.dumps(merged, ensure_ascii=False))
+    yield 'result', _reconciled_analysis(merged, reconciled)
 
 # --- Caching Helpers ---
 # File-based cache is ephemeral on Render and not shared across workers; treat as best-effort.
@@ -610,70 +1306,835 @@ def save_cache(data):
     except Exception as e:
         pass
 
-def get_settings_hash(settings):
-    s = json.dumps(settings, sort_keys=True)
-    return hashlib.md5(s.encode()).hexdigest()
+def _briefing_sources(settings):
+    return settings.get('sources', []) or ["wsj.com", "nytimes.com"]
 
-def _fetch_one_message(args):
-    """Fetch a single Gmail message. Used by parallel workers. Returns (index, email_block, is_priority) or (index, None, None) on skip/error."""
-    index, message_id, creds_dict, keywords, priority_sources = args
-    try:
-        if not hasattr(_worker_thread_locals, 'auth_session'):
-            creds = get_credentials_from_session(creds_dict)
-            _worker_thread_locals.auth_session = AuthorizedSession(creds)
+def _briefing_stage_keys(settings):
+    """Cache keys for the settings-driven briefing stages, each built only from what that stage reads.
 
-        session = _worker_thread_locals.auth_session
-        url = f"https://gmail.googleapis.com/gmail/v1/users/me/messages/{message_id}?format=full"
-        resp = session.get(url, timeout=10)
-        resp.raise_for_status()
-        msg = resp.json()
-        headers = msg['payload']['headers']
-
-        # ⚡ Bolt: Optimize header extraction with a single loop and early break
-        subject, sender = 'No Subject', 'No Sender'
-        for h in headers:
-            name_lower = h['name'].lower()
-            if name_lower == 'subject':
-                subject = h['value']
-            elif name_lower == 'from':
-                sender = h['value']
-            if subject != 'No Subject' and sender != 'No Sender':
-                break
+    selection: which Gmail messages are in the window (sources, lookback hours).
+    filter:    which of those reach the prompt, and in what order (selection plus watchlist and priority sources).
+    Downstream, the analysis is keyed by the fingerprint of the filtered content and audio by
+    _audio_cache_key (analysis plus persona), so persona and other settings never invalidate them.
+    """
+    # ⚡ Bolt: Switching persona (or any setting outside these) keeps the cached analysis
+    selection = hashlib.md5(json.dumps([
+        sorted(s.lower() for s in _briefing_sources(settings)), settings.get('time_window_hours', 24)
+    ]).encode()).hexdigest()
+    filtering = hashlib.md5(json.dumps([
+        selection, sorted(k.lower() for k in settings.get('keywords', [])),
+        sorted(p.lower() for p in settings.get('priority_sources', []))
+    ]).encode()).hexdigest()
+    return {'selection': selection, 'filter': filtering}
+
+# --- Gmail HTTP Sessions ---
+# AuthorizedSessions are kept per user across requests so Gmail connections stay warm
+AUTH_SESSION_MAX_ENTRIES = int(os.environ.get("AUTH_SESSION_MAX_ENTRIES", 200))
+AUTH_SESSION_TTL_SECONDS = 600
+
+def _fingerprint(secret):
+    return hashlib.sha256((secret or '').encode()).hexdigest()[:16]
+
+class _SessionRegistry:
+    """Process-wide AuthorizedSessions, one per user, safe to share between worker threads.
+
+    Users are identified by a fingerprint of their refresh token and each entry remembers the
+    access-token fingerprint it was built for, so a new or different token never reuses an old
+    session. Sessions idle for `ttl_seconds` expire and the least recently used are evicted past
+    `max_entries`. A replaced or evicted session is only dropped from the registry, never closed:
+    a worker thread may still be fetching with it, and its sockets are freed once the last
+    reference to it goes away.
+    """
 
-        body_data = ""
-        if 'parts' in msg['payload']:
-            for part in msg['payload']['parts']:
-                if part['mimeType'] == 'text/html':
-                    body_data = part['body']['data']
-                    break
+    def __init__(self, max_entries, ttl_seconds):
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()  # user fingerprint -> (token fingerprint, session, last_used)
+        self._lock = threading.Lock()
+
+    def _lookup(self, user_fp, token_fp):
+        # Called with the lock held
+        entry = self._sessions.get(user_fp)
+        return entry[1] if entry is not None and entry[0] == token_fp else None
+
+    def _store(self, user_fp, token_fp, auth_session, now):
+        # Called with the lock held
+        self._sessions.pop(user_fp, None)
+        self._sessions[user_fp] = (token_fp, auth_session, now)
+        while self._sessions:
+            oldest_fp, (_token_fp, _oldest, last_used) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self._max_entries and now - last_used < self._ttl_seconds:
+                break
+            del self._sessions[oldest_fp]
+
+    def get(self, creds_dict):
+        user_fp = _fingerprint(creds_dict.get('refresh_token') or creds_dict.get('token'))
+        token_fp = _fingerprint(creds_dict.get('token'))
+        with self._lock:
+            auth_session = self._lookup(user_fp, token_fp)
+            if auth_session is not None:
+                self._store(user_fp, token_fp, auth_session, time.monotonic())
+                return auth_session
+        # Built without the lock so other request threads are not held up behind it
+        built = AuthorizedSession(get_credentials_from_session(creds_dict))
+        with self._lock:
+            # Another thread may have built one for the same token meanwhile; everyone shares the first
+            auth_session = self._lookup(user_fp, token_fp) or built
+            self._store(user_fp, token_fp, auth_session, time.monotonic())
+        return auth_session
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+_session_registry = _SessionRegistry(AUTH_SESSION_MAX_ENTRIES, AUTH_SESSION_TTL_SECONDS)
+
+def _get_auth_session(creds_dict):
+    """Return the shared AuthorizedSession for these session credentials."""
+    return _session_registry.get(creds_dict)
+
+# --- MIME Body Selection ---
+# A text/plain alternative this long is trusted instead of stripping the HTML version
+PLAIN_TEXT_MIN_CHARS = 500
+SENDER_PREFERENCE_MAX_ENTRIES = 5000
+# Sender address -> 'plain' or 'html', whichever part last gave usable text for that sender
+_sender_part_preferences = OrderedDict()
+_sender_part_lock = threading.Lock()
+
+def _iter_mime_leaves(payload):
+    """Yield every leaf part of a Gmail payload tree in document order, without recursion."""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            stack.extend(reversed(children))
         else:
-            body_data = msg['payload'].get('body', {}).get('data', '')
-        if not body_data:
-            return (index, None, None)
-        decoded_data = base64.urlsafe_b64decode(body_data)
-        html_str = decoded_data.decode('utf-8', errors='ignore')
-        optimized_text = optimize_newsletter_for_llm(html_str, max_chars=15000)
-        sanitized_text = sanitize_for_llm(optimized_text)
-        if keywords:
-            sanitized_text_lower = sanitized_text.lower()
-            subject_lower = subject.lower()
-            has_keyword = any(k in sanitized_text_lower or k in subject_lower for k in keywords)
-            if not has_keyword:
-                return (index, None, None)
-        email_block = f"\n\n--- Newsletter from: {sender} ---\n--- Subject: {subject} ---\n{sanitized_text}\n"
-
-        # ⚡ Bolt: optimize string operations for priority sources
-        if priority_sources:
-            sender_lower = sender.lower()
-            is_priority = any(p in sender_lower for p in priority_sources)
+            yield part
+
+def _find_body_parts(payload):
+    """Return (plain_data, html_data): the first inline text/plain and text/html bodies in the tree."""
+    plain_data = html_data = None
+    for part in _iter_mime_leaves(payload):
+        data = part.get('body', {}).get('data')
+        # Attachments carry a filename; inline bodies don't
+        if not data or part.get('filename'):
+            continue
+        mime_type = part.get('mimeType', '').lower()
+        if mime_type == 'text/plain' and plain_data is None:
+            plain_data = data
+        elif mime_type == 'text/html' and html_data is None:
+            html_data = data
+        if plain_data is not None and html_data is not None:
+            break
+    if plain_data is None and html_data is None and payload.get('body', {}).get('data'):
+        # Single-part message with a non-text type (e.g. a missing mimeType): treat it as HTML like before
+        html_data = payload['body']['data']
+    return plain_data, html_data
+
+def _sender_key(sender):
+    address = _RE_SENDER_ADDRESS.search(sender)
+    return (address.group(1) if address else sender).strip().lower()
+
+def _record_sender_preference(sender_key, part):
+    with _sender_part_lock:
+        _sender_part_preferences[sender_key] = part
+        _sender_part_preferences.move_to_end(sender_key)
+        while len(_sender_part_preferences) > SENDER_PREFERENCE_MAX_ENTRIES:
+            _sender_part_preferences.popitem(last=False)
+
+def _extract_message_text(payload, sender, max_chars=15000):
+    """Extract LLM-ready text from a message payload, or None if it has no text body.
+
+    A usable text/plain part is preferred: it needs no tag stripping and carries less
+    markup noise. HTML is the fallback when the plain part is missing or just a stub
+    ("view this email in your browser"). The winning part is remembered per sender, and
+    senders whose plain part was a stub go straight to HTML next time.
+    """
+    plain_data, html_data = _find_body_parts(payload)
+    if plain_data is None and html_data is None:
+        return None
+    key = _sender_key(sender)
+    with _sender_part_lock:
+        preferred = _sender_part_preferences.get(key)
+    if plain_data is not None and (preferred != 'html' or html_data is None):
+        # ⚡ Bolt: text/plain skips HTML tokenizing and entity decoding entirely
+        text = extract_text_from_base64(plain_data, max_chars=max_chars, plain=True)
+        if html_data is None or len(text) >= min(max_chars, PLAIN_TEXT_MIN_CHARS):
+            if html_data is not None:
+                _record_sender_preference(key, 'plain')
+            return text
+    if plain_data is not None:
+        _record_sender_preference(key, 'html')
+    # ⚡ Bolt: Decode the body in blocks and stop once enough text is extracted
+    return extract_text_from_base64(html_data, max_chars=max_chars)
+
+# --- Sender Boilerplate Model ---
+# Sentences that appeared in this many earlier issues from a sender are treated as its template
+BOILERPLATE_MIN_ISSUES = 3
+BOILERPLATE_MAX_FINGERPRINTS = 400
+BOILERPLATE_RECENT_ISSUES = 20
+BOILERPLATE_MAX_SENDERS = 2000
+BOILERPLATE_FILE = "boilerplate.json"
+# Extra text extracted before boilerplate is removed, so the per-message cap is filled with stories
+BOILERPLATE_HEADROOM = 2
+
+def _sentence_fingerprint(sentence):
+    normalized = _RE_NON_WORD.sub(' ', sentence.lower()).split()
+    if len(normalized) < 3:
+        return None
+    return hashlib.sha1(' '.join(normalized).encode()).hexdigest()[:16]
+
+def _boilerplate_key(value):
+    """Hashed sender or issue key, so the shared store holds nothing read verbatim from a mailbox."""
+    return hashlib.sha1(value.encode()).hexdigest()[:16]
+
+class _BoilerplateModels:
+    """Per-sender template models learned from the sentences that recur across a sender's issues.
+
+    Each sender's model counts, for every sentence fingerprint, how many distinct issues
+    contained it. An issue is identified by subject and day, so the same issue arriving in
+    several mailboxes is only counted once. Sender and issue keys are stored hashed. Models
+    are kept in Postgres when DATABASE_URL is set and in BOILERPLATE_FILE otherwise, and
+    written back by flush().
+    """
+
+    def __init__(self):
+        self._models = OrderedDict()
+        self._dirty = set()
+        self._file_loaded = False
+        self._lock = threading.Lock()
+        # Serializes the read-merge-replace of BOILERPLATE_FILE so concurrent flushes keep each other's models
+        self._file_lock = threading.Lock()
+
+    def _read_file(self):
+        if not os.path.exists(BOILERPLATE_FILE):
+            return {}
+        try:
+            with open(BOILERPLATE_FILE, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading boilerplate models: {e}")
+            return {}
+
+    def _load_file(self):
+        self._file_loaded = True
+        self._models.update(self._read_file())
+
+    def _load_db(self, sender_key):
+        try:
+            conn = get_db_connection()
+            try:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute("SELECT model FROM sender_boilerplate WHERE sender = %s", (sender_key,))
+                row = cur.fetchone()
+                cur.close()
+            finally:
+                release_db_connection(conn)
+            return row['model'] if row else None
+        except Exception:
+            return None
+
+    def _get_model(self, sender_key, loaded=None):
+        # Called with the lock held; `loaded` is the stored model, read beforehand without the lock
+        if not DATABASE_URL and not self._file_loaded:
+            self._load_file()
+        model = self._models.get(sender_key)
+        if model is None:
+            model = loaded or {'issues': [], 'fingerprints': {}}
+            self._models[sender_key] = model
+        self._models.move_to_end(sender_key)
+        while len(self._models) > BOILERPLATE_MAX_SENDERS:
+            evicted, _ = self._models.popitem(last=False)
+            self._dirty.discard(evicted)
+        return model
+
+    def strip(self, sender, issue_key, text):
+        """Remove the sender's known boilerplate sentences from text, then learn from this issue."""
+        sentences = _RE_SENTENCE_BREAK.split(text)
+        fingerprints = [_sentence_fingerprint(s) for s in sentences]
+        key = _boilerplate_key(_sender_key(sender))
+        issue_key = _boilerplate_key(issue_key)
+        loaded = None
+        if DATABASE_URL:
+            with self._lock:
+                cached = key in self._models
+            # The Postgres read happens outside the lock so other parser threads are not held up by it
+            if not cached:
+                loaded = self._load_db(key)
+        with self._lock:
+            model = self._get_model(key, loaded)
+            counts = model['fingerprints']
+            kept = [s for s, fp in zip(sentences, fingerprints) if fp is None or counts.get(fp, 0) < BOILERPLATE_MIN_ISSUES]
+            if issue_key not in model['issues']:
+                model['issues'] = (model['issues'] + [issue_key])[-BOILERPLATE_RECENT_ISSUES:]
+                for fp in set(filter(None, fingerprints)):
+                    counts[fp] = counts.get(fp, 0) + 1
+                if len(counts) > BOILERPLATE_MAX_FINGERPRINTS:
+                    # Keep the most frequent; among equals the newest, so fresh sponsor slots can build up counts
+                    items = list(counts.items())
+                    keep = {fp for fp, _ in sorted(reversed(items), key=lambda kv: -kv[1])[:BOILERPLATE_MAX_FINGERPRINTS]}
+                    model['fingerprints'] = {fp: n for fp, n in items if fp in keep}
+                self._dirty.add(key)
+        return ' '.join(kept)
+
+    def flush(self):
+        """Persist models that changed since the last flush; nothing is written if none did."""
+        with self._lock:
+            if not self._dirty:
+                return
+            dirty = {key: copy.deepcopy(self._models[key]) for key in self._dirty if key in self._models}
+            self._dirty.clear()
+        if DATABASE_URL:
+            try:
+                conn = get_db_connection()
+                try:
+                    cur = conn.cursor()
+                    for key, model in dirty.items():
+                        cur.execute("""
+                            INSERT INTO sender_boilerplate (sender, model) VALUES (%s, %s)
+                            ON CONFLICT (sender) DO UPDATE SET model = EXCLUDED.model;
+                        """, (key, json.dumps(model)))
+                    conn.commit()
+                    cur.close()
+                finally:
+                    release_db_connection(conn)
+            except Exception as e:
+                print(f"Error saving boilerplate models to DB: {e}")
+            return
+        # Only the changed senders are merged in, so models evicted from memory stay on disk
+        with self._file_lock:
+            stored = self._read_file()
+            stored.update(dirty)
+            tmp_path = f"{BOILERPLATE_FILE}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(stored, f)
+                # Readers and a crash mid-write only ever see the old or the new file, never a partial one
+                os.replace(tmp_path, BOILERPLATE_FILE)
+            except Exception as e:
+                print(f"Error saving boilerplate models to file: {e}")
+
+_boilerplate_models = _BoilerplateModels()
+
+def _parse_gmail_message(msg):
+    """Turn a Gmail `format=full` message into a record of {id, date, sender, subject, list_id, text}, or None if it has no body."""
+    headers = msg['payload']['headers']
+
+    # ⚡ Bolt: Optimize header extraction with a single loop and early break
+    subject, sender, list_id = 'No Subject', 'No Sender', ''
+    for h in headers:
+        name_lower = h['name'].lower()
+        if name_lower == 'subject':
+            subject = h['value']
+        elif name_lower == 'from':
+            sender = h['value']
+        elif name_lower == 'list-id':
+            list_id = h['value']
+        if subject != 'No Subject' and sender != 'No Sender' and list_id:
+            break
+
+    max_chars = 15000
+    optimized_text = _extract_message_text(msg['payload'], sender, max_chars=max_chars * BOILERPLATE_HEADROOM)
+    if optimized_text is None:
+        return None
+    date = int(msg.get('internalDate') or 0)
+    # ⚡ Bolt: Drop the sender's recurring header/footer/sponsor text before the per-message cap is applied
+    issue_key = f"{subject.strip().lower()}|{date // 86400000}"
+    optimized_text = _boilerplate_models.strip(sender, issue_key, optimized_text)[:max_chars]
+    return {
+        'id': msg.get('id'),
+        'date': date,
+        'sender': sender,
+        'subject': subject,
+        'list_id': list_id,
+        'text': sanitize_for_llm(optimized_text),
+    }
+
+# --- Watchlist Matching ---
+# Match keywords only as whole words/phrases ("ai" no longer matches "said")
+WATCHLIST_WORD_BOUNDARIES = os.environ.get("WATCHLIST_WORD_BOUNDARIES", "false").lower() == "true"
+_KEYWORD_MATCHER_CACHE_MAX_ENTRIES = 256
+
+def _trie_regex(patterns):
+    """Regex source for a trie of `patterns`, longest alternative first at every node."""
+    trie = {}
+    for pattern in patterns:
+        node = trie
+        for ch in pattern:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def emit(node):
+        alternatives = [re.escape(ch) + emit(child) for ch, child in node.items() if ch]
+        if '' in node:
+            return f"(?:{'|'.join(alternatives)})?" if alternatives else ''
+        return alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+
+    return emit(trie)
+
+class _KeywordMatcher:
+    """Finds which watchlist patterns occur in a text in a single scan.
+
+    Patterns are compiled into a trie-shaped automaton that the C regex engine runs once
+    over the text; at every start position it takes the longest pattern, and the patterns
+    contained in that one are looked up from a table built at compile time, so overlapping
+    and nested keywords are all reported. With `word_boundaries` a pattern only matches
+    between non-word characters.
+    """
+    def __init__(self, patterns, word_boundaries=False):
+        self.patterns = tuple(dict.fromkeys(p.lower() for p in patterns if p))
+        self._regex = None
+        if not self.patterns:
+            return
+        if word_boundaries:
+            self._regex = re.compile(rf"(?<!\w)(?=({_trie_regex(self.patterns)})(?!\w))")
+            bounded = {p: re.compile(rf"(?<!\w){re.escape(p)}(?!\w)") for p in self.patterns}
+            self._contained = {p: [q for q in self.patterns if bounded[q].search(p)] for p in self.patterns}
         else:
-            is_priority = False
+            self._regex = re.compile(f"(?=({_trie_regex(self.patterns)}))")
+            self._contained = {p: [q for q in self.patterns if q in p] for p in self.patterns}
+
+    def find(self, *texts):
+        """Set of patterns found in any of `texts`."""
+        if self._regex is None:
+            return set()
+        found = set()
+        for longest in set(self._regex.findall('\n'.join(texts).lower())):
+            found.update(self._contained[longest])
+        return found
+
+    def matches_any(self, *texts):
+        """True as soon as any pattern is found, without scanning the rest of the text."""
+        if self._regex is None:
+            return False
+        return self._regex.search('\n'.join(texts).lower()) is not None
+
+_keyword_matchers = OrderedDict()
+_keyword_matchers_lock = threading.Lock()
+
+def _get_keyword_matcher(patterns, word_boundaries=False):
+    """Compiled matcher for a watchlist, built once per distinct settings and reused across briefings."""
+    key = (tuple(patterns), word_boundaries)
+    with _keyword_matchers_lock:
+        matcher = _keyword_matchers.get(key)
+        if matcher is not None:
+            _keyword_matchers.move_to_end(key)
+            return matcher
+    matcher = _KeywordMatcher(patterns, word_boundaries)
+    with _keyword_matchers_lock:
+        _keyword_matchers[key] = matcher
+        while len(_keyword_matchers) > _KEYWORD_MATCHER_CACHE_MAX_ENTRIES:
+            _keyword_matchers.popitem(last=False)
+    return matcher
+
+def _format_email_block(sender, subject, text):
+    return f"\n\n--- Newsletter from: {sender} ---\n--- Subject: {subject} ---\n{text}\n"
+
+def _build_email_block(record, keyword_matcher, priority_matcher):
+    """Apply the watchlist to a message record. Returns (email_block, is_priority) or (None, None) on skip."""
+    if not record:
+        return (None, None)
+    sender, subject, sanitized_text = record['sender'], record['subject'], record['text']
+    # ⚡ Bolt: One pass of the compiled watchlist over subject and body instead of a scan per keyword
+    if keyword_matcher.patterns and not keyword_matcher.matches_any(subject, sanitized_text):
+        return (None, None)
+    email_block = _format_email_block(sender, subject, sanitized_text)
+    return (email_block, priority_matcher.matches_any(sender))
+
+def _parse_gmail_metadata(msg):
+    """Turn a Gmail `format=metadata` message into {id, date, sender, subject, list_id, size}."""
+    headers = {h['name'].lower(): h['value'] for h in msg.get('payload', {}).get('headers', [])}
+    return {
+        'id': msg.get('id'),
+        'date': int(msg.get('internalDate') or 0),
+        'sender': headers.get('from', 'No Sender'),
+        'subject': headers.get('subject', 'No Subject'),
+        'list_id': headers.get('list-id', ''),
+        'size': int(msg.get('sizeEstimate') or 0),
+    }
 
-        return (index, email_block, is_priority)
+_GMAIL_FULL_PARAMS = 'format=full'
+_GMAIL_METADATA_PARAMS = 'format=metadata&metadataHeaders=Subject&metadataHeaders=From&metadataHeaders=List-Id'
+
+def _fetch_one_message(args, params=_GMAIL_FULL_PARAMS, parse=_parse_gmail_message):
+    """Fetch a single Gmail message. Used by parallel workers. Returns (index, record) or (index, None) on skip/error."""
+    index, message_id, creds_dict = args
+    try:
+        session = _get_auth_session(creds_dict)
+        url = f"{GMAIL_API_BASE}/gmail/v1/users/me/messages/{message_id}?{params}"
+        resp = session.get(url, timeout=10)
+        resp.raise_for_status()
+        return (index, parse(resp.json()))
     except Exception as e:
         print(f"fetch_emails: failed to fetch message {message_id}: {e}")
-        return (index, None, None)
+        return (index, None)
+
+_RE_MULTIPART_BOUNDARY = re.compile(r'boundary="?([^";]+)"?', flags=re.IGNORECASE)
+_RE_BATCH_CONTENT_ID = re.compile(rb'Content-ID:\s*<response-item(\d+)>', flags=re.IGNORECASE)
+_RE_HEADER_BREAK = re.compile(rb'\r?\n\r?\n')
+
+def _iter_multipart_parts(chunks, boundary):
+    """Yield each part of a multipart byte stream as soon as its closing delimiter has arrived."""
+    delimiter = b'--' + boundary.encode('ascii')
+    buffer = bytearray()
+    search_from = 0
+    seen_first = False
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        while True:
+            pos = buffer.find(delimiter, search_from)
+            if pos == -1:
+                # Keep scanning from just before the tail in case the delimiter straddles two chunks
+                search_from = max(0, len(buffer) - len(delimiter))
+                break
+            part = bytes(buffer[:pos])
+            del buffer[:pos + len(delimiter)]
+            search_from = 0
+            if seen_first:
+                yield part.strip(b'\r\n')
+            seen_first = True
+            if buffer[:2] == b'--':
+                return
+
+def _parse_batch_part(part):
+    """Split one batch response part into (offset, status_code, json_body). Offset is None if the part has no Content-ID."""
+    outer = _RE_HEADER_BREAK.split(part, maxsplit=1)
+    match = _RE_BATCH_CONTENT_ID.search(outer[0])
+    offset = int(match.group(1)) if match else None
+    if len(outer) < 2:
+        return (offset, 0, None)
+    inner = _RE_HEADER_BREAK.split(outer[1], maxsplit=1)
+    status_line = inner[0].split(b'\r\n', 1)[0].split(b'\n', 1)[0]
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError):
+        status = 0
+    body = inner[1].strip() if len(inner) > 1 else b''
+    return (offset, status, json.loads(body) if body else None)
+
+def _iter_gmail_batch(auth_session, message_ids, params='format=full'):
+    """Fetch up to GMAIL_BATCH_SIZE messages in one multipart batch call. Yields (offset, status_code, message) as parts stream in."""
+    boundary = f"batch_{uuid.uuid4().hex}"
+    body_parts = []
+    for offset, message_id in enumerate(message_ids[:GMAIL_BATCH_SIZE]):
+        body_parts.append(
+            f"--{boundary}\r\n"
+            f"Content-Type: application/http\r\n"
+            f"Content-ID: <item{offset}>\r\n\r\n"
+            f"GET /gmail/v1/users/me/messages/{message_id}?{params}\r\n\r\n"
+        )
+    body_parts.append(f"--{boundary}--\r\n")
+    resp = auth_session.post(
+        GMAIL_BATCH_URL,
+        data="".join(body_parts).encode('utf-8'),
+        headers={'Content-Type': f'multipart/mixed; boundary={boundary}'},
+        stream=True,
+        timeout=30,
+    )
+    try:
+        resp.raise_for_status()
+        match = _RE_MULTIPART_BOUNDARY.search(resp.headers.get('Content-Type', ''))
+        if not match:
+            raise ValueError("Batch response is missing a multipart boundary.")
+        for part in _iter_multipart_parts(resp.iter_content(chunk_size=64 * 1024), match.group(1)):
+            yield _parse_batch_part(part)
+    finally:
+        resp.close()
+
+def _fetch_message_batch(args, params=_GMAIL_FULL_PARAMS, parse=_parse_gmail_message):
+    """Fetch a chunk of Gmail messages with one batch request. Used by parallel workers. Returns a list of (index, record)."""
+    indexes, message_ids, creds_dict = args
+    results = {}
+    try:
+        session = _get_auth_session(creds_dict)
+        for offset, status, msg in _iter_gmail_batch(session, message_ids, params=params):
+            if offset is None or offset >= len(message_ids):
+                continue
+            index = indexes[offset]
+            if status != 200 or not msg:
+                # Rate-limited or failed parts are left for the per-message fallback below
+                continue
+            try:
+                record = parse(msg)
+            except Exception as e:
+                print(f"fetch_emails: failed to parse message {message_ids[offset]}: {e}")
+                record = None
+            results[index] = (index, record)
+    except Exception as e:
+        print(f"fetch_emails: batch request failed, falling back to single fetches: {e}")
+
+    for index, message_id in zip(indexes, message_ids):
+        if index not in results:
+            results[index] = _fetch_one_message((index, message_id, creds_dict), params=params, parse=parse)
+    return [results[index] for index in sorted(results)]
+
+def _fetch_metadata_batch(args):
+    """Metadata-only variant of _fetch_message_batch. Returns a list of (index, metadata)."""
+    return _fetch_message_batch(args, params=_GMAIL_METADATA_PARAMS, parse=_parse_gmail_metadata)
+
+
+# --- Async Gmail Engine ---
+# "async" fetch mode: one long-lived event loop thread and one shared httpx client, so every user's
+# message fetches multiplex over a small, bounded pool of HTTP/2 connections instead of per-request threads.
+GMAIL_ASYNC_MAX_CONNECTIONS = int(os.environ.get("GMAIL_ASYNC_MAX_CONNECTIONS", 10))
+GMAIL_ASYNC_MAX_REQUESTS = int(os.environ.get("GMAIL_ASYNC_MAX_REQUESTS", 64))
+# Threads that decode and extract fetched messages so CPU work never runs on the event loop
+GMAIL_ASYNC_PARSE_WORKERS = int(os.environ.get("GMAIL_ASYNC_PARSE_WORKERS", 4))
+GMAIL_ASYNC_CHUNK_SIZE = 25
+
+class _AsyncGmailEngine:
+    """Runs Gmail fetch coroutines on a dedicated event loop with a shared, bounded HTTP/2 connection pool."""
+
+    def __init__(self, max_connections, max_requests, parse_workers=GMAIL_ASYNC_PARSE_WORKERS):
+        self._max_connections = max_connections
+        self._max_requests = max_requests
+        self._parse_pool = ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix="gmail-parse")
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="gmail-async-engine", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self.client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=self._max_connections, max_keepalive_connections=self._max_connections),
+            timeout=10,
+        )
+        # Caps concurrent requests across all users; HTTP/2 multiplexes them over the pooled connections
+        self.semaphore = asyncio.Semaphore(self._max_requests)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def submit(self, coro_fn, args):
+        """Schedule coro_fn(args) on the engine loop. Returns a concurrent.futures.Future, like an executor."""
+        return asyncio.run_coroutine_threadsafe(coro_fn(args), self._loop)
+
+    async def get_content(self, url, access_token):
+        async with self.semaphore:
+            resp = await self.client.get(url, headers={'Authorization': f'Bearer {access_token}'})
+        resp.raise_for_status()
+        return resp.content
+
+    async def run_blocking(self, fn, *args):
+        """Run CPU-bound fn(*args) on the parse threads so one large message does not stall every other fetch."""
+        return await self._loop.run_in_executor(self._parse_pool, fn, *args)
 
+_async_engine = None
+_async_engine_lock = threading.Lock()
+
+def _get_async_engine():
+    """Return the process-wide async engine, starting it on first use (after gunicorn has forked)."""
+    global _async_engine
+    with _async_engine_lock:
+        if _async_engine is None:
+            _async_engine = _AsyncGmailEngine(GMAIL_ASYNC_MAX_CONNECTIONS, GMAIL_ASYNC_MAX_REQUESTS)
+    return _async_engine
+
+def _get_access_token(creds_dict, force_refresh=False):
+    """Return a valid OAuth access token for raw HTTP clients, refreshing it if needed.
+
+    Credentials without a known expiry (sessions from before it was stored, stored schedules) are
+    refreshed, as is a token Gmail rejected (`force_refresh`). A refreshed token and its expiry are
+    written back into creds_dict, so the caller can keep them and the next call skips the refresh.
+    """
+    creds = get_credentials_from_session(creds_dict)
+    if force_refresh or not creds.valid or creds.expiry is None:
+        creds.refresh(Request())
+        creds_dict['token'] = creds.token
+        creds_dict['expiry'] = creds.expiry.isoformat() if creds.expiry else None
+    return creds.token
+
+class _AccessToken:
+    """The access token a briefing's async fetches share; refreshed once if Gmail rejects it mid-briefing."""
+
+    def __init__(self, creds_dict):
+        self._creds_dict = creds_dict
+        self._lock = threading.Lock()
+        self.value = _get_access_token(creds_dict)
+
+    def refresh(self, rejected):
+        """Return a fresh token after `rejected` got a 401; concurrent callers share a single refresh."""
+        with self._lock:
+            if self.value == rejected:
+                self.value = _get_access_token(self._creds_dict, force_refresh=True)
+            return self.value
+
+async def _fetch_messages_async(args, params=_GMAIL_FULL_PARAMS, parse=_parse_gmail_message):
+    """Async counterpart of _fetch_message_batch. Fetches a chunk concurrently and returns a list of (index, record).
+
+    The worker context is the briefing's _AccessToken.
+    """
+    indexes, message_ids, access_token = args
+    engine = _get_async_engine()
+
+    def decode(content):
+        return parse(json.loads(content))
+
+    async def get_content(url):
+        token = access_token.value
+        try:
+            return await engine.get_content(url, token)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 401:
+                raise
+        # The token expired or was revoked mid-briefing; refresh it once (off the loop) and retry
+        return await engine.get_content(url, await engine.run_blocking(access_token.refresh, token))
+
+    async def fetch_one(index, message_id):
+        url = f"{GMAIL_API_BASE}/gmail/v1/users/me/messages/{message_id}?{params}"
+        try:
+            # ⚡ Bolt: Base64 decoding, HTML extraction and MinHashing run off the event loop
+            return (index, await engine.run_blocking(decode, await get_content(url)))
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 401:
+                # Still rejected after a refresh; surface it as a session error instead of an empty briefing
+                raise
+            print(f"fetch_emails: failed to fetch message {message_id}: {e}")
+            return (index, None)
+        except Exception as e:
+            print(f"fetch_emails: failed to fetch message {message_id}: {e}")
+            return (index, None)
+
+    return list(await asyncio.gather(*(fetch_one(i, m) for i, m in zip(indexes, message_ids))))
+
+async def _fetch_metadata_async(args):
+    """Metadata-only variant of _fetch_messages_async."""
+    return await _fetch_messages_async(args, params=_GMAIL_METADATA_PARAMS, parse=_parse_gmail_metadata)
+
+
+# --- Shared Worker Pool ---
+# One long-lived pool serves Gmail fetches and TTS synthesis for every request, so the process-wide
+# thread count stays bounded and a user with a large mailbox cannot starve everyone else.
+WORKER_POOL_SIZE = int(os.environ.get("WORKER_POOL_SIZE", 16))
+# Deficit round robin credit each user earns per turn; task costs default to 1
+WORKER_POOL_QUANTUM = 1
+_WAIT_SAMPLE_SIZE = 1000
+
+class _FairExecutor:
+    """Bounded thread pool with per-user FIFO queues served by deficit round robin.
+
+    Threads are started lazily up to `max_workers`. Each idle worker takes the next task from
+    the user at the head of the ring; users that have spent their credit rotate to the back.
+    """
+
+    def __init__(self, max_workers, quantum=WORKER_POOL_QUANTUM):
+        self._max_workers = max_workers
+        self._quantum = quantum
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # user_key -> deque of (future, fn, args, cost, enqueued_at)
+        self._deficits = {}
+        self._threads = []
+        self._idle = 0
+        self._active = 0
+        self._completed = 0
+        self._wait_ms = deque(maxlen=_WAIT_SAMPLE_SIZE)
+
+    def submit(self, user_key, fn, *args, cost=1):
+        future = Future()
+        with self._cond:
+            if user_key not in self._queues:
+                self._queues[user_key] = deque()
+                self._deficits[user_key] = 0
+            self._queues[user_key].append((future, fn, args, cost, time.monotonic()))
+            if self._idle == 0 and len(self._threads) < self._max_workers:
+                thread = threading.Thread(target=self._work, name=f"worker-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+        return future
+
+    def for_user(self, user_key):
+        """Executor-like view that queues everything it is given under `user_key`."""
+        return _UserExecutor(self, user_key)
+
+    def _next_task(self):
+        # Called with the lock held and at least one queue non-empty
+        while True:
+            user_key, queue = next(iter(self._queues.items()))
+            cost = queue[0][3]
+            if self._deficits[user_key] >= cost:
+                self._deficits[user_key] -= cost
+                task = queue.popleft()
+                if not queue:
+                    # Users with nothing queued don't bank credit
+                    del self._queues[user_key]
+                    del self._deficits[user_key]
+                return task
+            self._deficits[user_key] += self._quantum
+            self._queues.move_to_end(user_key)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._idle += 1
+                while not self._queues:
+                    self._cond.wait()
+                self._idle -= 1
+                future, fn, args, _cost, enqueued_at = self._next_task()
+                self._active += 1
+                self._wait_ms.append((time.monotonic() - enqueued_at) * 1000)
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._cond:
+                self._active -= 1
+                self._completed += 1
+
+    def stats(self):
+        """Queue depth and recent queue wait times (ms) across all users."""
+        with self._cond:
+            waits = sorted(self._wait_ms)
+            depths = [len(q) for q in self._queues.values()]
+            stats = {
+                'threads': len(self._threads),
+                'max_workers': self._max_workers,
+                'active': self._active,
+                'queued': sum(depths),
+                'queued_users': len(depths),
+                'max_user_queue': max(depths, default=0),
+                'completed': self._completed,
+            }
+        if waits:
+            stats['wait_ms_p50'] = round(waits[len(waits) // 2], 1)
+            stats['wait_ms_p95'] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 1)
+            stats['wait_ms_max'] = round(waits[-1], 1)
+        return stats
+
+class _UserExecutor:
+    """A user's handle on the shared pool, usable wherever an executor is expected."""
+
+    def __init__(self, pool, user_key):
+        self._pool = pool
+        self._user_key = user_key
+
+    def submit(self, fn, *args, cost=1):
+        return self._pool.submit(self._user_key, fn, *args, cost=cost)
+
+    def map(self, fn, iterable):
+        futures = [self.submit(fn, item) for item in iterable]
+        return (future.result() for future in futures)
+
+_worker_pool = _FairExecutor(WORKER_POOL_SIZE)
+# Gemini fan-out (analysis shards, issue summaries) runs on its own small pool sized to the API quota, so one large
+# briefing neither occupies the threads other users' Gmail fetches and TTS need nor bursts the quota
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", 4))
+_llm_pool = _FairExecutor(LLM_POOL_SIZE)
+
+def _log_worker_pool_stats(label):
+    stats = _worker_pool.stats()
+    print(f" * [{label}] Worker pool: {stats['active']}/{stats['max_workers']} busy, {stats['queued']} queued "
+          f"across {stats['queued_users']} users, wait p95 {stats.get('wait_ms_p95', 0)}ms")
 
 def _chunk_script_text(script_text, byte_limit=4800):
     """Splits script text into chunks that stay under the byte limit."""
@@ -697,15 +2158,16 @@ def _chunk_script_text(script_text, byte_limit=4800):
         chunks.append("".join(current_chunk_parts))
     return chunks
 
-def _synthesize_audio_from_chunks(chunks, creds_dict, style, project_id):
-    """Synthesizes audio from chunks in parallel and concatenates the results."""
+def _synthesize_audio_from_chunks(chunks, creds_dict, style, project_id, user_key=None):
+    """Synthesizes audio from chunks in parallel on the shared worker pool and concatenates the results."""
     worker_args = [(i, chunk_text, creds_dict, style, project_id) for i, chunk_text in enumerate(chunks)]
     t_start = time.time()
-    with ThreadPoolExecutor(max_workers=min(len(chunks), 8)) as executor:
-        results = list(executor.map(_synthesize_one_chunk, worker_args))
+    # ⚡ Bolt: TTS chunks share the bounded process-wide pool with Gmail fetches
+    results = list(_worker_pool.for_user(user_key).map(_synthesize_one_chunk, worker_args))
     all_audio_content = b"".join(audio for _idx, audio in results)
     tts_duration_ms = int((time.time() - t_start) * 1000)
     print(f" * [TTS] Synthesized {len(chunks)} chunks in {tts_duration_ms}ms. Total size: {len(all_audio_content)} bytes")
+    _log_worker_pool_stats("TTS")
     return all_audio_content, tts_duration_ms
 
 def _synthesize_one_chunk(args):
@@ -715,10 +2177,13 @@ def _synthesize_one_chunk(args):
     if len(chunk_text.encode('utf-8')) > byte_limit:
         chunk_text = chunk_text.encode('utf-8')[:byte_limit].decode('utf-8', 'ignore')
 
-    if not hasattr(_worker_thread_locals, 'tts_client'):
+    # Pool threads are shared between users, so only reuse the client for the same credentials
+    client_key = (creds_dict.get('token'), project_id)
+    if getattr(_worker_thread_locals, 'tts_client_key', None) != client_key or not hasattr(_worker_thread_locals, 'tts_client'):
         creds = get_credentials_from_session(creds_dict)
         client_opts = client_options.ClientOptions(quota_project_id=project_id) if project_id else None
         _worker_thread_locals.tts_client = texttospeech.TextToSpeechClient(credentials=creds, client_options=client_opts, transport="rest")
+        _worker_thread_locals.tts_client_key = client_key
     tts_client = _worker_thread_locals.tts_client
     persona_config = PERSONAS.get(style, PERSONAS['anchor'])
     voice = texttospeech.VoiceSelectionParams(language_code="en-US", name=persona_config['voice_name'], ssml_gender=persona_config['gender'])
@@ -734,6 +2199,67 @@ def _synthesize_one_chunk(args):
     )
     return (index, response.audio_content)
 
+# --- Single-Flight Coalescing ---
+# ⚡ Bolt: A double-click, a second tab or a frontend retry attaches to the briefing (or audio) already being
+# generated for the same key instead of running its own Gmail search, Gemini call or TTS synthesis.
+SINGLE_FLIGHT_TIMEOUT_SECONDS = int(os.environ.get("SINGLE_FLIGHT_TIMEOUT_SECONDS", 300))
+
+class _SingleFlight:
+    """Registry of in-flight work: the first caller for a key runs it, concurrent callers wait for its result."""
+
+    def __init__(self, timeout_seconds=SINGLE_FLIGHT_TIMEOUT_SECONDS):
+        self._timeout_seconds = timeout_seconds
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Returns (future, leader). The leader must settle the future with finish()."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._flights.get(key)
+            # A leader that never finished (e.g. a stream dropped before it started) is treated as abandoned
+            if entry is not None and entry[0] + self._timeout_seconds > now:
+                return entry[1], False
+            future = Future()
+            self._flights[key] = (now, future)
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        with self._lock:
+            entry = self._flights.get(key)
+            if entry is not None and entry[1] is future:
+                del self._flights[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def wait(self, future):
+        """The leader's result (or its exception re-raised); None if it did not finish in time."""
+        try:
+            return future.result(timeout=self._timeout_seconds)
+        except FutureTimeoutError:
+            return None
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers with the same key and return its result to each of them."""
+        future, leader = self.begin(key)
+        if not leader:
+            print(" * [SingleFlight] Attached to in-flight request")
+            result = self.wait(future)
+            return result if result is not None else fn()
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result
+
+# Briefings are keyed by (user cache key, settings hash); audio by _audio_cache_key, so identical briefings share one synthesis
+_briefing_flights = _SingleFlight()
+_audio_flights = _SingleFlight()
+
 # --- Routes ---
 
 @app.route('/')
@@ -879,7 +2405,8 @@ def oauth2callback():
         flow.fetch_token(authorization_response=request.url)
         credentials = flow.credentials
 
-        session['credentials'] = {'token': credentials.token, 'refresh_token': credentials.refresh_token, 'token_uri': credentials.token_uri, 'client_id': credentials.client_id, 'scopes': credentials.scopes}
+        session['credentials'] = {'token': credentials.token, 'refresh_token': credentials.refresh_token, 'token_uri': credentials.token_uri, 'client_id': credentials.client_id, 'scopes': credentials.scopes,
+                                  'expiry': credentials.expiry.isoformat() if credentials.expiry else None}
         return redirect("/")
     except Exception as e:
         import traceback
@@ -922,7 +2449,7 @@ def update_settings():
 
     # 🛡️ Sentinel: Prevent mass assignment by plucking only allowed keys
     # and validate types to prevent persistent DoS crashes downstream
-    allowed_keys = ['sources', 'time_window_hours', 'personality', 'priority_sources', 'keywords']
+    allowed_keys = ['sources', 'time_window_hours', 'personality', 'priority_sources', 'keywords', 'pregenerate_briefing']
     sanitized_settings = {}
     for key in allowed_keys:
         if key in new_settings:
@@ -934,6 +2461,8 @@ def update_settings():
                 return jsonify({'error': f"Invalid type for {key}. Expected a number."}), 400
             if key == 'personality' and not isinstance(val, str):
                 return jsonify({'error': f"Invalid type for {key}. Expected a string."}), 400
+            if key == 'pregenerate_briefing' and not isinstance(val, bool):
+                return jsonify({'error': f"Invalid type for {key}. Expected a boolean."}), 400
             sanitized_settings[key] = val
 
     # 🛡️ Sentinel: Add type and length validation to prevent DoS and injection
@@ -961,62 +2490,919 @@ def update_settings():
     user_info = get_user_info()
     email = user_info.get('email') if user_info else None
     if save_settings(sanitized_settings, email):
+        if email and 'pregenerate_briefing' in sanitized_settings:
+            _set_pregeneration(email, sanitized_settings['pregenerate_briefing'], session.get('credentials'))
         return jsonify({'status': 'success'})
     return jsonify({'error': 'Unable to save settings. Please try again or contact support if the issue persists.'}), 500
 
-def _check_cached_analysis(cache_key, current_hash):
-    """Check if we have a valid cached analysis."""
+def _check_cached_analysis(cache_key, current_hash, message_set, any_message_set=False):
+    """Cached analysis for these settings if it was made from the same Gmail message set.
+
+    The age limit (CACHE_TTL_SECONDS, extended to a pre-generated entry's expires_at) is only an upper bound.
+    any_message_set skips the message set check, for when Gmail could not be listed.
+    """
     with _cache_lock:
         cache = load_cache()
         user_cache = cache.get(cache_key, {})
-        if (user_cache.get('timestamp', 0) + CACHE_TTL_SECONDS > time.time()) and (user_cache.get('settings_hash') == current_hash) and (user_cache.get('analysis')):
+        # Pre-generated briefings may be kept past the TTL until the usual open time (see Scheduled Pre-Generation)
+        expires_at = max(user_cache.get('expires_at') or 0, user_cache.get('timestamp', 0) + CACHE_TTL_SECONDS)
+        if (expires_at > time.time()) and (user_cache.get('settings_hash') == current_hash) and (user_cache.get('analysis')) \
+                and (any_message_set or (message_set and user_cache.get('message_set') == message_set)):
             return user_cache['analysis']
     return None
 
-def _update_cached_analysis(cache_key, current_hash, analysis_result):
-    """Update the cache with a new analysis result."""
+def _check_cached_analysis_for_content(cache_key, fingerprint):
+    """The user's cached analysis if it was made from exactly this newsletter content."""
+    with _cache_lock:
+        user_cache = load_cache().get(cache_key, {})
+        if fingerprint and user_cache.get('content_fingerprint') == fingerprint and user_cache.get('analysis'):
+            return user_cache['analysis']
+    return None
+
+def _update_cached_analysis(cache_key, current_hash, analysis_result, fingerprint=None, message_set=None):
+    """Update the cache with a new analysis result.
+
+    current_hash is the filter stage key; fingerprint identifies the content the analysis was made from
+    and message_set the Gmail messages it was fetched from (see _message_set_fingerprint).
+    """
     with _cache_lock:
         cache = load_cache()
         user_cache = cache.get(cache_key, {})
+        # Audio is keyed by the analysis it reads, so it only goes stale when the analysis changes
+        if user_cache.get('analysis') != analysis_result:
+            user_cache.pop('audio', None)
+            user_cache.pop('audio_key', None)
+        user_cache.pop('expires_at', None)
         user_cache['timestamp'] = time.time()
         user_cache['settings_hash'] = current_hash
         user_cache['analysis'] = analysis_result
-        if 'audio' in user_cache:
-            del user_cache['audio']
-        if 'script_hash' in user_cache:
-            del user_cache['script_hash']
+        user_cache['content_fingerprint'] = fingerprint
+        user_cache['message_set'] = message_set
+        cache[cache_key] = user_cache
+        save_cache(cache)
+
+def _extend_cached_analysis(cache_key, current_hash, expires_at):
+    """Keep the cached analysis valid until expires_at, if it is still the one for these settings."""
+    with _cache_lock:
+        cache = load_cache()
+        user_cache = cache.get(cache_key, {})
+        if user_cache.get('settings_hash') != current_hash or not user_cache.get('analysis'):
+            return False
+        user_cache['expires_at'] = expires_at
+        cache[cache_key] = user_cache
+        save_cache(cache)
+    return True
+
+def _audio_cache_key(analysis_data, style):
+    """Audio is keyed by the briefing it reads (greeting included) and the persona.
+
+    Scripts pick intros and transitions at random, so hashing the script itself would never
+    match a synthesis done for another request.
+    """
+    return hashlib.md5((json.dumps(analysis_data, sort_keys=True) + style).encode()).hexdigest()
+
+def _update_cached_audio(cache_key, audio_key, audio_base64):
+    with _cache_lock:
+        cache = load_cache()
+        user_cache = cache.get(cache_key, {})
+        user_cache['audio_key'] = audio_key
+        user_cache['audio'] = audio_base64
         cache[cache_key] = user_cache
         save_cache(cache)
 
-def _search_gmail_messages(creds, sources, hours):
-    """Search Gmail for recent newsletters from specified sources."""
+# --- Shared Analysis Cache ---
+# ⚡ Bolt: Users who get the same editions share one analysis instead of paying for another Gemini call.
+# Entries are keyed only by a hash of the newsletter blocks that went into the prompt and hold only the
+# analysis JSON; analyses that mention the requesting user are never shared.
+SHARED_ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("SHARED_ANALYSIS_CACHE_MAX_ENTRIES", 500))
+SHARED_ANALYSIS_CACHE_TTL_SECONDS = int(os.environ.get("SHARED_ANALYSIS_CACHE_TTL_SECONDS", 6 * 3600))
+
+def _content_fingerprint(newsletters_text):
+    """Order-independent hash of the newsletter blocks in a briefing prompt."""
+    block_hashes = sorted(hashlib.sha256(block.encode('utf-8')).hexdigest()
+                          for block in _split_newsletter_blocks(newsletters_text) if block.strip())
+    return hashlib.sha256('\n'.join(block_hashes).encode('utf-8')).hexdigest()
+
+def _mentions_user(analysis_json, identifiers):
+    """True if a serialized analysis contains any of the user's identifiers (email, its local part, name)."""
+    lowered = analysis_json.lower()
+    return any(len(i) >= 4 and i.lower() in lowered for i in identifiers if i)
+
+class _SharedAnalysisCache:
+    """Process-wide LRU of analyses keyed by content fingerprint, with a TTL per entry."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                return None
+            stored_at, analysis_json = entry
+            if stored_at + self._ttl_seconds <= time.time():
+                del self._entries[fingerprint]
+                return None
+            self._entries.move_to_end(fingerprint)
+        # Stored serialized so callers can never mutate a shared entry
+        return json.loads(analysis_json)
+
+    def put(self, fingerprint, analysis, identifiers=()):
+        analysis_json = json.dumps(analysis)
+        if _mentions_user(analysis_json, identifiers):
+            return False
+        with self._lock:
+            self._entries[fingerprint] = (time.time(), analysis_json)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_shared_analysis_cache = _SharedAnalysisCache(SHARED_ANALYSIS_CACHE_MAX_ENTRIES, SHARED_ANALYSIS_CACHE_TTL_SECONDS)
+# Story candidates per newsletter issue (see Per-Issue Summaries); issues are re-sent daily, so keep them a day
+ISSUE_SUMMARY_CACHE_MAX_ENTRIES = int(os.environ.get("ISSUE_SUMMARY_CACHE_MAX_ENTRIES", 5000))
+_issue_summary_cache = _SharedAnalysisCache(ISSUE_SUMMARY_CACHE_MAX_ENTRIES, 24 * 3600)
+
+# --- Processed Message Cache ---
+# ⚡ Bolt: Processed newsletter records (optimized text, subject, sender) are cached by Gmail message id so a
+# refresh or a watchlist change only downloads messages we have not seen yet. Entries are namespaced by the
+# anonymized user so one mailbox's records are never served to another.
+MESSAGE_CACHE_MAX_ENTRIES = int(os.environ.get("MESSAGE_CACHE_MAX_ENTRIES", 2000))
+# Optional SQLite file that keeps processed records across restarts
+MESSAGE_CACHE_PATH = os.environ.get("MESSAGE_CACHE_PATH")
+
+class _SqliteRecordStore:
+    """Persistent tier for the message cache: one SQLite table trimmed to max_entries by last use."""
+
+    def __init__(self, path, max_entries):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS message_records (key TEXT PRIMARY KEY, record TEXT, used_at REAL)"
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM message_records WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE message_records SET used_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, record):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO message_records (key, record, used_at) VALUES (?, ?, ?)",
+                (key, json.dumps(record), time.time()),
+            )
+            self._puts += 1
+            # Trim in batches rather than on every insert
+            if self._puts % 100 == 0:
+                self._conn.execute(
+                    "DELETE FROM message_records WHERE key NOT IN "
+                    "(SELECT key FROM message_records ORDER BY used_at DESC LIMIT ?)",
+                    (self._max_entries,),
+                )
+            self._conn.commit()
+
+class _MessageRecordCache:
+    """Process-wide LRU of processed message records, with an optional persistent tier behind it."""
+
+    def __init__(self, max_entries, disk=None):
+        self._max_entries = max_entries
+        self._disk = disk
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, record):
+        with self._lock:
+            self._entries[key] = record
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            record = self._entries.get(key)
+            if record is not None:
+                self._entries.move_to_end(key)
+                return record
+        if self._disk is not None:
+            try:
+                record = self._disk.get(key)
+            except Exception as e:
+                print(f"message cache: disk read failed: {e}")
+                record = None
+            if record is not None:
+                self._remember(key, record)
+            return record
+        return None
+
+    def put(self, key, record):
+        self._remember(key, record)
+        if self._disk is not None:
+            try:
+                self._disk.put(key, record)
+            except Exception as e:
+                print(f"message cache: disk write failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def for_user(self, user_key):
+        return _UserRecordView(self, anonymize_user(user_key))
+
+class _UserRecordView:
+    """One mailbox's slice of the shared message cache. Used as the record_store of _process_email_messages."""
+
+    def __init__(self, cache, namespace):
+        self._cache = cache
+        self._namespace = namespace
+
+    def get(self, message_id, default=None):
+        record = self._cache.get(f"{self._namespace}:{message_id}")
+        return default if record is None else record
+
+    def __setitem__(self, message_id, record):
+        self._cache.put(f"{self._namespace}:{message_id}", record)
+
+_message_cache = _MessageRecordCache(
+    MESSAGE_CACHE_MAX_ENTRIES,
+    _SqliteRecordStore(MESSAGE_CACHE_PATH, MESSAGE_CACHE_MAX_ENTRIES * 5) if MESSAGE_CACHE_PATH else None,
+)
+
+def _gmail_query(sources, hours):
     sources_query = " OR ".join([f"from:{s}" for s in sources])
-    query = f"({sources_query}) newer_than:{hours}h"
-    auth_session = AuthorizedSession(creds)
-    url = f"https://gmail.googleapis.com/gmail/v1/users/me/messages"
-    resp = auth_session.get(url, params={'q': query, 'maxResults': 100}, timeout=10)
+    return f"({sources_query}) newer_than:{hours}h"
+
+def _search_gmail_messages(creds_dict, sources, hours):
+    """Search Gmail for recent newsletters from specified sources. Yields message stubs, loading result pages lazily."""
+    auth_session = _get_auth_session(creds_dict)
+    url = f"{GMAIL_API_BASE}/gmail/v1/users/me/messages"
+    params = {'q': _gmail_query(sources, hours), 'maxResults': GMAIL_SEARCH_PAGE_SIZE}
+    yielded = 0
+    while True:
+        resp = auth_session.get(url, params=params, timeout=10)
+        resp.raise_for_status()
+        results = resp.json()
+        for message in results.get('messages', []):
+            if yielded >= GMAIL_MAX_MESSAGES:
+                return
+            yielded += 1
+            yield message
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return
+        params['pageToken'] = page_token
+
+def _message_set_fingerprint(message_ids):
+    """Hash of the ids of the messages in a briefing window, independent of listing order."""
+    return hashlib.sha256(','.join(sorted(message_ids)).encode()).hexdigest()
+
+# --- Incremental Gmail Sync ---
+# Per-user sync state: the last Gmail historyId plus the ids and dates of the messages in the current window.
+# The processed text itself lives in _message_cache. In-memory and best-effort like the file cache;
+# a cold start simply falls back to a full search.
+GMAIL_SYNC_MAX_USERS = 1000
+_GMAIL_SKIP_LABELS = {'DRAFT', 'SENT', 'SPAM', 'TRASH'}
+_gmail_sync_states = OrderedDict()
+_gmail_sync_lock = threading.Lock()
+
+def _get_gmail_history_id(auth_session):
+    resp = auth_session.get(f"{GMAIL_API_BASE}/gmail/v1/users/me/profile", timeout=10)
     resp.raise_for_status()
-    results = resp.json()
-    return results.get('messages', [])
-
-def _process_email_messages(messages, creds_dict, keywords, priority_sources):
-    """Process email messages concurrently and return consolidated text."""
-    worker_args = [(i, msg['id'], creds_dict, keywords, priority_sources) for i, msg in enumerate(messages)]
-    priority_text_parts = []
-    normal_text_parts = []
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        for _index, email_block, is_priority in executor.map(_fetch_one_message, worker_args):
-            if email_block is None:
+    return resp.json().get('historyId')
+
+def _list_gmail_history(auth_session, start_history_id):
+    """Return (added_ids, deleted_ids, latest_history_id) since start_history_id, or None if Gmail has expired that history."""
+    url = f"{GMAIL_API_BASE}/gmail/v1/users/me/history"
+    params = {'startHistoryId': start_history_id, 'historyTypes': ['messageAdded', 'messageDeleted'], 'maxResults': 500}
+    added, deleted = [], set()
+    latest_history_id = start_history_id
+    while True:
+        resp = auth_session.get(url, params=params, timeout=10)
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        page = resp.json()
+        for entry in page.get('history', []):
+            for item in entry.get('messagesAdded', []):
+                message = item.get('message', {})
+                if not _GMAIL_SKIP_LABELS.intersection(message.get('labelIds', [])):
+                    added.append(message['id'])
+            for item in entry.get('messagesDeleted', []):
+                deleted.add(item.get('message', {}).get('id'))
+        latest_history_id = page.get('historyId', latest_history_id)
+        if not page.get('nextPageToken'):
+            break
+        params['pageToken'] = page['nextPageToken']
+    added = [message_id for message_id in dict.fromkeys(added) if message_id not in deleted]
+    return added, deleted, latest_history_id
+
+def _filter_new_messages(auth_session, creds_dict, message_ids, sources, cutoff_ms):
+    """Keep newly added messages whose sender matches a source and that fall inside the window.
+
+    Uses one metadata batch per 100 ids and returns (metadata, resolved): the metadata newest first,
+    so the fetch pipeline can skip its own metadata pass for these messages, and whether every id
+    could be read. Failed batch parts are retried one by one, like _fetch_message_batch.
+    """
+    sources_lower = [s.lower() for s in sources]
+    kept = []
+    resolved = True
+    for start in range(0, len(message_ids), GMAIL_BATCH_SIZE):
+        chunk = message_ids[start:start + GMAIL_BATCH_SIZE]
+        metas = {}
+        try:
+            for offset, status, msg in _iter_gmail_batch(auth_session, chunk, params=_GMAIL_METADATA_PARAMS):
+                if offset is None or offset >= len(chunk) or status != 200 or not msg:
+                    # Rate-limited or failed parts are left for the per-message fallback below
+                    continue
+                metas[offset] = _parse_gmail_metadata(msg)
+        except Exception as e:
+            print(f"sync: metadata batch failed, falling back to single fetches: {e}")
+        for offset, message_id in enumerate(chunk):
+            if offset not in metas:
+                _index, metas[offset] = _fetch_one_message((offset, message_id, creds_dict),
+                                                           params=_GMAIL_METADATA_PARAMS, parse=_parse_gmail_metadata)
+        for meta in metas.values():
+            if meta is None:
+                resolved = False
+            elif meta['date'] >= cutoff_ms and any(s in meta['sender'].lower() for s in sources_lower):
+                kept.append(meta)
+    kept.sort(key=lambda meta: meta['date'], reverse=True)
+    return kept, resolved
+
+def _resumable_sync_state(cache_key, sources, hours):
+    """The user's sync state if history.list can bring it up to date for this window, else None (a full search is needed)."""
+    sources_key = sorted(s.lower() for s in sources)
+    with _gmail_sync_lock:
+        state = _gmail_sync_states.get(cache_key)
+    if state and state['history_id'] and state['sources'] == sources_key and hours <= state['hours']:
+        return state
+    return None
+
+def _track_sync_completion(messages, sync):
+    """Pass message stubs through, remembering their ids and marking the sync complete once every stub has been consumed."""
+    for message in messages:
+        sync['seen'].append(message['id'])
+        yield message
+    sync['complete'] = True
+
+def _list_gmail_window(creds_dict, cache_key, sources, hours):
+    """Return (stubs, sync): the message stubs in the briefing window, using Gmail history to list only mail added since the last briefing.
+
+    A warm sync state costs one history.list plus a metadata batch per 100 new messages and returns
+    a list; a cold or expired one falls back to a full search, returned as a lazy generator that loads
+    each page as it is consumed. Pass the pair to _sync_gmail_messages to fetch the messages, or to
+    _commit_gmail_listing when they are not needed.
+    """
+    auth_session = _get_auth_session(creds_dict)
+    sources_key = sorted(s.lower() for s in sources)
+    cutoff_ms = int((time.time() - hours * 3600) * 1000)
+    state = _resumable_sync_state(cache_key, sources, hours)
+    dates = dict(state['dates']) if state else {}
+    sync = {'cache_key': cache_key, 'sources': sources_key, 'hours': hours, 'cutoff_ms': cutoff_ms,
+            'records': _message_cache.for_user(cache_key), 'dates': {}, 'seen': [], 'history_id': None, 'complete': False}
+
+    if state:
+        history = _list_gmail_history(auth_session, state['history_id'])
+        if history is not None:
+            added, deleted, latest_history_id = history
+            for message_id in deleted:
+                dates.pop(message_id, None)
+            new_metas, resolved = _filter_new_messages(auth_session, creds_dict, [m for m in added if m not in dates],
+                                                       sources, cutoff_ms)
+            known = sorted((mid for mid, date in dates.items() if date >= cutoff_ms), key=dates.get, reverse=True)
+            # A new message that could not be read would never be reported by history.list again,
+            # so leave the checkpoint unset and let the next briefing run a full search
+            sync['history_id'] = latest_history_id if resolved else None
+            sync['dates'].update((mid, dates[mid]) for mid in known)
+            stubs = [{'id': meta['id'], 'meta': meta} for meta in new_metas] + [{'id': mid} for mid in known]
+            return stubs, sync
+
+    # Full search; the checkpoint is taken first so mail arriving mid-search shows up in the next history call
+    sync['history_id'] = _get_gmail_history_id(auth_session)
+    return _search_gmail_messages(creds_dict, sources, hours), sync
+
+def _sync_gmail_messages(creds_dict, cache_key, sources, hours, window=None):
+    """Return (messages, sync) for the briefing window; `window` is a (stubs, sync) pair already listed by _list_gmail_window.
+
+    `messages` yields message stubs like _search_gmail_messages; without `window`, a cold search is
+    streamed, so fetching starts while later pages are still loading. `sync['records']` is the
+    user's view of the processed-message cache and `sync['dates']` collects message dates;
+    hand both to _process_email_messages and save the state with _commit_gmail_sync afterwards.
+    """
+    stubs, sync = window or _list_gmail_window(creds_dict, cache_key, sources, hours)
+    return _track_sync_completion(stubs, sync), sync
+
+def _commit_gmail_listing(stubs, sync):
+    """Save the sync state for a window that was listed but not fetched (its cached briefing was still current)."""
+    for stub in _track_sync_completion(stubs, sync):
+        if 'meta' in stub:
+            sync['dates'][stub['id']] = stub['meta']['date']
+    _commit_gmail_sync(sync)
+
+def _commit_gmail_sync(sync):
+    """Save the sync state, dropping messages that have aged out of the window.
+
+    Dates come from the metadata read during the fetch, not from the record cache, so a body
+    that failed to download or a record evicted since stays in the window and is fetched again
+    by the next briefing.
+    """
+    dates = {}
+    undated = False
+    for message_id in sync['seen']:
+        date = sync['dates'].get(message_id)
+        if date is None:
+            undated = True
+        elif date >= sync['cutoff_ms']:
+            dates[message_id] = date
+    # A briefing that stopped early (token budget) or could not date a message keeps its records
+    # but forces a full search next time, since history.list will not report those messages again
+    history_id = sync['history_id'] if sync['complete'] and not undated else None
+    with _gmail_sync_lock:
+        _gmail_sync_states[sync['cache_key']] = {
+            'history_id': history_id,
+            'sources': sync['sources'],
+            'hours': sync['hours'],
+            'dates': dates,
+        }
+        _gmail_sync_states.move_to_end(sync['cache_key'])
+        while len(_gmail_sync_states) > GMAIL_SYNC_MAX_USERS:
+            _gmail_sync_states.popitem(last=False)
+
+def _fetch_message_single(args):
+    """Adapter so single-message workers return a list like _fetch_message_batch."""
+    indexes, message_ids, creds_dict = args
+    return [_fetch_one_message((indexes[0], message_ids[0], creds_dict))]
+
+def _fetch_metadata_single(args):
+    """Metadata-only variant of _fetch_message_single."""
+    indexes, message_ids, creds_dict = args
+    return [_fetch_one_message((indexes[0], message_ids[0], creds_dict), params=_GMAIL_METADATA_PARAMS, parse=_parse_gmail_metadata)]
+
+def _run_chunked_fetches(executor, items, worker, chunk_size, max_in_flight, worker_context, on_result, should_stop):
+    """Submit (index, message_id) items to `worker` in chunks as they arrive and call on_result(index, value) per result.
+
+    Workers receive (indexes, message_ids, worker_context). At most `max_in_flight` chunks
+    run at once, and no new items are taken once should_stop() is true.
+    """
+    pending = set()
+
+    def harvest(futures):
+        for future in futures:
+            for index, value in future.result():
+                on_result(index, value)
+
+    chunk_indexes, chunk_ids = [], []
+    stopped = False
+    for index, message_id in items:
+        chunk_indexes.append(index)
+        chunk_ids.append(message_id)
+        if len(chunk_ids) >= chunk_size:
+            pending.add(executor.submit(worker, (chunk_indexes, chunk_ids, worker_context)))
+            chunk_indexes, chunk_ids = [], []
+            done = {future for future in pending if future.done()}
+            pending -= done
+            harvest(done)
+            while len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                harvest(done)
+        if should_stop():
+            stopped = True
+            break
+    if chunk_ids and not stopped:
+        pending.add(executor.submit(worker, (chunk_indexes, chunk_ids, worker_context)))
+    harvest(pending)
+
+_RE_SUBJECT_PREFIX = re.compile(r'^\s*((re|fwd?|fw)\s*:\s*)+', flags=re.IGNORECASE)
+_RE_SENDER_ADDRESS = re.compile(r'<([^>]+)>')
+# Resends and forwards land within hours of the original; a daily newsletter with a fixed subject is a day apart
+DUPLICATE_ISSUE_WINDOW_MS = 6 * 3600 * 1000
+
+def _rank_candidates(candidates, keywords, priority_sources):
+    """Drop duplicate issues and order candidates so the most valuable bodies are fetched first.
+
+    Copies of one issue share a list (List-Id, else sender address), a subject once
+    Re:/Fwd: prefixes are removed, and arrive within DUPLICATE_ISSUE_WINDOW_MS of each
+    other; the newest copy wins. Survivors are ordered priority sources first, then most
+    keyword hits in the subject, then newest first.
+    """
+    kept_dates = {}
+    ranked = []
+    for candidate in sorted(candidates, key=lambda c: c['index']):
+        address = _RE_SENDER_ADDRESS.search(candidate['sender'])
+        list_key = candidate.get('list_id') or (address.group(1) if address else candidate['sender'])
+        dedupe_key = (list_key.lower(), _RE_SUBJECT_PREFIX.sub('', candidate['subject']).strip().lower())
+        dates = kept_dates.setdefault(dedupe_key, [])
+        if any(abs(candidate['date'] - date) <= DUPLICATE_ISSUE_WINDOW_MS for date in dates):
+            continue
+        dates.append(candidate['date'])
+        ranked.append(candidate)
+
+    keyword_matcher = _get_keyword_matcher(keywords, WATCHLIST_WORD_BOUNDARIES)
+    priority_matcher = _get_keyword_matcher(priority_sources)
+
+    def score(candidate):
+        is_priority = priority_matcher.matches_any(candidate['sender'])
+        subject_hits = len(keyword_matcher.find(candidate['subject']))
+        return (not is_priority, -subject_hits, -candidate['date'], candidate['index'])
+
+    ranked.sort(key=score)
+    return ranked
+
+# --- Near-Duplicate Detection ---
+# Newsletters (and passages) whose estimated Jaccard similarity reaches this are dropped as copies
+NEAR_DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", 0.8))
+MINHASH_PERMUTATIONS = 64
+# LSH banding: 16 bands of 4 rows surface candidate pairs from roughly 0.5 similarity up
+MINHASH_BANDS = 16
+SHINGLE_WORDS = 5
+# Passages end at a sentence once they have PASSAGE_MIN_WORDS words, so a story quoted at a different
+# offset in another newsletter still splits at the same places; PASSAGE_MAX_WORDS caps run-on text
+PASSAGE_MIN_WORDS = 20
+PASSAGE_MAX_WORDS = 80
+_RE_NON_WORD = re.compile(r'\W+')
+_RE_SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+_HASH_BASE = 1099511628211
+_HASH_BASE_INV = pow(_HASH_BASE, -1, 2 ** 64)
+_minhash_tables = {}
+
+def _minhash_params():
+    """(A, B, band_mix) for the MinHash permutations, built on first use so numpy is only imported
+    by the process that dedupes. band_mix mixes each band's rows into one 64-bit bucket key."""
+    if not _minhash_tables:
+        import numpy as np
+        rng = np.random.default_rng(1103)
+        a = rng.integers(1, 2 ** 63, size=MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+        b = rng.integers(0, 2 ** 63, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+        band_mix = rng.integers(1, 2 ** 63, size=MINHASH_PERMUTATIONS // MINHASH_BANDS, dtype=np.uint64)
+        _minhash_tables['params'] = (a, b, band_mix)
+    return _minhash_tables['params']
+
+def _band_keys(signatures):
+    """LSH bucket keys for a (n, MINHASH_PERMUTATIONS) signature matrix: n lists of MINHASH_BANDS ints."""
+    import numpy as np
+    rows = signatures.reshape(len(signatures), MINHASH_BANDS, -1)
+    return (rows * _minhash_params()[2]).sum(axis=2, dtype=np.uint64).tolist()
+
+def _split_passages(text):
+    passages = []
+    current = []
+    for sentence in _RE_SENTENCE_BREAK.split(text):
+        words = sentence.split()
+        while words:
+            room = PASSAGE_MAX_WORDS - len(current)
+            current.extend(words[:room])
+            words = words[room:]
+            if len(current) >= PASSAGE_MAX_WORDS or (not words and len(current) >= PASSAGE_MIN_WORDS):
+                passages.append(' '.join(current))
+                current = []
+    if current:
+        passages.append(' '.join(current))
+    return passages
+
+def _minhash_passages(text):
+    """Split text into sentence-aligned passages and MinHash each one over word 5-gram shingles.
+
+    Returns (passages, passage_signatures, text_signature). A passage with too few words to
+    form a shingle gets None, as does the text signature for text that short. Shingles are
+    hashed for the whole text at once with a vectorized polynomial hash over its bytes.
+    Signatures are (signature, band_keys) pairs.
+    """
+    import numpy as np
+    passages = _split_passages(text)
+    normalized = [_RE_NON_WORD.sub(' ', passage.lower()).split() for passage in passages]
+    counts = np.array([len(n) for n in normalized], dtype=np.int64)
+    signatures = [None] * len(passages)
+    flat = ' '.join(word for n in normalized for word in n).encode('utf-8')
+    if counts.sum() < SHINGLE_WORDS:
+        return passages, signatures, None
+
+    data = np.frombuffer(flat, dtype=np.uint8).astype(np.uint64) + np.uint64(1)
+    length = len(data)
+    powers = np.cumprod(np.full(length, _HASH_BASE, dtype=np.uint64))
+    inv_powers = np.concatenate(([np.uint64(1)], np.cumprod(np.full(length - 1, _HASH_BASE_INV, dtype=np.uint64))))
+    prefix = np.concatenate(([np.uint64(0)], np.cumsum(data * inv_powers, dtype=np.uint64)))
+    spaces = np.flatnonzero(data == np.uint64(ord(' ') + 1))
+    starts = np.concatenate(([0], spaces + 1))
+    ends = np.concatenate((spaces, [length]))
+
+    # Shingle i covers words i..i+4
+    first = np.arange(len(starts) - SHINGLE_WORDS + 1)
+    last = first + SHINGLE_WORDS - 1
+    lo, hi = starts[first], ends[last]
+    shingles = (prefix[hi] - prefix[lo]) * powers[hi - 1]
+    minhash_a, minhash_b, _ = _minhash_params()
+    permuted = minhash_a[:, None] * shingles[None, :] + minhash_b[:, None]
+
+    # Passage signatures only use the shingles that sit entirely inside the passage
+    word_passage = np.repeat(np.arange(len(passages)), counts)
+    inside = np.flatnonzero(word_passage[first] == word_passage[last])
+    if len(inside):
+        shingle_passage = word_passage[first[inside]]
+        group_starts = np.flatnonzero(np.concatenate(([True], shingle_passage[1:] != shingle_passage[:-1])))
+        passage_minimums = np.minimum.reduceat(permuted[:, inside], group_starts, axis=1).T
+        passage_keys = _band_keys(passage_minimums)
+        for passage_id, signature, keys in zip(shingle_passage[group_starts].tolist(), passage_minimums, passage_keys):
+            signatures[passage_id] = (signature, keys)
+    text_minimum = permuted.min(axis=1)
+    return passages, signatures, (text_minimum, _band_keys(text_minimum[None, :])[0])
+
+class _MinHashIndex:
+    """Stores MinHash signatures and finds a stored near-duplicate of a new one via LSH banding."""
+
+    def __init__(self, threshold):
+        self._threshold = threshold
+        self._signatures = []
+        self._buckets = [{} for _ in range(MINHASH_BANDS)]
+
+    def contains_similar(self, signature, band_keys):
+        checked = set()
+        for buckets, key in zip(self._buckets, band_keys):
+            for candidate in buckets.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if (self._signatures[candidate] == signature).mean() >= self._threshold:
+                    return True
+        return False
+
+    def add(self, signature, band_keys):
+        self._signatures.append(signature)
+        index = len(self._signatures) - 1
+        for buckets, key in zip(self._buckets, band_keys):
+            buckets.setdefault(key, []).append(index)
+
+def _dedupe_near_duplicates(texts, threshold=NEAR_DUP_THRESHOLD):
+    """Drop near-duplicate newsletters and collapse repeated passages, keeping the first copy.
+
+    `texts` should be in order of importance. Returns (deduped_texts, stats) where dropped
+    newsletters are None and removed passages become a single "[...]" marker; stats counts
+    dropped newsletters (including ones whose passages all collapsed), dropped passages and
+    the estimated input tokens saved.
+    """
+    documents = _MinHashIndex(threshold)
+    passages_seen = _MinHashIndex(threshold)
+    stats = {'newsletters': 0, 'passages': 0, 'tokens_saved': 0}
+    deduped = []
+    for text in texts:
+        passages, signatures, text_signature = _minhash_passages(text)
+        if text_signature is not None and documents.contains_similar(*text_signature):
+            stats['newsletters'] += 1
+            stats['tokens_saved'] += _estimate_tokens(text)
+            deduped.append(None)
+            continue
+        if text_signature is not None:
+            documents.add(*text_signature)
+        kept = []
+        for passage, signature in zip(passages, signatures):
+            if signature is not None and passages_seen.contains_similar(*signature):
+                stats['passages'] += 1
+                stats['tokens_saved'] += _estimate_tokens(passage)
+                if not kept or kept[-1] != '[...]':
+                    kept.append('[...]')
                 continue
-            if is_priority:
-                priority_text_parts.append(f"*** PRIORITY SOURCE ***\n{email_block}")
+            if signature is not None:
+                passages_seen.add(*signature)
+            kept.append(passage)
+        if kept == ['[...]']:
+            stats['newsletters'] += 1
+            deduped.append(None)
+        else:
+            deduped.append(' '.join(kept))
+    return deduped, stats
+
+# --- Token Budget Allocation ---
+# Newsletters that would get fewer tokens than this are left out rather than cut to a stub
+BUDGET_MIN_TOKENS = 150
+BUDGET_PRIORITY_WEIGHT = 3.0
+BUDGET_KEYWORD_WEIGHT = 0.5
+_RE_SENTENCE_END = re.compile(r'[.!?]\s')
+
+def _newsletter_weights(items, keywords):
+    """Relative value of each accepted newsletter: priority source, keyword hits, recency and how much survived dedupe.
+
+    `items` are dicts with is_priority, record, text (after dedupe).
+    """
+    keyword_matcher = _get_keyword_matcher(keywords, WATCHLIST_WORD_BOUNDARIES)
+    dates = [item['record']['date'] for item in items]
+    oldest, newest = min(dates, default=0), max(dates, default=0)
+    weights = []
+    for item in items:
+        record = item['record']
+        weight = BUDGET_PRIORITY_WEIGHT if item['is_priority'] else 1.0
+        if keyword_matcher.patterns:
+            weight *= 1 + BUDGET_KEYWORD_WEIGHT * min(len(keyword_matcher.find(record['subject'], item['text'])), 4)
+        # Newest issues count fully, the oldest in the window half as much
+        if newest > oldest:
+            weight *= 0.5 + 0.5 * (record['date'] - oldest) / (newest - oldest)
+        # Newsletters that were mostly repeats of others carry less unique news
+        weight *= max(0.25, len(item['text']) / max(1, len(record['text'])))
+        weights.append(weight)
+    return weights
+
+def _allocate_token_budget(sizes, weights, budget, min_tokens=BUDGET_MIN_TOKENS):
+    """Split `budget` tokens across items in proportion to weight, never giving an item more than its size.
+
+    Items that fit whole are given their size and the leftover is shared out again
+    (weighted max-min fairness). If an item's share would fall below min_tokens, the
+    lowest-weight such item is dropped (allocated 0) and the split is redone.
+    """
+    candidates = {i for i, size in enumerate(sizes) if size > 0}
+    while True:
+        allocation = [0] * len(sizes)
+        active = set(candidates)
+        remaining = budget
+        while active and remaining > 0:
+            total_weight = sum(weights[i] for i in active)
+            shares = {i: remaining * weights[i] / total_weight for i in active}
+            saturated = [i for i in active if sizes[i] - allocation[i] <= shares[i]]
+            if not saturated:
+                for i in active:
+                    allocation[i] += int(shares[i])
+                break
+            for i in saturated:
+                remaining -= sizes[i] - allocation[i]
+                allocation[i] = sizes[i]
+                active.discard(i)
+        starved = [i for i in candidates if allocation[i] < min(min_tokens, sizes[i])]
+        if not starved:
+            return allocation
+        candidates.discard(min(starved, key=lambda i: (weights[i], -i)))
+
+def _trim_to_tokens(text, tokens):
+    """Cut text to about `tokens` tokens, preferring to end on a sentence boundary."""
+    estimate = _estimate_tokens(text)
+    if estimate <= tokens:
+        return text
+    limit = len(text) * tokens // estimate
+    while True:
+        cut = text[:limit]
+        last_sentence = max((m.end() for m in _RE_SENTENCE_END.finditer(cut)), default=0)
+        if last_sentence >= limit // 2:
+            cut = cut[:last_sentence]
+        trimmed = cut.rstrip() + " [...]"
+        # Token density is uneven (links, numbers), so shrink again if the cut still runs over
+        over = _estimate_tokens(trimmed) - tokens
+        if over <= 0 or not cut:
+            return trimmed
+        limit = max(0, limit - max(1, len(cut) * over // max(1, tokens)))
+
+def _process_email_messages(messages, creds_dict, keywords, priority_sources, token_budget=None, record_store=None, user_key=None, message_dates=None, issue_sources=None):
+    """Fetch newsletters in two phases and return consolidated text.
+
+    Phase 1 reads `messages` into cheap `format=metadata` fetches as it yields them, so a lazy
+    search overlaps with its own paging (messages already in `record_store` skip straight
+    through). It covers every message, since ranking needs all the candidates; the budget only
+    stops phase 2. Candidates are then deduped and ranked, and phase 2 downloads full bodies
+    in rank order only until the accepted newsletters fill the briefing token budget. Newly fetched records are added to
+    `record_store`. Thread-based modes queue on the shared worker pool under `user_key`.
+    `message_dates`, if given, receives the Gmail internal date of every message whose
+    metadata was read, fetched or not. `issue_sources`, if given, receives one (key, text) pair per
+    newsletter block of the returned text, in order: a hash of the message's extracted text and
+    its block before any per-user dedupe or trimming (see _summarize_issues).
+    Returns (consolidated_text, normal_count, priority_count, message_count), where message_count
+    leaves out near-duplicate newsletters that were dropped.
+    """
+    if token_budget is None:
+        token_budget = BRIEFING_TOKEN_BUDGET
+    if GMAIL_FETCH_MODE == "async":
+        # ⚡ Bolt: Coroutines on the shared event loop instead of a fresh thread pool per request
+        meta_worker, body_worker, chunk_size, max_in_flight = _fetch_metadata_async, _fetch_messages_async, GMAIL_ASYNC_CHUNK_SIZE, 8
+        executor_context = contextlib.nullcontext(_get_async_engine())
+        worker_context = _AccessToken(creds_dict)
+    elif GMAIL_FETCH_MODE == "batch":
+        # ⚡ Bolt: One multipart batch request per 100 messages instead of one HTTPS round trip per message
+        meta_worker, body_worker, chunk_size, max_in_flight = _fetch_metadata_batch, _fetch_message_batch, GMAIL_BATCH_SIZE, 8
+    else:
+        meta_worker, body_worker, chunk_size, max_in_flight = _fetch_metadata_single, _fetch_message_single, 1, 20
+    if GMAIL_FETCH_MODE != "async":
+        # ⚡ Bolt: Queue on the process-wide pool instead of spinning up threads per request
+        executor_context = contextlib.nullcontext(_worker_pool.for_user(user_key))
+        worker_context = creds_dict
+
+    candidates = []
+    message_count = 0
+
+    def uncached_ids():
+        nonlocal message_count
+        for msg in messages:
+            index = message_count
+            message_count += 1
+            record = record_store.get(msg['id']) if record_store is not None else None
+            if record is not None:
+                candidates.append(dict(record, index=index, record=record))
+            elif msg.get('meta'):
+                candidates.append(dict(msg['meta'], index=index))
             else:
-                normal_text_parts.append(email_block)
+                yield index, msg['id']
+
+    def add_candidate(index, meta):
+        if meta is not None:
+            candidates.append(dict(meta, index=index))
+
+    results = []
+    used_tokens = 0
+    keyword_matcher = _get_keyword_matcher(keywords, WATCHLIST_WORD_BOUNDARIES)
+    priority_matcher = _get_keyword_matcher(priority_sources)
+
+    def accept(position, record):
+        nonlocal used_tokens
+        email_block, is_priority = _build_email_block(record, keyword_matcher, priority_matcher)
+        results.append((position, email_block, is_priority, record))
+        if email_block is not None:
+            used_tokens += _estimate_tokens(email_block)
+
+    def store_and_accept(position, record):
+        if record is not None and record_store is not None:
+            record_store[record['id']] = record
+        accept(position, record)
+
+    with executor_context as executor:
+        # Phase 1: metadata for every candidate, submitted as `messages` yields them. It never stops
+        # early: a priority source or keyword hit on a later page can outrank everything seen so far
+        _run_chunked_fetches(executor, uncached_ids(), meta_worker, chunk_size, max_in_flight, worker_context,
+                             add_candidate, lambda: False)
+        if message_dates is not None:
+            message_dates.update((candidate['id'], candidate['date']) for candidate in candidates)
+        ranked = _rank_candidates(candidates, keywords, priority_sources)
+
+        def bodies_to_fetch():
+            for position, candidate in enumerate(ranked):
+                if candidate.get('record') is not None:
+                    accept(position, candidate['record'])
+                else:
+                    yield position, candidate['id']
+
+        # Phase 2: full bodies in rank order, stopping once the budget is full
+        _run_chunked_fetches(executor, bodies_to_fetch(), body_worker, chunk_size, max_in_flight, worker_context,
+                             store_and_accept, lambda: used_tokens >= token_budget * BUDGET_FETCH_HEADROOM)
+
+    fetched_positions = {position for position, _block, _p, _record in results if ranked[position].get('record') is None}
+    downloaded_bytes = sum(ranked[position].get('size', 0) for position in fetched_positions)
+    skipped_bytes = sum(c.get('size', 0) for c in candidates if c.get('record') is None) - downloaded_bytes
+    print(f" * [Fetch] {message_count} messages, {len(candidates) - len(ranked)} duplicates dropped, "
+          f"{len(fetched_positions)} bodies downloaded, ~{skipped_bytes // 1024} KB skipped")
+    _log_worker_pool_stats("Fetch")
+
+    # Priority sources first so they keep their copy of any story that is also in a normal newsletter
+    accepted = sorted((r for r in results if r[1] is not None), key=lambda r: (not r[2], r[0]))
+    # ⚡ Bolt: Near-duplicate newsletters and repeated passages are dropped before they are billed as LLM input
+    deduped_texts, dedupe_stats = _dedupe_near_duplicates([record['text'] for _p, _b, _i, record in accepted])
+    print(f" * [Dedupe] {dedupe_stats['newsletters']} near-duplicate newsletters and {dedupe_stats['passages']} "
+          f"repeated passages dropped, ~{dedupe_stats['tokens_saved']} tokens saved")
+    # Dropped copies are not reported as newsletters in the briefing metrics
+    message_count -= dedupe_stats['newsletters']
+    items = [
+        {'is_priority': is_priority, 'record': record, 'text': text}
+        for (_position, _block, is_priority, record), text in zip(accepted, deduped_texts) if text is not None
+    ]
 
-    return "".join(priority_text_parts) + "".join(normal_text_parts), len(normal_text_parts), len(priority_text_parts)
+    # ⚡ Bolt: Fit everything into the token budget by trimming low-value newsletters instead of failing the briefing
+    def email_block(item, text):
+        block = _format_email_block(item['record']['sender'], item['record']['subject'], text)
+        return f"*** PRIORITY SOURCE ***\n{block}" if item['is_priority'] else block
+
+    sizes = [_estimate_tokens(email_block(item, item['text'])) for item in items]
+    # Block estimates are rounded down, so a token per block is held back to keep the joined text in budget
+    allocation = _allocate_token_budget(sizes, _newsletter_weights(items, keywords), token_budget - len(items))
+    text_parts = []
+    normal_count = priority_count = 0
+    for item, size, tokens in zip(items, sizes, allocation):
+        if not tokens:
+            continue
+        text = item['text']
+        if tokens < size:
+            text = _trim_to_tokens(text, tokens - (size - _estimate_tokens(text)))
+        text_parts.append(email_block(item, text))
+        if issue_sources is not None:
+            record = item['record']
+            issue_sources.append((hashlib.sha256(record['text'].encode('utf-8')).hexdigest(),
+                                  _format_email_block(record['sender'], record['subject'], record['text'])))
+        if item['is_priority']:
+            priority_count += 1
+        else:
+            normal_count += 1
+    trimmed = sum(1 for size, tokens in zip(sizes, allocation) if 0 < tokens < size)
+    print(f" * [Budget] {len(text_parts)}/{len(items)} newsletters in {sum(allocation)}/{token_budget} tokens, "
+          f"{trimmed} trimmed")
+    return "".join(text_parts), normal_count, priority_count, message_count
 
-def _report_fetch_metrics(email, analysis_result, t_duration_ms, hours, messages, normal_count, priority_count, raw_length, optimized_length):
+def _report_fetch_metrics(email, analysis_result, t_duration_ms, hours, message_count, normal_count, priority_count, raw_length, optimized_length, input_tokens=0):
     """Report fetch metrics to PostHog."""
     if not posthog_client or not email:
         return
@@ -1029,9 +3415,10 @@ def _report_fetch_metrics(email, analysis_result, t_duration_ms, hours, messages
         })
     else:
         posthog_client.capture(distinct_id=anon_id, event='emails_fetched', properties={
-            'newsletter_count': len(messages),
+            'newsletter_count': message_count,
             'raw_html_length': raw_length,
             'optimized_text_length': optimized_length,
+            'estimated_input_tokens': input_tokens,
             'llm_generation_time_ms': t_duration_ms,
             'output_text_length': len(json.dumps(analysis_result)),
             'time_window_hours': hours
@@ -1051,91 +3438,528 @@ def get_user_email_for_rate_limit():
         pass
     return get_remote_address()
 
-@app.route('/api/fetch_emails')
-@limiter.limit("3 per day", key_func=get_user_email_for_rate_limit, error_message="You've reached your daily limit of 3 briefings. Upgrade to Pro for unlimited briefings or try again tomorrow!", deduct_when=lambda res: res.status_code == 200)
-def fetch_emails():
+def _briefing_error(e, email):
+    """(payload, status) for an exception raised while building a briefing."""
+    err_msg = str(e).lower()
+    
+    if posthog_client and email:
+         posthog_client.capture(distinct_id=anonymize_user(email), event='fetch_email_error', properties={'error': err_msg})
+
+    if 'quota' in err_msg or 'rate' in err_msg or '429' in err_msg:
+        return {'error': "Gmail rate limit reached. Please try again in a few minutes."}, 429
+    if 'credentials' in err_msg or 'token' in err_msg or '401' in err_msg:
+        return {'error': "Your session expired. Please log in again."}, 401
+    import traceback
+    traceback.print_exc()
+    print(f"fetch_emails error: {e}")
+    return {'error': f"Unable to fetch newsletters. Exact error: {str(e)}"}, 500
+
+def _briefing_request():
+    """Session checks and settings shared by the briefing endpoints.
+
+    Returns (briefing_request, None), or (None, (payload, status)) when the session is not usable.
+    """
     if 'credentials' not in session: 
-        return jsonify({'error': 'Please log in to generate your briefing.'}), 401
+        return None, ({'error': 'Please log in to generate your briefing.'}, 401)
     
     user_info = get_user_info()
     # get_user_info() may pop credentials if the token is invalid/expired
     if 'credentials' not in session:
-        return jsonify({'error': 'Your session expired. Please log in again.'}), 401
+        return None, ({'error': 'Your session expired. Please log in again.'}, 401)
 
     email = user_info.get('email') if user_info else None
     # Store email in session for rate limiting
     if email: session['user_email'] = email
     settings = load_settings(email)
 
-    cache_key = email or str(user_info.get('id', 'unknown')) if user_info else 'unknown'
-    current_hash = get_settings_hash(settings)
-
-    cached_analysis = _check_cached_analysis(cache_key, current_hash)
-    if cached_analysis:
-        return jsonify(cached_analysis)
-
     creds_data = session.get('credentials')
     if not creds_data:
-        return jsonify({'error': 'Your session expired. Please log in again.'}), 401
+        return None, ({'error': 'Your session expired. Please log in again.'}, 401)
+
+    if email and settings.get('pregenerate_briefing'):
+        _record_briefing_open(email, creds_data)
+
+    if GMAIL_FETCH_MODE == "async":
+        # The async engine sends the access token itself; refresh it here, at most once an hour, and keep
+        # the result in the session so later briefings (and their background jobs) reuse it
+        stored = dict(creds_data)
+        try:
+            _get_access_token(creds_data)
+        except Exception as e:
+            return None, _briefing_error(e, email)
+        if creds_data != stored:
+            session.modified = True
+
+    return {
+        'email': email,
+        'user_info': user_info,
+        'settings': settings,
+        'cache_key': email or str(user_info.get('id', 'unknown')) if user_info else 'unknown',
+        # Only the settings the analysis depends on; see _briefing_stage_keys
+        'settings_hash': _briefing_stage_keys(settings)['filter'],
+        'creds_dict': dict(creds_data),
+    }, None
+
+def _cached_briefing(briefing_request):
+    """The cached analysis for this request if the Gmail messages in its window are unchanged, else None.
+
+    Lists the window once per request (incrementally, see _list_gmail_window) and keeps the listing and
+    its fingerprint on briefing_request, so a miss fetches from that listing and stores the fingerprint
+    next to the new analysis. If Gmail cannot be listed, a cached analysis inside its age limit is served.
+    """
+    # ⚡ Bolt: A refresh reuses the analysis for as long as no newsletter arrived or aged out of the window,
+    # and one right after a new issue lands regenerates instead of waiting out a fixed TTL
+    cache_key = briefing_request['cache_key']
+    current_hash = briefing_request['settings_hash']
+    if 'message_set' not in briefing_request:
+        settings = briefing_request['settings']
+        try:
+            stubs, sync = _list_gmail_window(briefing_request['creds_dict'], cache_key,
+                                             _briefing_sources(settings), settings.get('time_window_hours', 24))
+            # The fingerprint needs every id, so a cold search is read in full here and replayed for the fetch
+            window = (list(stubs), sync)
+        except Exception as e:
+            cached_analysis = _check_cached_analysis(cache_key, current_hash, None, any_message_set=True)
+            if cached_analysis:
+                print(f"Gmail listing failed, serving the cached briefing: {e}")
+                return cached_analysis
+            raise
+        briefing_request['gmail_window'] = window
+        briefing_request['message_set'] = _message_set_fingerprint(stub['id'] for stub in window[0])
+    cached_analysis = _check_cached_analysis(cache_key, current_hash, briefing_request['message_set'])
+    if cached_analysis and 'gmail_window' in briefing_request:
+        _commit_gmail_listing(*briefing_request.pop('gmail_window'))
+    return cached_analysis
+
+def _prepare_briefing(briefing_request):
+    """Front half of the briefing endpoints: cached analysis and the Gmail fetch.
+
+    Returns (briefing, None) with what the analysis step needs, or (None, (payload, status)) when the
+    request is already answered (an error, a cached analysis or nothing to analyze).
+    """
+    email = briefing_request['email']
+    user_info = briefing_request['user_info']
+    settings = briefing_request['settings']
+    cache_key = briefing_request['cache_key']
+    current_hash = briefing_request['settings_hash']
+    creds_dict = briefing_request['creds_dict']
+
+    try:
+        cached_analysis = _cached_briefing(briefing_request)
+    except Exception as e:
+        return None, _briefing_error(e, email)
+    if cached_analysis:
+        return None, (cached_analysis, 200)
+    message_set = briefing_request['message_set']
 
-    creds = Credentials(**creds_data)
-    creds_dict = dict(creds_data)
     try:
-        sources = settings.get('sources', []) or ["wsj.com", "nytimes.com"]
+        sources = _briefing_sources(settings)
         hours = settings.get('time_window_hours', 24)
 
         # ⚡ Bolt: Pre-calculate lowercased keywords and sources to prevent lowercasing per message in worker loop
         keywords = [k.lower() for k in settings.get('keywords', [])]
         priority_sources = [p.lower() for p in settings.get('priority_sources', [])]
 
-        messages = _search_gmail_messages(creds, sources, hours)
-        if not messages:
-            return jsonify({'story_groups': [], 'remaining_stories': [{'headline': f'No newsletters found in last {hours}h.'}]})
-
-        consolidated_text, normal_count, priority_count = _process_email_messages(
-            messages, creds_dict, keywords, priority_sources
+        # ⚡ Bolt: Repeat briefings only list and fetch mail added since the last Gmail historyId
+        messages, sync = _sync_gmail_messages(creds_dict, cache_key, sources, hours,
+                                              window=briefing_request.get('gmail_window'))
+        issue_sources = []
+        consolidated_text, normal_count, priority_count, message_count = _process_email_messages(
+            messages, creds_dict, keywords, priority_sources, record_store=sync['records'],
+            user_key=anonymize_user(cache_key), message_dates=sync['dates'], issue_sources=issue_sources,
         )
+        _commit_gmail_sync(sync)
+        _boilerplate_models.flush()
+    except Exception as e:
+        return None, _briefing_error(e, email)
+
+    if not message_count:
+        return None, ({'story_groups': [], 'remaining_stories': [{'headline': f'No newsletters found in last {hours}h.'}]}, 200)
+
+    if not consolidated_text:
+        reason = "No text found matching your watchlist." if keywords else "No text found."
+        return None, ({'story_groups': [], 'remaining_stories': [{'headline': reason}]}, 200)
+
+    fingerprint = _content_fingerprint(consolidated_text)
+    # A watchlist or source change that leaves the filtered newsletters unchanged keeps the user's analysis
+    own_analysis = _check_cached_analysis_for_content(cache_key, fingerprint)
+    if own_analysis is not None:
+        print(" * [Analysis] Content unchanged, skipping Gemini")
+        _update_cached_analysis(cache_key, current_hash, own_analysis, fingerprint, message_set)
+        return None, (own_analysis, 200)
+
+    shared_analysis = _shared_analysis_cache.get(fingerprint)
+    if shared_analysis is not None:
+        print(" * [Analysis] Shared cache hit, skipping Gemini")
+        _update_cached_analysis(cache_key, current_hash, shared_analysis, fingerprint, message_set)
+        return None, (shared_analysis, 200)
+
+    return {
+        'email': email,
+        'cache_key': cache_key,
+        'settings_hash': current_hash,
+        'hours': hours,
+        'message_count': message_count,
+        'normal_count': normal_count,
+        'priority_count': priority_count,
+        'text': consolidated_text,
+        'fingerprint': fingerprint,
+        'issue_sources': issue_sources,
+        'message_set': message_set,
+        # Never stored; only used to keep personalized analyses out of the shared cache
+        'identifiers': [email, (email or '').split('@')[0], (user_info or {}).get('name')],
+    }, None
+
+def _finish_briefing(briefing, analysis_result, t_duration_ms):
+    """Report metrics and cache a successful analysis."""
+    _report_fetch_metrics(
+        email=briefing['email'],
+        analysis_result=analysis_result,
+        t_duration_ms=t_duration_ms,
+        hours=briefing['hours'],
+        message_count=briefing['message_count'],
+        normal_count=briefing['normal_count'],
+        priority_count=briefing['priority_count'],
+        raw_length=0, # approximating these two as they aren't computed exactly here anymore, we could re-add calculation later if critical
+        optimized_length=len(briefing['text']),
+        input_tokens=_estimate_tokens(briefing['text'])
+    )
+    if not analysis_result.get('error'):
+        _update_cached_analysis(briefing['cache_key'], briefing['settings_hash'], analysis_result, briefing['fingerprint'],
+                                briefing['message_set'])
+        _shared_analysis_cache.put(briefing['fingerprint'], analysis_result, briefing['identifiers'])
 
-        if not consolidated_text:
-            reason = "No text found matching your watchlist." if keywords else "No text found."
-            return jsonify({'story_groups': [], 'remaining_stories': [{'headline': reason}]})
+def _briefing_stream_events(briefing, flight=None):
+    """Briefing events as Gemini writes them; metrics and caching run once the result is known.
 
+    Yields {"type": "story_group" | "remaining_story", "data": ...} and finally {"type": "result", "data": analysis}
+    or {"type": "error", "error": message}. flight is the (key, future) from _briefing_flights.begin() when
+    this briefing leads a coalesced one; callers waiting on it get the final (payload, status).
+    """
+    # ⚡ Bolt: Stories reach the page while Gemini is still writing the rest of the briefing
+    t_start = time.time()
+    analysis_result = {"error": "AI analysis failed."}
+    try:
+        for kind, payload in analyze_news_with_llm_stream(briefing['text'], anonymize_user(briefing['cache_key']),
+                                                         briefing['identifiers'], briefing.get('issue_sources')):
+            if kind == 'result':
+                analysis_result = payload
+            else:
+                yield {'type': kind, 'data': payload}
+    except Exception as e:
+        print(f"fetch_emails_stream error: {e}")
+    except GeneratorExit:
+        # The client went away mid-stream; release any requests attached to this briefing
+        if flight is not None:
+            _briefing_flights.finish(*flight, result=({"error": "AI analysis failed."}, 503))
+        raise
+    try:
+        _finish_briefing(briefing, analysis_result, int((time.time() - t_start) * 1000))
+    finally:
+        if flight is not None:
+            _briefing_flights.finish(*flight, result=(analysis_result, 503 if analysis_result.get('error') else 200))
+    if analysis_result.get('error'):
+        yield {'type': 'error', 'error': analysis_result['error']}
+    else:
+        yield {'type': 'result', 'data': analysis_result}
+
+def _briefing_stream_lines(briefing, flight=None, limit_charge=()):
+    """NDJSON lines for fetch_emails_stream. limit_charge (see _briefing_limit_charge) is charged once the result line is ready."""
+    # Closed explicitly so a client disconnect reaches the events generator (and releases the flight) at once
+    with contextlib.closing(_briefing_stream_events(briefing, flight)) as events:
+        for event in events:
+            if event['type'] == 'result':
+                _charge_briefing_limit(limit_charge)
+            yield json.dumps(event) + "\n"
+
+def _start_briefing(briefing_request):
+    """Lead or join the in-flight briefing for this request, running the Gmail fetch when leading.
+
+    Returns (briefing, flight, None) for the caller to stream the analysis, or (None, None, (payload, status))
+    when the request is already answered: by the request it attached to, the cache, an error or an empty inbox.
+    """
+    flight_key = (briefing_request['cache_key'], briefing_request['settings_hash'])
+    future, leader = _briefing_flights.begin(flight_key)
+    if not leader:
+        print(" * [SingleFlight] Attached to in-flight briefing")
+        reply = _briefing_flights.wait(future)
+        if reply is not None:
+            return None, None, reply
+        flight = None
+    else:
+        flight = (flight_key, future)
+
+    try:
+        briefing, reply = _prepare_briefing(briefing_request)
+    except Exception as e:
+        if flight is not None:
+            _briefing_flights.finish(*flight, error=e)
+        raise
+    if reply is not None:
+        if flight is not None:
+            _briefing_flights.finish(*flight, result=reply)
+        return None, None, reply
+    return briefing, flight, None
+
+def _run_briefing(briefing_request):
+    """Fetch and analyze a briefing. Returns (payload, status)."""
+    briefing, reply = _prepare_briefing(briefing_request)
+    if reply is not None:
+        return reply
+
+    try:
         t_start = time.time()
-        analysis_result = analyze_news_with_llm(consolidated_text)
-        t_duration_ms = int((time.time() - t_start) * 1000)
-
-        _report_fetch_metrics(
-            email=email,
-            analysis_result=analysis_result,
-            t_duration_ms=t_duration_ms,
-            hours=hours,
-            messages=messages,
-            normal_count=normal_count,
-            priority_count=priority_count,
-            raw_length=0, # approximating these two as they aren't computed exactly here anymore, we could re-add calculation later if critical
-            optimized_length=len(consolidated_text)
-        )
+        analysis_result = analyze_news_with_llm(briefing['text'], user_key=anonymize_user(briefing['cache_key']),
+                                                identifiers=briefing['identifiers'], issue_sources=briefing.get('issue_sources'))
+        _finish_briefing(briefing, analysis_result, int((time.time() - t_start) * 1000))
 
         if analysis_result.get('error'):
-            return jsonify(analysis_result), 503
-
-        _update_cached_analysis(cache_key, current_hash, analysis_result)
-        return jsonify(analysis_result)
+            return analysis_result, 503
+        return analysis_result, 200
 
     except Exception as e:
-        err_msg = str(e).lower()
-        
-        if posthog_client and email:
-             posthog_client.capture(distinct_id=anonymize_user(email), event='fetch_email_error', properties={'error': err_msg})
+        return _briefing_error(e, briefing['email'])
 
-        if 'quota' in err_msg or 'rate' in err_msg or '429' in err_msg:
-            return jsonify({'error': "Gmail rate limit reached. Please try again in a few minutes."}), 429
-        if 'credentials' in err_msg or 'token' in err_msg or '401' in err_msg:
-            return jsonify({'error': "Your session expired. Please log in again."}), 401
-        import traceback
-        traceback.print_exc()
-        print(f"fetch_emails error: {e}")
-        return jsonify({'error': f"Unable to fetch newsletters. Exact error: {str(e)}"}), 500
+@app.route('/api/fetch_emails')
+@limiter.limit("3 per day", key_func=get_user_email_for_rate_limit, error_message="You've reached your daily limit of 3 briefings. Upgrade to Pro for unlimited briefings or try again tomorrow!", deduct_when=lambda res: res.status_code == 200)
+def fetch_emails():
+    briefing_request, reply = _briefing_request()
+    if reply is None:
+        # ⚡ Bolt: Concurrent requests for the same user and settings share one Gmail fetch and Gemini call
+        flight_key = (briefing_request['cache_key'], briefing_request['settings_hash'])
+        reply = _briefing_flights.do(flight_key, lambda: _run_briefing(briefing_request))
+    payload, status = reply
+    return jsonify(payload), status
+
+def _briefing_limit_charge():
+    """The daily limits checked for the current request, as (limit, key args) pairs to charge later.
+
+    Routes whose briefing finishes after the response is sent only check the limit up front (their
+    deduct_when skips those responses) and charge it with _charge_briefing_limit once the briefing has succeeded.
+    """
+    return [(current.limit, current.request_args) for current in limiter.current_limits]
+
+def _briefing_limit_allows(limit_charge, in_flight):
+    """True if every limit in limit_charge has room for one more briefing beyond `in_flight` uncharged ones."""
+    for limit, request_args in limit_charge:
+        try:
+            if limiter.limiter.get_window_stats(limit, *request_args).remaining <= in_flight:
+                return False
+        except Exception as e:
+            print(f"Rate limit check failed: {e}")
+    return True
+
+def _charge_briefing_limit(limit_charge):
+    for limit, request_args in limit_charge:
+        try:
+            limiter.limiter.hit(limit, *request_args)
+        except Exception as e:
+            print(f"Rate limit charge failed: {e}")
+
+def _charges_briefing_stream_limit(response):
+    """Daily-limit deduction for fetch_emails_stream: briefings answered as plain JSON. A stream always
+    starts with status 200, so it is charged by _briefing_stream_lines when its result line is ready."""
+    return response.status_code == 200 and response.mimetype != 'application/x-ndjson'
+
+@app.route('/api/fetch_emails/stream')
+@limiter.limit("3 per day", key_func=get_user_email_for_rate_limit, error_message="You've reached your daily limit of 3 briefings. Upgrade to Pro for unlimited briefings or try again tomorrow!", deduct_when=_charges_briefing_stream_limit)
+def fetch_emails_stream():
+    """fetch_emails with progressive delivery.
+
+    Errors before analysis, cached briefings and empty results are answered with the same
+    JSON as fetch_emails. Otherwise the response is NDJSON: a {"type": "story_group"} or
+    {"type": "remaining_story"} line as Gemini closes each one, then a final
+    {"type": "result", "data": analysis} or {"type": "error", "error": message}.
+    """
+    briefing_request, reply = _briefing_request()
+    if reply is not None:
+        payload, status = reply
+        return jsonify(payload), status
+
+    # A request that arrives while the same briefing is generating gets the finished result as plain JSON
+    briefing, flight, reply = _start_briefing(briefing_request)
+    if reply is not None:
+        payload, status = reply
+        return jsonify(payload), status
+    lines = _briefing_stream_lines(briefing, flight, _briefing_limit_charge())
+    return flask.Response(flask.stream_with_context(lines), mimetype='application/x-ndjson',
+                          headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- Briefing Jobs ---
+# ⚡ Bolt: In job mode the route queues the briefing and returns a job id at once; a small pool of job
+# workers runs the Gmail fetch and Gemini call while the page long-polls for finished stories. A slow
+# briefing no longer pins one of gunicorn's eight request threads for its whole life.
+BRIEFING_JOB_WORKERS = int(os.environ.get("BRIEFING_JOB_WORKERS", 4))
+BRIEFING_JOB_TTL_SECONDS = int(os.environ.get("BRIEFING_JOB_TTL_SECONDS", 900))
+BRIEFING_JOB_MAX_WAIT_SECONDS = 25
+
+class _BriefingJob:
+    def __init__(self, job_id, owner, flight_key):
+        self.id = job_id
+        self.owner = owner
+        self.flight_key = flight_key
+        self.status = 'queued'
+        self.events = []
+        self.finished_at = None
+
+class _BriefingJobs:
+    """Registry of briefing jobs. Workers append stream events; pollers wait for the ones they have not seen."""
+
+    def __init__(self, ttl_seconds=BRIEFING_JOB_TTL_SECONDS):
+        self._ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._active = {}  # flight key -> job id of the queued or running job
+        self._cond = threading.Condition()
+
+    def create(self, owner, flight_key, admit=None):
+        """Returns (job, created); a request for a briefing that is already queued gets the existing job.
+
+        If given, admit(in_flight) is asked, with the number of the owner's unfinished jobs, before a
+        new job is created; (None, False) if it declines.
+        """
+        with self._cond:
+            self._expire()
+            job_id = self._active.get(flight_key)
+            if job_id is not None:
+                return self._jobs[job_id], False
+            if admit is not None:
+                in_flight = sum(1 for j in self._jobs.values() if j.owner == owner and j.status != 'done')
+                if not admit(in_flight):
+                    return None, False
+            job = _BriefingJob(secrets.token_urlsafe(16), owner, flight_key)
+            self._jobs[job.id] = job
+            self._active[flight_key] = job.id
+            return job, True
+
+    def get(self, job_id, owner):
+        """The job, or None if it does not exist, has expired or belongs to someone else."""
+        with self._cond:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return job if job is not None and job.owner == owner else None
+
+    def start(self, job):
+        with self._cond:
+            job.status = 'running'
+            self._cond.notify_all()
+
+    def append(self, job, event):
+        """Add an event; a "result" or "error" event finishes the job."""
+        with self._cond:
+            job.events.append(event)
+            if event['type'] in ('result', 'error'):
+                job.status = 'done'
+                job.finished_at = time.monotonic()
+                if self._active.get(job.flight_key) == job.id:
+                    del self._active[job.flight_key]
+            self._cond.notify_all()
+
+    def poll(self, job, after, timeout):
+        """Wait up to timeout seconds for events past index `after`. Returns (status, events)."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(job.events) > after or job.status == 'done', timeout=timeout)
+            return job.status, job.events[after:]
+
+    def _expire(self):
+        # Called with the lock held; finished jobs are kept long enough for the page to collect them
+        cutoff = time.monotonic() - self._ttl_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at is not None and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+_briefing_jobs = _BriefingJobs()
+# Separate from _worker_pool: jobs block on Gmail and TTS work they submit there, so sharing it could deadlock
+_briefing_job_pool = _FairExecutor(BRIEFING_JOB_WORKERS)
+
+def _run_briefing_job(job, briefing_request, limit_charge=()):
+    """Job worker: run a briefing and record its events on the job.
+
+    limit_charge comes from _briefing_limit_charge and is charged only if the briefing succeeds.
+    """
+    reply = ({'error': 'Unable to generate briefing. Please try again.'}, 500)
+    try:
+        _briefing_jobs.start(job)
+        briefing, flight, reply = _start_briefing(briefing_request)
+        if reply is None:
+            for event in _briefing_stream_events(briefing, flight):
+                if event['type'] == 'result':
+                    reply = (event['data'], 200)
+                elif event['type'] == 'error':
+                    reply = ({'error': event['error']}, 503)
+                else:
+                    _briefing_jobs.append(job, event)
+    except Exception as e:
+        print(f"briefing job error: {e}")
+    finally:
+        payload, status = reply
+        if status == 200:
+            _charge_briefing_limit(limit_charge)
+            _briefing_jobs.append(job, {'type': 'result', 'data': payload})
+        else:
+            _briefing_jobs.append(job, {'type': 'error', 'error': payload.get('error'), 'status': status})
+
+@app.route('/api/briefing_jobs', methods=['POST'])
+@limiter.limit("3 per day", key_func=get_user_email_for_rate_limit, error_message="You've reached your daily limit of 3 briefings. Upgrade to Pro for unlimited briefings or try again tomorrow!", deduct_when=lambda res: False)
+def create_briefing_job():
+    """Queue a briefing. The response is 202 with {"job_id", "status"} to poll at /api/briefing_jobs/<job_id>;
+    a cached briefing is the job's only event. The daily limit is charged when a job succeeds, so a
+    duplicate POST that joins a queued job is not charged again and failed briefings are not charged.
+    Jobs still running count against what is left of the limit, so parallel POSTs cannot overrun it.
+    """
+    briefing_request, reply = _briefing_request()
+    if reply is not None:
+        payload, status = reply
+        return jsonify(payload), status
+
+    # The cache check lists the user's Gmail window, so it runs in the job rather than on the request thread
+    owner = anonymize_user(briefing_request['cache_key'])
+    limit_charge = _briefing_limit_charge()
+    job, created = _briefing_jobs.create(owner, (briefing_request['cache_key'], briefing_request['settings_hash']),
+                                         admit=lambda in_flight: _briefing_limit_allows(limit_charge, in_flight))
+    if job is None:
+        return jsonify({'error': "You've reached your daily limit of 3 briefings. Upgrade to Pro for unlimited briefings or try again tomorrow!"}), 429
+    if created:
+        _briefing_job_pool.submit(owner, _run_briefing_job, job, briefing_request, limit_charge)
+    return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+@app.route('/api/briefing_jobs/<job_id>', methods=['GET'])
+# The page polls once a second while a job runs; this replaces the default hourly limit for this route
+@limiter.limit("120 per minute", key_func=get_user_email_for_rate_limit)
+def get_briefing_job(job_id):
+    """Long-poll a briefing job.
+
+    ?after=N skips events already seen and ?wait=S (at most 25) holds the request until there is
+    something new; the page polls without waiting so it never holds a request thread. Returns {"status": "queued" | "running" | "done", "events": [...], "next": N'};
+    events use the same shapes as the fetch_emails_stream NDJSON lines, and a finished job ends
+    with a "result" or "error" event ("error" events carry the HTTP status fetch_emails would use).
+    """
+    user_info = get_user_info()
+    if not user_info or 'credentials' not in session:
+        return jsonify({'error': 'Your session expired. Please log in again.'}), 401
+    email = user_info.get('email')
+    job = _briefing_jobs.get(job_id, anonymize_user(email or str(user_info.get('id', 'unknown'))))
+    if job is None:
+        return jsonify({'error': 'Briefing job not found. Please generate your briefing again.'}), 404
+
+    after = max(0, request.args.get('after', 0, type=int))
+    wait_seconds = min(max(0.0, request.args.get('wait', 0, type=float)), BRIEFING_JOB_MAX_WAIT_SECONDS)
+    status, events = _briefing_jobs.poll(job, after, wait_seconds)
+    return jsonify({'status': status, 'events': events, 'next': after + len(events)})
+
+def _synthesize_script(script_text, creds_dict, style, email, cache_key):
+    """Synthesize a briefing script. Returns the base64 MP3, or '' if the audio came back empty."""
+    chunks = _chunk_script_text(script_text)
+    all_audio_content, tts_duration_ms = _synthesize_audio_from_chunks(chunks, creds_dict, style, PROJECT_ID, user_key=anonymize_user(cache_key))
+
+    if not all_audio_content or len(all_audio_content) < 100:
+        print(f"ERROR: Generated audio is too small ({len(all_audio_content) if all_audio_content else 0} bytes)")
+        return ''
+
+    if posthog_client and email:
+        posthog_client.capture(distinct_id=anonymize_user(email), event='audio_generated', properties={
+            'tts_generation_time_ms': tts_duration_ms,
+            'persona_selected': style
+        })
+    return base64.b64encode(all_audio_content).decode('utf-8')
 
 @app.route('/api/generate_audio', methods=['POST'])
 @limiter.limit("5 per day", key_func=get_user_email_for_rate_limit, error_message="You've reached your daily limit of 5 audio generations. Upgrade to Pro for unlimited audio or try again tomorrow!", deduct_when=lambda res: res.status_code == 200)
@@ -1156,7 +3980,7 @@ def generate_audio():
     creds_data = session.get('credentials')
     if not creds_data:
         return jsonify({'error': 'Your session expired. Please log in again.'}), 401
-    creds = Credentials(**creds_data)
+    creds = get_credentials_from_session(creds_data)
     try:
         auth_req = Request()
         if creds.expired:
@@ -1174,36 +3998,23 @@ def generate_audio():
             return jsonify({'error': 'Invalid data format. Expected a JSON object.'}), 400
         if not analysis_data:
             return jsonify({'error': 'No briefing data to convert to audio.'}), 400
-        script_text = generate_script_from_analysis(analysis_data, style)
-        script_hash = hashlib.md5((script_text + style).encode()).hexdigest()
+        if email and settings.get('pregenerate_briefing') and isinstance(analysis_data.get('greeting'), str):
+            _briefing_schedule_writer.submit(anonymize_user(email), _briefing_schedules.record, email,
+                                             greeting=analysis_data['greeting'][:40])
+        audio_key = _audio_cache_key(analysis_data, style)
         with _cache_lock:
             cache = load_cache()
             user_cache = cache.get(cache_key, {})
-            if user_cache.get('script_hash') == script_hash and user_cache.get('audio'):
+            if user_cache.get('audio_key') == audio_key and user_cache.get('audio'):
                 return jsonify({"audio_content": user_cache['audio']})
 
-        chunks = _chunk_script_text(script_text)
-        all_audio_content, tts_duration_ms = _synthesize_audio_from_chunks(chunks, creds_dict, style, PROJECT_ID)
-
-        if not all_audio_content or len(all_audio_content) < 100:
-            print(f"ERROR: Generated audio is too small ({len(all_audio_content) if all_audio_content else 0} bytes)")
+        # ⚡ Bolt: Concurrent requests for the same briefing and persona share one TTS synthesis
+        script_text = generate_script_from_analysis(analysis_data, style)
+        audio_base64 = _audio_flights.do(audio_key, lambda: _synthesize_script(script_text, creds_dict, style, email, cache_key))
+        if not audio_base64:
             return jsonify({'error': 'The generated audio was empty or invalid. Please try a different persona or refresh.'}), 500
 
-        audio_base64 = base64.b64encode(all_audio_content).decode('utf-8')
-        
-        if posthog_client and email:
-            posthog_client.capture(distinct_id=anonymize_user(email), event='audio_generated', properties={
-                'tts_generation_time_ms': tts_duration_ms,
-                'persona_selected': style
-            })
-
-        with _cache_lock:
-            cache = load_cache()
-            user_cache = cache.get(cache_key, {})
-            user_cache['script_hash'] = script_hash
-            user_cache['audio'] = audio_base64
-            cache[cache_key] = user_cache
-            save_cache(cache)
+        _update_cached_audio(cache_key, audio_key, audio_base64)
         return jsonify({"audio_content": audio_base64})
     except Exception as e:
         err_msg = str(e).lower()
@@ -1214,6 +4025,298 @@ def generate_audio():
         print(f"generate_audio error: {e}")
         return jsonify({'error': 'Unable to generate audio. Please try again.'}), 500
 
+# --- Scheduled Pre-Generation ---
+# ⚡ Bolt: Opted-in users get their briefing and audio generated ahead of the time they usually open the
+# app, each at a stable point spread over the preceding hours, so the morning rush reads from the cache
+# instead of starting cold Gmail, Gemini and TTS pipelines at the same moment.
+PREGENERATE_BRIEFINGS = os.environ.get("PREGENERATE_BRIEFINGS", "false").lower() == "true"
+PREGENERATE_WINDOW_HOURS = float(os.environ.get("PREGENERATE_WINDOW_HOURS", 3))
+PREGENERATE_WORKERS = int(os.environ.get("PREGENERATE_WORKERS", 2))
+PREGENERATE_MIN_LEAD_SECONDS = 15 * 60
+PREGENERATE_TICK_SECONDS = 300
+# A pre-generated briefing stays cached until this long after the usual open time
+PREGENERATE_GRACE_SECONDS = 3600
+# Recent open times kept per user (one per UTC day), and how many are needed before we trust the average
+PREGENERATE_OPEN_HISTORY = 7
+PREGENERATE_MIN_OPENS = 3
+# Users whose open today is remembered in memory before yesterday's entries are pruned
+PREGENERATE_OPEN_DAYS_MAX_USERS = 10000
+
+def _usual_open_minute(open_minutes):
+    """Circular mean of recent open times (minutes after midnight UTC), or None without enough history."""
+    if len(open_minutes) < PREGENERATE_MIN_OPENS:
+        return None
+    angles = [2 * math.pi * m / 1440 for m in open_minutes]
+    mean = math.atan2(sum(math.sin(a) for a in angles), sum(math.cos(a) for a in angles))
+    return int(round(mean * 1440 / (2 * math.pi))) % 1440
+
+def _pregeneration_lead_seconds(email):
+    """Stable per-user lead time before the usual open, spread evenly over the pre-generation window."""
+    span = max(1, int(PREGENERATE_WINDOW_HOURS * 3600) - PREGENERATE_MIN_LEAD_SECONDS)
+    return PREGENERATE_MIN_LEAD_SECONDS + int(hashlib.sha256(email.encode()).hexdigest(), 16) % span
+
+def _next_open_ts(open_minute, now):
+    open_ts = now - now % 86400 + open_minute * 60
+    return open_ts if open_ts > now else open_ts + 86400
+
+class _BriefingSchedules:
+    """Opted-in users' pre-generation state: Gmail credentials, recent open times and last greeting.
+
+    Kept in Postgres when DATABASE_URL is set. Without a database the schedules live in memory
+    only, so refresh tokens are never written to local files. Refresh tokens are stored
+    encrypted either way (see _stored_credentials).
+    """
+
+    def __init__(self):
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def get(self, email):
+        if not DATABASE_URL:
+            with self._lock:
+                return copy.deepcopy(self._local.get(email))
+        try:
+            conn = get_db_connection()
+            try:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute("SELECT schedule FROM briefing_schedules WHERE user_email = %s", (email,))
+                row = cur.fetchone()
+                cur.close()
+            finally:
+                release_db_connection(conn)
+            return row['schedule'] if row else None
+        except Exception as e:
+            print(f"Error loading briefing schedule: {e}")
+            return None
+
+    def put(self, email, schedule):
+        if not DATABASE_URL:
+            with self._lock:
+                self._local[email] = copy.deepcopy(schedule)
+            return
+        try:
+            conn = get_db_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                    INSERT INTO briefing_schedules (user_email, schedule) VALUES (%s, %s)
+                    ON CONFLICT (user_email) DO UPDATE SET schedule = EXCLUDED.schedule;
+                """, (email, json.dumps(schedule)))
+                conn.commit()
+                cur.close()
+            finally:
+                release_db_connection(conn)
+        except Exception as e:
+            print(f"Error saving briefing schedule: {e}")
+
+    def delete(self, email):
+        if not DATABASE_URL:
+            with self._lock:
+                self._local.pop(email, None)
+            return
+        try:
+            conn = get_db_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("DELETE FROM briefing_schedules WHERE user_email = %s", (email,))
+                conn.commit()
+                cur.close()
+            finally:
+                release_db_connection(conn)
+        except Exception as e:
+            print(f"Error deleting briefing schedule: {e}")
+
+    def all(self):
+        if not DATABASE_URL:
+            with self._lock:
+                return copy.deepcopy(self._local)
+        try:
+            conn = get_db_connection()
+            try:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute("SELECT user_email, schedule FROM briefing_schedules")
+                rows = cur.fetchall()
+                cur.close()
+            finally:
+                release_db_connection(conn)
+            return {row['user_email']: row['schedule'] for row in rows}
+        except Exception as e:
+            print(f"Error loading briefing schedules: {e}")
+            return {}
+
+    def record(self, email, creds=None, open_ts=None, greeting=None):
+        """Update an opted-in user's schedule; users without one are ignored.
+
+        Only the first open of each UTC day is kept, so the usual open time follows the user's
+        daily habit rather than however many refreshes they made today.
+        """
+        schedule = self.get(email)
+        if schedule is None:
+            return
+        if creds and creds.get('refresh_token'):
+            schedule['credentials'] = _stored_credentials(creds)
+        if open_ts is not None:
+            open_day = int(open_ts // 86400)
+            if schedule.get('last_open_day') != open_day:
+                open_minute = int(open_ts % 86400) // 60
+                schedule['open_minutes'] = (schedule.get('open_minutes', []) + [open_minute])[-PREGENERATE_OPEN_HISTORY:]
+                schedule['last_open_day'] = open_day
+        if greeting:
+            schedule['greeting'] = greeting
+        self.put(email, schedule)
+
+    def drop_credentials(self, email):
+        """Pause pre-generation for a user until their next login stores fresh credentials."""
+        schedule = self.get(email)
+        if schedule is not None and schedule.pop('credentials', None) is not None:
+            self.put(email, schedule)
+
+_briefing_schedules = _BriefingSchedules()
+# Schedule writes happen on this thread, never on the request path
+_briefing_schedule_writer = _FairExecutor(1)
+# email -> UTC day of the open already recorded by this process, so repeat requests skip the write entirely
+_briefing_open_days = {}
+_briefing_open_days_lock = threading.Lock()
+
+def _record_briefing_open(email, creds):
+    """Record an opted-in user's first briefing request of the UTC day (and their current credentials) in the background."""
+    now = time.time()
+    day = int(now // 86400)
+    with _briefing_open_days_lock:
+        if _briefing_open_days.get(email) == day:
+            return
+        if len(_briefing_open_days) >= PREGENERATE_OPEN_DAYS_MAX_USERS:
+            for stale in [e for e, d in _briefing_open_days.items() if d != day]:
+                del _briefing_open_days[stale]
+        _briefing_open_days[email] = day
+    _briefing_schedule_writer.submit(anonymize_user(email), _briefing_schedules.record, email, creds=dict(creds), open_ts=now)
+
+def _schedule_cipher():
+    # Derived from the Flask secret key, so a leaked briefing_schedules table does not expose usable tokens
+    key = hashlib.sha256(f"briefing-schedules:{app.secret_key}".encode()).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+def _stored_credentials(creds):
+    # The access token is short-lived and is refreshed on use, so only what is needed to refresh it is kept
+    stored = {k: creds.get(k) for k in ('token_uri', 'client_id', 'scopes')}
+    stored['refresh_token'] = _schedule_cipher().encrypt(creds['refresh_token'].encode()).decode()
+    return stored
+
+def _schedule_credentials(stored):
+    """Credentials dict for a stored schedule, or None if the refresh token cannot be decrypted
+    (written under another secret key, or before tokens were encrypted)."""
+    try:
+        refresh_token = _schedule_cipher().decrypt(stored['refresh_token'].encode()).decode()
+    except (InvalidToken, KeyError, AttributeError):
+        return None
+    return dict(stored, refresh_token=refresh_token, token=None)
+
+def _set_pregeneration(email, enabled, creds):
+    """Opt a user in (storing their refresh token) or out (forgetting it)."""
+    if not enabled:
+        _briefing_schedules.delete(email)
+        return
+    if not creds or not creds.get('refresh_token'):
+        print(" * [Pregenerate] No refresh token in session; log in again to enable pre-generation")
+        return
+    schedule = _briefing_schedules.get(email) or {'open_minutes': []}
+    schedule['credentials'] = _stored_credentials(creds)
+    _briefing_schedules.put(email, schedule)
+
+def _pregenerate_briefing(email, schedule, open_ts):
+    """Run the briefing and audio pipeline for a user and leave the results in their caches."""
+    settings = load_settings(email)
+    if not settings.get('pregenerate_briefing'):
+        _briefing_schedules.delete(email)
+        return
+    creds_dict = _schedule_credentials(schedule['credentials'])
+    if creds_dict is None:
+        print(" * [Pregenerate] Stored credentials are unreadable; paused until the user logs in again")
+        _briefing_schedules.drop_credentials(email)
+        return
+    try:
+        creds_dict['token'] = _get_access_token(creds_dict)
+    except Exception as e:
+        if 'invalid_grant' in str(e).lower():
+            # Revoked or expired refresh token: retrying every day cannot succeed
+            print(" * [Pregenerate] Refresh token was revoked; paused until the user logs in again")
+            _briefing_schedules.drop_credentials(email)
+        else:
+            print(f" * [Pregenerate] Could not refresh credentials: {e}")
+        return
+    briefing_request = {
+        'email': email,
+        'user_info': {'email': email},
+        'settings': settings,
+        'cache_key': email,
+        'settings_hash': _briefing_stage_keys(settings)['filter'],
+        'creds_dict': creds_dict,
+    }
+    flight_key = (email, briefing_request['settings_hash'])
+    analysis, status = _briefing_flights.do(flight_key, lambda: _run_briefing(briefing_request))
+    if status != 200 or analysis.get('error'):
+        print(f" * [Pregenerate] Briefing failed with status {status}")
+        return
+    _extend_cached_analysis(email, briefing_request['settings_hash'], open_ts + PREGENERATE_GRACE_SECONDS)
+    if not analysis.get('story_groups') and not analysis.get('remaining_stories'):
+        return
+
+    style = settings.get('personality', 'anchor')
+    # The page sends its local greeting with the audio request; reuse the last one so the key matches
+    analysis_data = dict(analysis, greeting=schedule['greeting']) if schedule.get('greeting') else analysis
+    audio_key = _audio_cache_key(analysis_data, style)
+    script_text = generate_script_from_analysis(analysis_data, style)
+    audio_base64 = _audio_flights.do(audio_key, lambda: _synthesize_script(script_text, creds_dict, style, email, email))
+    if audio_base64:
+        _update_cached_audio(email, audio_key, audio_base64)
+    print(f" * [Pregenerate] Briefing ready {int(open_ts - time.time()) // 60} min before the usual open time")
+
+class _PregenerationScheduler:
+    """Background loop that starts each opted-in user's pre-generation once per usual open time."""
+
+    def __init__(self, schedules, pool, tick_seconds=PREGENERATE_TICK_SECONDS):
+        self._schedules = schedules
+        self._pool = pool
+        self._tick_seconds = tick_seconds
+        self._started_for = {}  # email -> open time already pre-generated for
+        self._thread = None
+
+    def due(self, now):
+        """(email, schedule, open_ts) for users whose pre-generation time has come."""
+        due = []
+        for email, schedule in self._schedules.all().items():
+            open_minute = _usual_open_minute(schedule.get('open_minutes', []))
+            if open_minute is None or not schedule.get('credentials'):
+                continue
+            open_ts = _next_open_ts(open_minute, now)
+            if open_ts - _pregeneration_lead_seconds(email) <= now and self._started_for.get(email) != open_ts:
+                due.append((email, schedule, open_ts))
+        return due
+
+    def run_pending(self, now=None):
+        now = time.time() if now is None else now
+        for email, schedule, open_ts in self.due(now):
+            self._started_for[email] = open_ts
+            self._pool.submit(anonymize_user(email), _pregenerate_briefing, email, schedule, open_ts)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="pregenerate", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self._tick_seconds)
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f" * [Pregenerate] Scheduler error: {e}")
+
+# Its own pool, so pre-generation never takes job workers from people waiting on a briefing
+_pregeneration_scheduler = _PregenerationScheduler(_briefing_schedules, _FairExecutor(PREGENERATE_WORKERS))
+if PREGENERATE_BRIEFINGS:
+    _pregeneration_scheduler.start()
+
 # --- Share Endpoints ---
 @app.route('/api/share', methods=['POST'])
 @limiter.limit("20 per day", key_func=get_user_email_for_rate_limit, error_message="You've reached your daily limit of 20 shared briefings.")
@@ -0,0 +1,58 @@
+"""
+scripts/benchmark_html_extractor.py
+-----------------------------------
+Compares optimize_newsletter_for_llm against the previous three-pass regex
+pipeline on the newsletter corpus in tests/fixtures/newsletters, both at
+their real size and padded out to ~400 KB (a long digest with inline CSS).
+
+Run from the project root:
+    python scripts/benchmark_html_extractor.py
+"""
+import os
+import re
+import html
+import sys
+import glob
+import timeit
+
+# Allow running from project root without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fixtures', 'newsletters')
+_RE_SCRIPT_STYLE = re.compile(r'<(script|style).*?>.*?</\1>', flags=re.IGNORECASE | re.DOTALL)
+_RE_HTML_TAGS = re.compile(r'<[^>]+>')
+
+
+def legacy_optimize(html_content, max_chars=15000, decode_entities=False):
+    no_scripts = _RE_SCRIPT_STYLE.sub('', html_content)
+    text_only = _RE_HTML_TAGS.sub(' ', no_scripts)
+    if decode_entities:
+        text_only = html.unescape(text_only)
+    return ' '.join(text_only.split())[:max_chars]
+
+
+def pad(html_content, target_size=400_000):
+    copies = max(1, target_size // len(html_content))
+    return html_content * copies
+
+
+def bench(label, html_content, number):
+    def best(fn):
+        return min(timeit.repeat(fn, number=number, repeat=5)) / number
+    legacy = best(lambda: legacy_optimize(html_content))
+    # The extractor also decodes entities, so compare against the old passes doing the same
+    legacy_decoded = best(lambda: legacy_optimize(html_content, decode_entities=True))
+    new = best(lambda: main.optimize_newsletter_for_llm(html_content))
+    print(f"{label:<34} {len(html_content) // 1024:>4} KB  legacy {legacy * 1e3:7.3f} ms  "
+          f"legacy+entities {legacy_decoded * 1e3:7.3f} ms  new {new * 1e3:7.3f} ms  x{legacy_decoded / new:4.1f}")
+
+
+if __name__ == '__main__':
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            html_content = f.read()
+        name = os.path.basename(path)
+        bench(name, html_content, number=200)
+        bench(f"{name} (padded)", pad(html_content), number=10)
@@ -0,0 +1,70 @@
+"""
+scripts/calibrate_token_estimator.py
+------------------------------------
+Fits the coefficients of main._estimate_tokens to Gemini's own tokenizer.
+
+Every document in the corpus (tests/fixtures/newsletters plus any extra
+directories of .html/.txt files given on the command line) is converted
+to LLM text, split into ~2,000 character samples, and counted with the
+model's count_tokens endpoint. A least-squares fit over the estimator's
+features is written to token_calibration.json, which main.py loads at
+startup.
+
+Run from the project root (needs GEMINI_API_KEY):
+    python scripts/calibrate_token_estimator.py [extra_corpus_dir ...]
+    python scripts/calibrate_token_estimator.py --check   # report error of the current coefficients
+"""
+import os
+import sys
+import glob
+import json
+
+import numpy as np
+
+# Allow running from project root without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fixtures', 'newsletters')
+SAMPLE_CHARS = 2000
+
+
+def load_samples(directories):
+    samples = []
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, '*.html')) + glob.glob(os.path.join(directory, '*.txt'))):
+            with open(path, encoding='utf-8') as f:
+                content = f.read()
+            text = main.optimize_newsletter_for_llm(content, max_chars=len(content)) if path.endswith('.html') else content
+            samples.extend(text[i:i + SAMPLE_CHARS] for i in range(0, len(text), SAMPLE_CHARS))
+    return [s for s in samples if s.strip()]
+
+
+def count_tokens(samples):
+    if not main.model:
+        sys.exit("GEMINI_API_KEY is not configured; the calibration needs Gemini's count_tokens.")
+    return [main.model.count_tokens(sample).total_tokens for sample in samples]
+
+
+def report(label, estimates, actual):
+    errors = np.abs(np.asarray(estimates, dtype=float) - actual) / np.maximum(actual, 1)
+    print(f"{label:<12} mean error {errors.mean() * 100:5.1f}%  worst {errors.max() * 100:5.1f}%  ({len(actual)} samples)")
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a != '--check']
+    samples = load_samples([CORPUS_DIR] + args)
+    actual = np.asarray(count_tokens(samples), dtype=float)
+    report('current', [main._estimate_tokens(s) for s in samples], actual)
+    if '--check' in sys.argv:
+        sys.exit(0)
+
+    features = np.array([[main._token_features(s)[k] for k in main._TOKEN_FEATURES] for s in samples], dtype=float)
+    solution, *_ = np.linalg.lstsq(features, actual, rcond=None)
+    coefficients = {k: round(max(0.0, float(c)), 4) for k, c in zip(main._TOKEN_FEATURES, solution)}
+    report('calibrated', features @ np.array([coefficients[k] for k in main._TOKEN_FEATURES]), actual)
+
+    with open(main.TOKEN_CALIBRATION_PATH, 'w') as f:
+        json.dump({'model': main.model.model_name, 'samples': len(samples), 'coefficients': coefficients}, f, indent=2)
+    print(f"Wrote {main.TOKEN_CALIBRATION_PATH}")
@@ -0,0 +1,208 @@
+"""
+tests/fake_gmail_server.py
+--------------------------
+A tiny in-process stand-in for the Gmail REST API so fetch code can be
+tested offline. It serves paginated `messages.list` searches, single
+`messages.get` calls, `profile`/`history.list` for incremental sync and
+multipart `/batch/gmail/v1` requests, streaming batch responses back in
+chunked parts.
+
+Usage:
+    with FakeGmailServer({'id1': message_resource}) as server:
+        main.GMAIL_API_BASE = server.base_url
+        main.GMAIL_BATCH_URL = server.batch_url
+"""
+import base64
+import json
+import re
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_RE_BOUNDARY = re.compile(r'boundary="?([^";]+)"?')
+_RE_CONTENT_ID = re.compile(r'Content-ID:\s*<([^>]+)>', re.IGNORECASE)
+_RE_REQUEST_LINE = re.compile(r'^GET (\S+)', re.MULTILINE)
+_RE_MESSAGE_PATH = re.compile(r'^/gmail/v1/users/me/messages/([^/?]+)')
+
+
+def make_message(message_id, sender, subject, html, internal_date=0):
+    """Build a minimal Gmail `format=full` message resource with a text/html part."""
+    data = base64.urlsafe_b64encode(html.encode('utf-8')).decode('ascii')
+    return {
+        'id': message_id,
+        'internalDate': str(internal_date),
+        'payload': {
+            'mimeType': 'multipart/alternative',
+            'headers': [
+                {'name': 'From', 'value': sender},
+                {'name': 'Subject', 'value': subject},
+            ],
+            'parts': [{'mimeType': 'text/html', 'body': {'data': data}}],
+        },
+    }
+
+
+class FakeGmailServer:
+    def __init__(self, messages=None, failing_ids=()):
+        self.messages = dict(messages or {})
+        self.failing_ids = set(failing_ids)
+        self.history_id = 1
+        # history.list entries, e.g. {'id': '2', 'messagesAdded': [{'message': {'id': 'm9', 'labelIds': ['INBOX']}}]}
+        self.history = []
+        self.history_expired = False
+        # When set, GETs must carry `Authorization: Bearer <token>` with one of these tokens or get a 401
+        self.valid_tokens = None
+        self.requests = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def batch_url(self):
+        return f"{self.base_url}/batch/gmail/v1"
+
+    def count(self, kind, contains=None):
+        with self._lock:
+            return sum(1 for k, path in self.requests if k == kind and (contains is None or contains in path))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _record(self, kind, path):
+        with self._lock:
+            self.requests.append((kind, path))
+
+    def _lookup(self, path):
+        match = _RE_MESSAGE_PATH.match(path)
+        message_id = match.group(1) if match else None
+        if message_id in self.failing_ids:
+            return 429, {'error': {'code': 429, 'message': 'Rate Limit Exceeded'}}
+        if message_id in self.messages:
+            message = self.messages[message_id]
+            if 'format=metadata' in path:
+                return 200, {
+                    'id': message['id'],
+                    'internalDate': message['internalDate'],
+                    'sizeEstimate': len(json.dumps(message)),
+                    'payload': {'headers': message['payload']['headers']},
+                }
+            return 200, message
+        return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+
+    def _list_page(self, query):
+        ids = list(self.messages)
+        page_size = int(query.get('maxResults', ['100'])[0])
+        start = int(query.get('pageToken', ['0'])[0])
+        page = {'messages': [{'id': mid, 'threadId': mid} for mid in ids[start:start + page_size]]}
+        if start + page_size < len(ids):
+            page['nextPageToken'] = str(start + page_size)
+        return page
+
+    def add_message(self, message, label_ids=('INBOX',)):
+        """Deliver a new message and record it in the mailbox history."""
+        self.messages[message['id']] = message
+        self.history_id += 1
+        self.history.append({
+            'id': str(self.history_id),
+            'messagesAdded': [{'message': {'id': message['id'], 'labelIds': list(label_ids)}}],
+        })
+
+    def _history_page(self, query):
+        start = int(query.get('startHistoryId', ['0'])[0])
+        return {
+            'history': [entry for entry in self.history if int(entry['id']) > start],
+            'historyId': str(self.history_id),
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == '/gmail/v1/users/me/messages':
+                    server._record('list', self.path)
+                    self._send_json(200, server._list_page(parse_qs(url.query)))
+                    return
+                if url.path == '/gmail/v1/users/me/profile':
+                    server._record('profile', self.path)
+                    self._send_json(200, {'emailAddress': 'me@example.com', 'historyId': str(server.history_id)})
+                    return
+                if url.path == '/gmail/v1/users/me/history':
+                    server._record('history', self.path)
+                    if server.history_expired:
+                        self._send_json(404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}})
+                    else:
+                        self._send_json(200, server._history_page(parse_qs(url.query)))
+                    return
+                server._record('get', self.path)
+                if server.valid_tokens is not None and \
+                        self.headers.get('Authorization', '').removeprefix('Bearer ') not in server.valid_tokens:
+                    self._send_json(401, {'error': {'code': 401, 'message': 'Invalid Credentials'}})
+                    return
+                status, payload = server._lookup(self.path)
+                self._send_json(status, payload)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                raw = self.rfile.read(length).decode('utf-8')
+                server._record('batch', raw)
+                match = _RE_BOUNDARY.search(self.headers.get('Content-Type', ''))
+                if self.path != '/batch/gmail/v1' or not match:
+                    self._send_json(400, {'error': 'bad batch request'})
+                    return
+                boundary = match.group(1)
+                out_boundary = 'batch_fake_response'
+                self.send_response(200)
+                self.send_header('Content-Type', f'multipart/mixed; boundary={out_boundary}')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for part in raw.split(f'--{boundary}'):
+                    content_id = _RE_CONTENT_ID.search(part)
+                    request_line = _RE_REQUEST_LINE.search(part)
+                    if not content_id or not request_line:
+                        continue
+                    status, payload = server._lookup(request_line.group(1))
+                    body = json.dumps(payload)
+                    # Each part is flushed on its own so the client sees a genuinely streamed response
+                    self._write_chunk(
+                        f'--{out_boundary}\r\n'
+                        f'Content-Type: application/http\r\n'
+                        f'Content-ID: <response-{content_id.group(1)}>\r\n\r\n'
+                        f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                        f'Content-Type: application/json; charset=UTF-8\r\n'
+                        f'Content-Length: {len(body)}\r\n\r\n'
+                        f'{body}\r\n'
+                    )
+                self._write_chunk(f'--{out_boundary}--\r\n')
+                self.wfile.write(b'0\r\n\r\n')
+
+            def _write_chunk(self, text):
+                data = text.encode('utf-8')
+                self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+                self.wfile.flush()
+
+        return Handler
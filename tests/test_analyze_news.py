@@ -74,10 +74,11 @@ class TestAnalyzeNewsWithLLM(unittest.TestCase):
         self.assertTrue("Gemini API model is not configured" in str(context.exception))
 
     def test_too_large_content(self):
-        # Length > 1500000
+        # Estimated tokens above the sharded-analysis ceiling
         large_text = "a" * 1500001
         main.model = self.mock_model
-        result = main.analyze_news_with_llm(large_text)
+        with patch('main.MAX_LLM_INPUT_TOKENS', 100000):
+            result = main.analyze_news_with_llm(large_text)
         self.assertEqual(result.get("error"), "Too much newsletter content to process at once. Please reduce your lookback window in settings.")
 
     def test_successful_analysis(self):
@@ -0,0 +1,129 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import threading
+import datetime
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Other test modules may have replaced requests with a MagicMock; these tests need real HTTP
+if 'requests' in sys.modules and not hasattr(sys.modules['requests'], '__file__'):
+    del sys.modules['requests']
+
+import main
+from tests.fake_gmail_server import FakeGmailServer, make_message
+
+
+class TestAsyncGmailEngine(unittest.TestCase):
+    def setUp(self):
+        self.messages = {
+            f"m{i}": make_message(f"m{i}", f"News {i} <news{i}@wsj.com>", f"Issue {i}", f"<p>Story number {i}</p>")
+            for i in range(30)
+        }
+
+    def _patch_server(self, server):
+        patchers = [
+            patch('main.GMAIL_API_BASE', server.base_url),
+            patch('main.GMAIL_FETCH_MODE', 'async'),
+            patch('main._get_access_token', return_value='token-123'),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_process_email_messages_over_async_engine(self):
+        with FakeGmailServer(self.messages, failing_ids={'m7'}) as server:
+            self._patch_server(server)
+            text, normal_count, priority_count, message_count = main._process_email_messages(
+                [{'id': mid} for mid in self.messages], {'token': 'x'}, [], ['news3@']
+            )
+            # One metadata GET per message, then a body GET for every message that survived
+            self.assertEqual(server.count('get', contains='format=metadata'), 30)
+            self.assertEqual(server.count('get', contains='format=full'), 29)
+            self.assertEqual(server.count('batch'), 0)
+        self.assertEqual(message_count, 30)
+        self.assertEqual((normal_count, priority_count), (28, 1))
+        self.assertTrue(text.startswith("*** PRIORITY SOURCE ***"))
+        self.assertNotIn("Subject: Issue 7 ---", text)
+        self.assertIn("Subject: Issue 8 ---", text)
+
+    def test_rejected_token_fails_the_briefing(self):
+        with FakeGmailServer(self.messages) as server:
+            server.valid_tokens = {'fresh-token'}
+            self._patch_server(server)
+            with self.assertRaises(Exception) as ctx:
+                main._process_email_messages([{'id': mid} for mid in self.messages], {'token': 'x'}, [], [])
+        payload, status = main._briefing_error(ctx.exception, None)
+        self.assertEqual(status, 401)
+
+    def test_rejected_token_is_refreshed_once_and_retried(self):
+        def access_token(creds_dict, force_refresh=False):
+            return 'fresh-token' if force_refresh else 'stale-token'
+
+        with FakeGmailServer(self.messages) as server:
+            server.valid_tokens = {'fresh-token'}
+            self._patch_server(server)
+            with patch('main._get_access_token', side_effect=access_token) as get_token:
+                _text, normal_count, _priority_count, _message_count = main._process_email_messages(
+                    [{'id': mid} for mid in self.messages], {'token': 'x'}, [], [])
+        self.assertEqual(normal_count, 30)
+        self.assertEqual([c.kwargs.get('force_refresh', False) for c in get_token.call_args_list], [False, True])
+
+    def test_token_is_refreshed_only_without_a_valid_expiry(self):
+        class FakeCredentials:
+            def __init__(self, expiry):
+                self.token, self.expiry, self.refreshed = 'stale-token', expiry, 0
+
+            @property
+            def valid(self):
+                return self.expiry is None or self.expiry > datetime.datetime.utcnow()
+
+            def refresh(self, request):
+                self.refreshed += 1
+                self.token, self.expiry = 'fresh-token', datetime.datetime(2030, 1, 1)
+
+        for expiry, refreshes in ((None, 1), (datetime.datetime(2000, 1, 1), 1), (datetime.datetime(2030, 1, 1), 0)):
+            creds = FakeCredentials(expiry)
+            creds_dict = {'token': 'stale-token'}
+            with patch('main.get_credentials_from_session', return_value=creds):
+                token = main._get_access_token(creds_dict)
+            self.assertEqual(creds.refreshed, refreshes)
+            if refreshes:
+                # The refreshed token and its expiry are kept for the next call
+                self.assertEqual((token, creds_dict), ('fresh-token', {'token': 'fresh-token', 'expiry': '2030-01-01T00:00:00'}))
+            else:
+                self.assertEqual((token, creds_dict), ('stale-token', {'token': 'stale-token'}))
+
+    def test_engine_and_client_are_shared(self):
+        engine = main._get_async_engine()
+        self.assertIs(main._get_async_engine(), engine)
+        with FakeGmailServer(self.messages) as server:
+            self._patch_server(server)
+            first = engine.submit(main._fetch_messages_async, ([0, 1], ['m0', 'm1'], main._AccessToken({}))).result(timeout=10)
+            second = engine.submit(main._fetch_metadata_async, ([2], ['m2'], main._AccessToken({}))).result(timeout=10)
+        self.assertEqual([record['id'] for _index, record in first], ['m0', 'm1'])
+        self.assertEqual(second[0][1]['subject'], 'Issue 2')
+        self.assertIs(main._get_async_engine().client, engine.client)
+
+    def test_messages_are_parsed_off_the_event_loop(self):
+        threads = []
+
+        def parse(msg):
+            threads.append(threading.current_thread().name)
+            return main._parse_gmail_metadata(msg)
+
+        engine = main._get_async_engine()
+        with FakeGmailServer(self.messages) as server:
+            self._patch_server(server)
+            result = engine.submit(
+                lambda args: main._fetch_messages_async(args, parse=parse), ([0, 1], ['m0', 'm1'], main._AccessToken({}))
+            ).result(timeout=10)
+        self.assertEqual([record['id'] for _index, record in result], ['m0', 'm1'])
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn('gmail-async-engine', threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from unittest.mock import patch
+import json
+import tempfile
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+HEADER = "Morning Digest: your five-minute read on markets and tech."
+FOOTER = "You are receiving this because you signed up at example.com. Unsubscribe or update your preferences."
+SPONSOR = "This issue is brought to you by Budgetly, the budgeting app three million people use."
+
+
+def _issue(n):
+    return f"{HEADER} Story {n}: the council voted {n} to 2 on the riverside park budget. {SPONSOR} {FOOTER}"
+
+
+class TestBoilerplateModels(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'boilerplate.json')
+        for p in (patch('main.BOILERPLATE_FILE', self.path), patch('main.DATABASE_URL', None)):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_recurring_sentences_are_stripped_after_enough_issues(self):
+        models = main._BoilerplateModels()
+        sender = 'Morning Digest <news@digest.example>'
+        for n in range(3):
+            self.assertEqual(models.strip(sender, f"issue {n}", _issue(n)), _issue(n))
+        self.assertEqual(models.strip(sender, "issue 3", _issue(3)),
+                         "Story 3: the council voted 3 to 2 on the riverside park budget.")
+        # Other senders have their own model
+        self.assertEqual(models.strip('Other <a@other.example>', "issue 3", _issue(3)), _issue(3))
+
+    def test_same_issue_in_many_mailboxes_counts_once(self):
+        models = main._BoilerplateModels()
+        for _ in range(5):
+            models.strip('news@digest.example', "same issue", _issue(1))
+        self.assertEqual(models.strip('news@digest.example', "same issue", _issue(1)), _issue(1))
+
+    def test_models_survive_restart(self):
+        models = main._BoilerplateModels()
+        for n in range(3):
+            models.strip('news@digest.example', f"issue {n}", _issue(n))
+        models.flush()
+        with open(self.path) as f:
+            stored = f.read()
+        self.assertIn(main._boilerplate_key('news@digest.example'), json.loads(stored))
+        # Neither the sender address nor the subject|day issue keys are written out verbatim
+        self.assertNotIn('digest.example', stored)
+        self.assertNotIn('issue 0', stored)
+        restarted = main._BoilerplateModels()
+        self.assertNotIn(FOOTER, restarted.strip('news@digest.example', "issue 9", _issue(9)))
+
+    def test_flush_writes_only_changed_models(self):
+        models = main._BoilerplateModels()
+        with patch('main.BOILERPLATE_MAX_SENDERS', 1):
+            models.strip('news@digest.example', "issue 0", _issue(0))
+            models.flush()
+            # A second sender evicts the first from memory; its stored model is kept
+            models.strip('news@other.example', "issue 0", _issue(0))
+            models.flush()
+        with open(self.path) as f:
+            stored = json.load(f)
+        self.assertEqual(set(stored), {main._boilerplate_key('news@digest.example'),
+                                       main._boilerplate_key('news@other.example')})
+        # An issue that was already counted changes nothing, so nothing is written
+        models.strip('news@other.example', "issue 0", _issue(0))
+        with patch('main.os.replace') as replace:
+            models.flush()
+        replace.assert_not_called()
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_fingerprints_are_bounded(self):
+        models = main._BoilerplateModels()
+        with patch('main.BOILERPLATE_MAX_FINGERPRINTS', 10):
+            for n in range(20):
+                models.strip('news@digest.example', f"issue {n}", _issue(n))
+            model = models._get_model(main._boilerplate_key('news@digest.example'))
+        self.assertLessEqual(len(model['fingerprints']), 10)
+        self.assertNotIn(SPONSOR, models.strip('news@digest.example', "issue 99", _issue(99)))
+
+    def test_parse_strips_before_truncating(self):
+        with patch('main._boilerplate_models', main._BoilerplateModels()):
+            for n in range(3):
+                main._boilerplate_models.strip('news@digest.example', f"old {n}", _issue(n))
+            body = "<p>" + _issue(7) + "</p>"
+            msg = {'id': 'm7', 'internalDate': '0', 'payload': {
+                'mimeType': 'text/html',
+                'headers': [{'name': 'From', 'value': 'Digest <news@digest.example>'}, {'name': 'Subject', 'value': 'Issue 7'}],
+                'body': {'data': main.base64.urlsafe_b64encode(body.encode()).decode()},
+            }}
+            record = main._parse_gmail_message(msg)
+        self.assertEqual(record['text'], "Story 7: the council voted 7 to 2 on the riverside park budget.")
+
+    def test_database_read_happens_outside_the_lock(self):
+        models = main._BoilerplateModels()
+        stored = {'issues': [], 'fingerprints': {main._sentence_fingerprint(SPONSOR): 5}}
+
+        def load_db(sender_key):
+            self.assertFalse(models._lock.locked())
+            return stored
+
+        with patch('main.DATABASE_URL', 'postgres://example'), patch.object(models, '_load_db', side_effect=load_db) as load:
+            self.assertNotIn(SPONSOR, models.strip('news@digest.example', "issue 1", _issue(1)))
+            models.strip('news@digest.example', "issue 2", _issue(2))
+        # Loaded once, then served from memory
+        self.assertEqual(load.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import sys
+import os
+import threading
+import limits
+import limits.storage
+import limits.strategies
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+ANALYSIS = {'story_groups': [{'group_headline': 'Rates hold', 'stories': []}],
+            'remaining_stories': [{'headline': 'Storm moves north'}]}
+REQUEST = {'email': None, 'user_info': {}, 'settings': {}, 'cache_key': 'u', 'settings_hash': 'h', 'creds_dict': {}}
+BRIEFING = {'email': None, 'cache_key': 'u', 'settings_hash': 'h', 'hours': 24, 'message_count': 2,
+            'normal_count': 2, 'priority_count': 0, 'text': 'Valid newsletter text', 'fingerprint': 'f',
+            'message_set': 'm', 'identifiers': []}
+
+
+class TestBriefingJobs(unittest.TestCase):
+    def test_same_briefing_attaches_to_the_queued_job(self):
+        jobs = main._BriefingJobs(ttl_seconds=60)
+        job, created = jobs.create('owner', ('u', 'h'))
+        again, created_again = jobs.create('owner', ('u', 'h'))
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertIs(again, job)
+        jobs.append(job, {'type': 'result', 'data': ANALYSIS})
+        self.assertIsNot(jobs.create('owner', ('u', 'h'))[0], job)
+
+    def test_unfinished_jobs_count_against_the_daily_limit(self):
+        storage = limits.storage.MemoryStorage()
+        limit_charge = [(limits.parse('3 per day'), ['u', 'scope'])]
+        jobs = main._BriefingJobs(ttl_seconds=60)
+        with patch('main.limiter') as limiter:
+            limiter.limiter = limits.strategies.FixedWindowRateLimiter(storage)
+            main._charge_briefing_limit(limit_charge)
+
+            def admit(in_flight):
+                return main._briefing_limit_allows(limit_charge, in_flight)
+
+            first, _created = jobs.create('owner', ('u', 'h1'), admit=admit)
+            second, _created = jobs.create('owner', ('u', 'h2'), admit=admit)
+            # One briefing charged and two running use up "3 per day", whatever their settings
+            self.assertEqual(jobs.create('owner', ('u', 'h3'), admit=admit), (None, False))
+            # Joining a queued job is still allowed, and a failed job frees its slot
+            self.assertIs(jobs.create('owner', ('u', 'h1'), admit=admit)[0], first)
+            jobs.append(second, {'type': 'error', 'error': 'failed', 'status': 503})
+            self.assertTrue(jobs.create('owner', ('u', 'h3'), admit=admit)[1])
+            self.assertTrue(jobs.create('someone-else', ('v', 'h1'), admit=lambda in_flight: in_flight == 0)[1])
+
+    def test_jobs_are_private_to_their_owner(self):
+        jobs = main._BriefingJobs(ttl_seconds=60)
+        job, _created = jobs.create('owner', ('u', 'h'))
+        self.assertIs(jobs.get(job.id, 'owner'), job)
+        self.assertIsNone(jobs.get(job.id, 'someone-else'))
+        self.assertIsNone(jobs.get('missing', 'owner'))
+
+    def test_poll_returns_only_new_events_and_wakes_on_append(self):
+        jobs = main._BriefingJobs(ttl_seconds=60)
+        job, _created = jobs.create('owner', ('u', 'h'))
+        jobs.append(job, {'type': 'story_group', 'data': ANALYSIS['story_groups'][0]})
+        self.assertEqual(jobs.poll(job, 1, 0), ('queued', []))
+
+        timer = threading.Timer(0.05, jobs.append, (job, {'type': 'result', 'data': ANALYSIS}))
+        timer.start()
+        status, events = jobs.poll(job, 1, 5)
+        timer.join()
+        self.assertEqual((status, events), ('done', [{'type': 'result', 'data': ANALYSIS}]))
+
+    def test_finished_jobs_expire(self):
+        jobs = main._BriefingJobs(ttl_seconds=60)
+        with patch('main.time.monotonic', return_value=1000):
+            job, _created = jobs.create('owner', ('u', 'h'))
+            jobs.append(job, {'type': 'result', 'data': ANALYSIS})
+        with patch('main.time.monotonic', return_value=1059):
+            self.assertIs(jobs.get(job.id, 'owner'), job)
+        with patch('main.time.monotonic', return_value=1061):
+            self.assertIsNone(jobs.get(job.id, 'owner'))
+
+
+class TestRunBriefingJob(unittest.TestCase):
+    def setUp(self):
+        self.jobs = main._BriefingJobs(ttl_seconds=60)
+        self.job, _created = self.jobs.create('owner', ('u', 'h'))
+        patchers = (patch('main._briefing_jobs', self.jobs),
+                    patch('main._briefing_flights', main._SingleFlight(timeout_seconds=30)),
+                    patch('main.model', MagicMock()), patch('main.genai'),
+                    patch('main._update_cached_analysis'), patch('main._shared_analysis_cache'),
+                    patch('main.limiter'),
+                    patch('main.ResourceExhausted', type('ResourceExhausted', (Exception,), {})),
+                    patch('main.InvalidArgument', type('InvalidArgument', (Exception,), {})))
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_job_records_stories_then_the_result(self):
+        response = MagicMock()
+        response.candidates = [MagicMock(finish_reason=1)]
+        text = json.dumps(ANALYSIS)
+        response.__iter__ = lambda _self: iter([MagicMock(text=text[:40]), MagicMock(text=text[40:])])
+        main.model.generate_content.return_value = response
+        with patch('main._prepare_briefing', return_value=(BRIEFING, None)):
+            main._run_briefing_job(self.job, REQUEST, [('3 per day', ['u', 'scope'])])
+        self.assertEqual([e['type'] for e in self.job.events], ['story_group', 'remaining_story', 'result'])
+        self.assertEqual(self.job.events[-1]['data'], ANALYSIS)
+        self.assertEqual(self.job.status, 'done')
+        main.limiter.limiter.hit.assert_called_once_with('3 per day', 'u', 'scope')
+
+    def test_failed_briefings_are_not_charged(self):
+        main.model.generate_content.side_effect = Exception("Some quota error")
+        with patch('main._prepare_briefing', return_value=(BRIEFING, None)):
+            main._run_briefing_job(self.job, REQUEST, [('3 per day', ['u', 'scope'])])
+        self.assertEqual(self.job.events[-1]['status'], 503)
+        main.limiter.limiter.hit.assert_not_called()
+
+    def test_answered_requests_finish_with_their_status(self):
+        reply = ({'error': 'Your session expired. Please log in again.'}, 401)
+        with patch('main._prepare_briefing', return_value=(None, reply)):
+            main._run_briefing_job(self.job, REQUEST)
+        self.assertEqual(self.job.events, [{'type': 'error', 'error': 'Your session expired. Please log in again.', 'status': 401}])
+
+    def test_unexpected_errors_still_finish_the_job(self):
+        with patch('main._prepare_briefing', side_effect=RuntimeError("boom")):
+            main._run_briefing_job(self.job, REQUEST)
+        self.assertEqual(self.job.events[-1]['type'], 'error')
+        self.assertEqual(self.job.events[-1]['status'], 500)
+        self.assertEqual(self.jobs.create('owner', ('u', 'h'))[1], True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Other test modules may have replaced requests with a MagicMock; these tests need real HTTP
+if 'requests' in sys.modules and not hasattr(sys.modules['requests'], '__file__'):
+    del sys.modules['requests']
+import requests
+
+import main
+from tests.fake_gmail_server import FakeGmailServer, make_message
+from tests.test_near_duplicates import _article
+
+
+def _item(text, sender='News <news@example.com>', subject='Daily', date=0, is_priority=False, original=None):
+    record = {'sender': sender, 'subject': subject, 'date': date, 'text': original or text}
+    return {'is_priority': is_priority, 'record': record, 'text': text}
+
+
+class TestAllocateTokenBudget(unittest.TestCase):
+    def test_everything_fits_whole(self):
+        self.assertEqual(main._allocate_token_budget([100, 200, 300], [1, 1, 1], 1000), [100, 200, 300])
+
+    def test_small_items_keep_full_size_and_leftover_goes_to_large(self):
+        allocation = main._allocate_token_budget([100, 5000, 5000], [1, 1, 1], 2100)
+        self.assertEqual(allocation[0], 100)
+        self.assertEqual(allocation[1], allocation[2])
+        self.assertLessEqual(sum(allocation), 2100)
+        self.assertGreaterEqual(sum(allocation), 2098)
+
+    def test_weights_skew_the_split(self):
+        allocation = main._allocate_token_budget([5000, 5000], [3, 1], 2000)
+        self.assertEqual(allocation, [1500, 500])
+
+    def test_starved_items_are_dropped_lowest_weight_first(self):
+        allocation = main._allocate_token_budget([5000, 5000, 5000], [2, 1, 0.5], 500, min_tokens=150)
+        self.assertEqual(allocation, [333, 166, 0])
+
+
+class TestTrimAndWeights(unittest.TestCase):
+    def test_trim_ends_on_sentence(self):
+        text = "First sentence here. Second sentence is longer than the first one. Third sentence ends it."
+        expected = "First sentence here. Second sentence is longer than the first one. [...]"
+        trimmed = main._trim_to_tokens(text, main._estimate_tokens(expected))
+        self.assertEqual(trimmed, expected)
+        self.assertEqual(main._trim_to_tokens("short", 10), "short")
+
+    def test_priority_keywords_and_recency_raise_weight(self):
+        plain, priority, keyword, old = main._newsletter_weights([
+            _item("Rates story", date=100),
+            _item("Rates story", date=100, is_priority=True),
+            _item("Chip factory story", date=100),
+            _item("Rates story", date=0),
+        ], ['chip'])
+        self.assertGreater(priority, plain)
+        self.assertGreater(keyword, plain)
+        self.assertLess(old, plain)
+
+    def test_mostly_duplicated_newsletter_weighs_less(self):
+        full, collapsed = main._newsletter_weights([
+            _item("x" * 1000), _item("[...] " + "x" * 200, original="x" * 1000),
+        ], [])
+        self.assertLess(collapsed, full)
+
+
+class TestBudgetInPipeline(unittest.TestCase):
+    def test_newsletters_are_trimmed_to_fit_instead_of_cut(self):
+        messages = {
+            f"m{i}": make_message(f"m{i}", f"News {i} <news{i}@wsj.com>", f"Issue {i}", f"<p>{_article(i)}</p>", i)
+            for i in range(3)
+        }
+        with FakeGmailServer(messages) as server:
+            for p in (patch('main.GMAIL_API_BASE', server.base_url), patch('main.GMAIL_BATCH_URL', server.batch_url),
+                      patch('main.GMAIL_FETCH_MODE', 'batch'),
+                      patch('main._get_auth_session', return_value=requests.Session())):
+                p.start()
+                self.addCleanup(p.stop)
+            issue_sources, untrimmed_sources = [], []
+            text, normal_count, priority_count, _message_count = main._process_email_messages(
+                [{'id': mid} for mid in messages], {'token': 'x'}, [], ['news0@'], token_budget=1200, issue_sources=issue_sources
+            )
+            untrimmed, *_counts = main._process_email_messages(
+                [{'id': mid} for mid in messages], {'token': 'x'}, [], ['news0@'], issue_sources=untrimmed_sources
+            )
+        self.assertEqual((normal_count, priority_count), (2, 1))
+        # Issue sources follow the message, not how far this user's copy was trimmed
+        self.assertNotEqual(text, untrimmed)
+        self.assertEqual(len(issue_sources), 3)
+        self.assertEqual(issue_sources, untrimmed_sources)
+        self.assertNotIn(' [...]', ''.join(issue_text for _key, issue_text in issue_sources))
+        self.assertLessEqual(main._estimate_tokens(text), 1200)
+        self.assertGreaterEqual(text.count(' [...]'), 2)
+        # The priority source gets the largest share
+        first, *rest = text.split('*** PRIORITY SOURCE ***')[1].split('--- Newsletter from:')[1:]
+        self.assertTrue(all(len(first) > len(other) for other in rest))
+
+
+if __name__ == '__main__':
+    unittest.main()
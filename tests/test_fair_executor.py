@@ -0,0 +1,69 @@
+import unittest
+import threading
+import time
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+
+class TestFairExecutor(unittest.TestCase):
+    def _blocked_pool(self, max_workers=1):
+        pool = main._FairExecutor(max_workers)
+        gate = threading.Event()
+        blocker = pool.submit('blocker', gate.wait)
+        return pool, gate, blocker
+
+    def test_users_are_served_round_robin(self):
+        pool, gate, blocker = self._blocked_pool()
+        order = []
+        heavy = [pool.submit('heavy', order.append, f"heavy{i}") for i in range(10)]
+        light = [pool.submit('light', order.append, f"light{i}") for i in range(2)]
+        gate.set()
+        for future in [blocker] + heavy + light:
+            future.result(timeout=5)
+        # The light user's work is interleaved instead of waiting behind all ten heavy tasks
+        self.assertLess(order.index('light1'), 5)
+        self.assertEqual([o for o in order if o.startswith('heavy')], [f"heavy{i}" for i in range(10)])
+
+    def test_costly_tasks_use_up_more_credit(self):
+        pool, gate, blocker = self._blocked_pool()
+        order = []
+        big = [pool.submit('big', order.append, f"big{i}", cost=3) for i in range(2)]
+        small = [pool.submit('small', order.append, f"small{i}") for i in range(4)]
+        gate.set()
+        for future in [blocker] + big + small:
+            future.result(timeout=5)
+        self.assertLess(order.index('small2'), order.index('big1'))
+
+    def test_thread_count_is_bounded_and_stats_reported(self):
+        pool, gate, blocker = self._blocked_pool(max_workers=3)
+        futures = [pool.for_user(f"user{i % 4}").submit(gate.wait, 5) for i in range(20)]
+        deadline = time.monotonic() + 5
+        while pool.stats()['active'] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stats = pool.stats()
+        self.assertEqual(stats['threads'], 3)
+        self.assertEqual(stats['queued'], 18)
+        self.assertEqual(stats['queued_users'], 4)
+        gate.set()
+        for future in [blocker] + futures:
+            future.result(timeout=5)
+        stats = pool.stats()
+        self.assertEqual(stats['threads'], 3)
+        self.assertEqual((stats['queued'], stats['completed']), (0, 21))
+        self.assertIn('wait_ms_p95', stats)
+
+    def test_exceptions_propagate_to_future(self):
+        pool = main._FairExecutor(2)
+        future = pool.submit('u', lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            future.result(timeout=5)
+        self.assertEqual(list(pool.for_user('u').map(lambda x: x * 2, [1, 2, 3])), [2, 4, 6])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Other test modules may have replaced requests with a MagicMock; these tests need real HTTP
+if 'requests' in sys.modules and not hasattr(sys.modules['requests'], '__file__'):
+    del sys.modules['requests']
+import requests
+
+import main
+from tests.fake_gmail_server import FakeGmailServer, make_message
+
+
+class TestGmailBatchFetch(unittest.TestCase):
+    def setUp(self):
+        self.messages = {
+            f"m{i}": make_message(f"m{i}", f"News {i} <news{i}@wsj.com>", f"Issue {i}", f"<p>Story number {i}</p>")
+            for i in range(5)
+        }
+
+    def _patch_server(self, server):
+        patchers = [
+            patch('main.GMAIL_API_BASE', server.base_url),
+            patch('main.GMAIL_BATCH_URL', server.batch_url),
+            patch('main.GMAIL_FETCH_MODE', 'batch'),
+            patch('main._get_auth_session', return_value=requests.Session()),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_iter_gmail_batch_streams_all_parts(self):
+        with FakeGmailServer(self.messages) as server:
+            self._patch_server(server)
+            parts = list(main._iter_gmail_batch(requests.Session(), list(self.messages)))
+        self.assertEqual([offset for offset, _status, _msg in parts], [0, 1, 2, 3, 4])
+        self.assertTrue(all(status == 200 for _offset, status, _msg in parts))
+        self.assertEqual(parts[2][2]['id'], 'm2')
+
+    def test_multipart_parser_handles_split_delimiters(self):
+        stream = b'--b\r\nContent-ID: <response-item0>\r\n\r\nHTTP/1.1 200 OK\r\n\r\n{"id": "a"}\r\n--b--\r\n'
+        chunks = [stream[i:i + 3] for i in range(0, len(stream), 3)]
+        parts = [main._parse_batch_part(p) for p in main._iter_multipart_parts(chunks, 'b')]
+        self.assertEqual(parts, [(0, 200, {'id': 'a'})])
+
+    def test_process_email_messages_uses_batch_requests(self):
+        with FakeGmailServer(self.messages) as server:
+            self._patch_server(server)
+            text, normal_count, priority_count, _message_count = main._process_email_messages(
+                [{'id': mid} for mid in self.messages], {'token': 'x'}, [], ['news3@']
+            )
+            # One metadata batch and one full-body batch, no per-message GETs
+            self.assertEqual(server.count('batch'), 2)
+            self.assertEqual(server.count('batch', contains='format=full'), 1)
+            self.assertEqual(server.count('get'), 0)
+        self.assertEqual((normal_count, priority_count), (4, 1))
+        self.assertTrue(text.startswith("*** PRIORITY SOURCE ***"))
+        self.assertIn("Story number 0", text)
+
+    def test_failed_parts_fall_back_to_single_fetch(self):
+        with FakeGmailServer(self.messages, failing_ids={'m1'}) as server:
+            self._patch_server(server)
+            results = main._fetch_message_batch(([0, 1], ['m0', 'm1'], {'token': 'x'}))
+            self.assertEqual(server.count('get'), 1)
+        self.assertEqual([index for index, _record in results], [0, 1])
+        self.assertIsNotNone(results[0][1])
+        self.assertIsNone(results[1][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Other test modules may have replaced requests with a MagicMock; these tests need real HTTP
+if 'requests' in sys.modules and not hasattr(sys.modules['requests'], '__file__'):
+    del sys.modules['requests']
+import requests
+
+import main
+from tests.fake_gmail_server import FakeGmailServer, make_message
+
+
+def _now_ms(hours_ago=0):
+    return int((time.time() - hours_ago * 3600) * 1000)
+
+
+class TestIncrementalGmailSync(unittest.TestCase):
+    def setUp(self):
+        main._gmail_sync_states.clear()
+        main._message_cache.clear()
+        self.server = FakeGmailServer({
+            f"m{i}": make_message(f"m{i}", "WSJ <news@wsj.com>", f"Issue {i}", f"<p>Story {i}</p>", _now_ms(1))
+            for i in range(3)
+        })
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        patchers = [
+            patch('main._get_auth_session', side_effect=lambda creds_dict: requests.Session()),
+            patch('main.GMAIL_API_BASE', self.server.base_url),
+            patch('main.GMAIL_BATCH_URL', self.server.batch_url),
+            patch('main.GMAIL_FETCH_MODE', 'batch'),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _briefing(self, hours=24, before_commit=None):
+        messages, sync = main._sync_gmail_messages(None, 'user@example.com', ['wsj.com'], hours)
+        text, _normal, _priority, count = main._process_email_messages(
+            messages, {}, [], [], record_store=sync['records'], message_dates=sync['dates'])
+        if before_commit:
+            before_commit()
+        main._commit_gmail_sync(sync)
+        return text, count
+
+    def test_first_briefing_runs_full_search(self):
+        text, count = self._briefing()
+        self.assertEqual(count, 3)
+        self.assertEqual(self.server.count('list'), 1)
+        self.assertEqual(self.server.count('history'), 0)
+        self.assertEqual(main._gmail_sync_states['user@example.com']['history_id'], '1')
+
+    def test_cold_sync_streams_the_search(self):
+        with patch('main.GMAIL_SEARCH_PAGE_SIZE', 1):
+            messages, _sync = main._sync_gmail_messages(None, 'user@example.com', ['wsj.com'], 24)
+            self.assertEqual(self.server.count('list'), 0)
+            self.assertEqual(next(messages)['id'], 'm0')
+            # Later pages are only requested once the fetch pipeline asks for them
+            self.assertEqual(self.server.count('list'), 1)
+            self.assertEqual([m['id'] for m in messages], ['m1', 'm2'])
+        self.assertEqual(self.server.count('list'), 3)
+
+    def test_repeat_briefing_fetches_only_new_mail(self):
+        self._briefing()
+        fetched_before = self.server.count('batch')
+        self.server.add_message(make_message('m3', 'WSJ <news@wsj.com>', 'Issue 3', '<p>Story 3</p>', _now_ms()))
+        self.server.add_message(make_message('x1', 'Shop <deals@shop.com>', 'Sale', '<p>Buy</p>', _now_ms()))
+
+        text, count = self._briefing()
+
+        self.assertEqual(count, 4)
+        self.assertEqual(self.server.count('list'), 1)
+        self.assertEqual(self.server.count('history'), 1)
+        # One metadata batch to check the new senders and one full batch for the single new newsletter
+        self.assertEqual(self.server.count('batch') - fetched_before, 2)
+        self.assertEqual(self.server.count('batch', contains='format=full'), 2)
+        self.assertIn('Story 3', text)
+        self.assertNotIn('Buy', text)
+        self.assertIn('Story 0', text)
+
+    def test_aged_out_messages_are_dropped(self):
+        self.server.messages['old'] = make_message('old', 'WSJ <news@wsj.com>', 'Old', '<p>Old story</p>', _now_ms(30))
+        self._briefing(hours=48)
+        text, count = self._briefing(hours=24)
+        self.assertNotIn('Old story', text)
+        self.assertEqual(count, 3)
+        self.assertNotIn('old', main._gmail_sync_states['user@example.com']['dates'])
+
+    def test_expired_history_falls_back_to_full_search(self):
+        self._briefing()
+        self.server.history_expired = True
+        _text, count = self._briefing()
+        self.assertEqual(count, 3)
+        self.assertEqual(self.server.count('list'), 2)
+        # Records from the first briefing are reused, so nothing is downloaded again
+        self.assertEqual(self.server.count('batch', contains='format=full'), 1)
+
+    def test_failed_fetch_forces_full_search(self):
+        self.server.failing_ids.add('m1')
+        text, _count = self._briefing()
+        self.assertNotIn('Story 1', text)
+        self.assertIsNone(main._gmail_sync_states['user@example.com']['history_id'])
+
+        self.server.failing_ids.clear()
+        text, _count = self._briefing()
+        self.assertIn('Story 1', text)
+        self.assertEqual(self.server.count('list'), 2)
+        self.assertEqual(main._gmail_sync_states['user@example.com']['history_id'], '1')
+
+    def test_failed_metadata_part_is_listed_again(self):
+        self._briefing()
+        self.server.add_message(make_message('m3', 'WSJ <news@wsj.com>', 'Issue 3', '<p>Story 3</p>', _now_ms()))
+        self.server.failing_ids.add('m3')
+        text, _count = self._briefing()
+        self.assertNotIn('Story 3', text)
+        # The batch part and the single-message retry both failed
+        self.assertEqual(self.server.count('get', contains='m3?format=metadata'), 1)
+        self.assertIsNone(main._gmail_sync_states['user@example.com']['history_id'])
+
+        self.server.failing_ids.clear()
+        text, count = self._briefing()
+        self.assertIn('Story 3', text)
+        self.assertEqual(count, 4)
+        self.assertEqual(self.server.count('list'), 2)
+
+    def test_evicted_records_stay_in_sync_state(self):
+        self._briefing(before_commit=main._message_cache.clear)
+        state = main._gmail_sync_states['user@example.com']
+        self.assertEqual(set(state['dates']), {'m0', 'm1', 'm2'})
+        self.assertEqual(state['history_id'], '1')
+
+        text, count = self._briefing()
+        self.assertEqual(count, 3)
+        self.assertEqual(self.server.count('list'), 1)
+        # The evicted records are downloaded again through the incremental path
+        self.assertIn('Story 0', text)
+
+    def test_cache_check_lists_only_new_mail_once_warm(self):
+        self._briefing()
+        self.server.add_message(make_message('m3', 'WSJ <news@wsj.com>', 'Issue 3', '<p>Story 3</p>', _now_ms()))
+        request = {'cache_key': 'user@example.com', 'settings_hash': 'h', 'creds_dict': {},
+                   'settings': {'sources': ['wsj.com'], 'time_window_hours': 24}}
+        with patch('main._check_cached_analysis', return_value={'story_groups': []}):
+            main._cached_briefing(request)
+        self.assertEqual((self.server.count('list'), self.server.count('profile')), (1, 1))
+        self.assertEqual(self.server.count('history'), 1)
+        self.assertEqual(request['message_set'], main._message_set_fingerprint(['m0', 'm1', 'm2', 'm3']))
+        # A hit saves the advanced history state, so the next check starts from there
+        state = main._gmail_sync_states['user@example.com']
+        self.assertEqual(set(state['dates']), {'m0', 'm1', 'm2', 'm3'})
+        self.assertIsNotNone(state['history_id'])
+
+    def test_changed_sources_trigger_full_search(self):
+        self._briefing()
+        messages, sync = main._sync_gmail_messages(None, 'user@example.com', ['wsj.com', 'axios.com'], 24)
+        list(messages)
+        self.assertEqual(self.server.count('history'), 0)
+        self.assertEqual(self.server.count('list'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from unittest.mock import patch
+import base64
+import glob
+import html
+import re
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'newsletters')
+
+_RE_HEAD = re.compile(r'<head(?=[\s/>]).*?(?:</head\s*>|(?=<body[\s/>]))', flags=re.IGNORECASE | re.DOTALL)
+_RE_SCRIPT_STYLE = re.compile(r'<(script|style).*?>.*?</\1>', flags=re.IGNORECASE | re.DOTALL)
+
+
+def reference_text(html_content, max_chars):
+    """The previous regex pipeline, plus the two intended changes: <head> is dropped and entities are decoded."""
+    no_scripts = _RE_SCRIPT_STYLE.sub('', _RE_HEAD.sub('', html_content))
+    text_only = main._RE_HTML_TAGS.sub(' ', no_scripts)
+    return ' '.join(html.unescape(text_only).split())[:max_chars]
+
+
+def extract(html_content, max_chars, chunk_size):
+    extractor = main._HtmlTextExtractor(max_chars)
+    for start in range(0, len(html_content), chunk_size):
+        if extractor.feed(html_content[start:start + chunk_size]):
+            break
+    return extractor.close()
+
+
+class TestHtmlTextExtractor(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = {}
+        for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                cls.corpus[os.path.basename(path)] = f.read()
+
+    def test_matches_reference_on_corpus(self):
+        self.assertGreaterEqual(len(self.corpus), 4)
+        for name, html_content in self.corpus.items():
+            for max_chars in (40, 700, 15000):
+                expected = reference_text(html_content, max_chars)
+                for chunk_size in (1, 7, 100, 16384):
+                    with self.subTest(name=name, max_chars=max_chars, chunk_size=chunk_size):
+                        self.assertEqual(extract(html_content, max_chars, chunk_size), expected)
+
+    def test_drops_head_and_decodes_entities(self):
+        html_content = "<html><head><title>Hidden</title></head><body><p>Tom &amp; Jerry&rsquo;s&nbsp;show</p></body></html>"
+        self.assertEqual(main.optimize_newsletter_for_llm(html_content), "Tom & Jerry’s show")
+
+    def test_header_element_is_not_head(self):
+        html_content = "<header>Top stories</header><p>Body</p>"
+        self.assertEqual(main.optimize_newsletter_for_llm(html_content), "Top stories Body")
+
+    def test_removed_script_joins_adjacent_text(self):
+        self.assertEqual(main.optimize_newsletter_for_llm("foo<script>x()</script>bar"), "foobar")
+
+    def test_stops_feeding_once_budget_is_full(self):
+        extractor = main._HtmlTextExtractor(max_chars=20)
+        self.assertFalse(extractor.feed("<p>short</p>"))
+        self.assertTrue(extractor.feed("<p>" + "word " * 50 + "</p>"))
+        self.assertTrue(extractor.feed("<p>never read</p>"))
+        self.assertEqual(extractor.close(), "short word word word")
+
+
+class TestExtractTextFromBase64(unittest.TestCase):
+    def _encode(self, text):
+        return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+    def test_matches_full_decode(self):
+        # Multi-byte characters land on every possible block offset
+        html_content = "<p>" + " ".join(f"caf\u00e9 \u2014 na\u00efve {i} \U0001F4F0" for i in range(3000)) + "</p>"
+        body_data = self._encode(html_content)
+        for max_chars in (100, 15000, 10 ** 6):
+            with self.subTest(max_chars=max_chars):
+                self.assertEqual(main.extract_text_from_base64(body_data, max_chars),
+                                 main.optimize_newsletter_for_llm(html_content, max_chars))
+
+    def test_unpadded_body(self):
+        body_data = self._encode("<p>Hello!</p>").rstrip('=')
+        self.assertEqual(main.extract_text_from_base64(body_data), "Hello!")
+
+    def test_stops_decoding_once_budget_is_full(self):
+        body_data = self._encode("<p>" + "headline text " * 100000 + "</p>")
+        with patch('main.base64.urlsafe_b64decode', wraps=base64.urlsafe_b64decode) as decode:
+            text = main.extract_text_from_base64(body_data, max_chars=15000)
+        self.assertEqual(len(text), 15000)
+        self.assertLessEqual(decode.call_count, 2)
+        self.assertGreater(len(body_data) // main._BASE64_BLOCK_CHARS, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+FINAL = {'story_groups': [{'group_headline': 'Chip rules', 'consensus_summary': 'Merged.',
+                           'stories': [{'headline': 'Chip rules', 'source': 'WSJ', 'angle': 'Cites officials.'}]}],
+         'remaining_stories': []}
+
+
+def _response(payload):
+    response = MagicMock()
+    response.candidates = [MagicMock()]
+    response.candidates[0].finish_reason = 1
+    response.text = json.dumps(payload)
+    return response
+
+
+def _block(name, body, priority=False):
+    block = main._format_email_block(f"{name} <news@{name.lower()}.com>", f"{name} Daily", body)
+    return f"*** PRIORITY SOURCE ***\n{block}" if priority else block
+
+
+class TestIssueSummaries(unittest.TestCase):
+    def setUp(self):
+        self.model = MagicMock()
+        self.model.generate_content.side_effect = self._generate
+        self.summary_fail = set()
+        patchers = (patch('main.model', self.model), patch('main.genai'),
+                    patch('main.ISSUE_SUMMARIES_ENABLED', True),
+                    patch('main._issue_summary_cache', main._SharedAnalysisCache(100, 3600)),
+                    patch('main.ResourceExhausted', type('ResourceExhausted', (Exception,), {})),
+                    patch('main.InvalidArgument', type('InvalidArgument', (Exception,), {})))
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _generate(self, prompt, **kwargs):
+        if prompt.startswith(main.ISSUE_SUMMARY_PROMPT_TEMPLATE):
+            name = prompt.split('--- Newsletter from: ')[1].split(' ')[0]
+            if name in self.summary_fail:
+                raise Exception("Some random error")
+            return _response({'stories': [{'headline': f"{name} story", 'summary': 'Facts.', 'angle': 'Argues.'}]})
+        return _response(FINAL)
+
+    def _prompts(self, template):
+        return [c.args[0] for c in self.model.generate_content.call_args_list if c.args[0].startswith(template)]
+
+    def test_shared_issues_are_summarized_once_across_users(self):
+        first = _block('WSJ', 'Chip export rules tighten.') + _block('Axios', 'Chips again.') + _block('NYT', 'Storm.')
+        second = _block('WSJ', 'Chip export rules tighten.', priority=True) + _block('Axios', 'Chips again.') + _block('AP', 'Vote.')
+        self.assertEqual(main.analyze_news_with_llm(first), FINAL)
+        self.assertEqual(len(self._prompts(main.ISSUE_SUMMARY_PROMPT_TEMPLATE)), 3)
+        self.assertEqual(main.analyze_news_with_llm(second), FINAL)
+        summaries = self._prompts(main.ISSUE_SUMMARY_PROMPT_TEMPLATE)
+        self.assertEqual(len(summaries), 4)
+        self.assertIn('AP Daily', summaries[-1])
+
+        merge_prompt = self._prompts(main.MERGE_ISSUES_PROMPT_TEMPLATE)[-1]
+        issues = json.loads(merge_prompt[len(main.MERGE_ISSUES_PROMPT_TEMPLATE):])
+        self.assertEqual([(i['source'], i['priority']) for i in issues],
+                         [('WSJ <news@wsj.com>', True), ('Axios <news@axios.com>', False), ('AP <news@ap.com>', False)])
+        self.assertNotIn('Chip export rules tighten.', merge_prompt)
+        self.assertEqual(self._prompts(main.ANALYSIS_PROMPT_TEMPLATE), [])
+
+    def test_issue_sources_share_summaries_across_differently_shaped_copies(self):
+        wsj, axios, nyt = _block('WSJ', 'Chip export rules tighten. Rates held.'), _block('Axios', 'Chips.'), _block('NYT', 'Storm.')
+        sources = [('wsj-issue', wsj), ('axios-issue', axios), ('nyt-issue', nyt)]
+        # The user on the smaller budget asks first; the shared summary still covers the whole issue
+        trimmed = _block('WSJ', 'Chip export rules tighten. [...]') + axios + nyt
+        main.analyze_news_with_llm(trimmed, issue_sources=sources)
+        main.analyze_news_with_llm(wsj + axios + nyt, issue_sources=sources)
+        summaries = self._prompts(main.ISSUE_SUMMARY_PROMPT_TEMPLATE)
+        self.assertEqual(len(summaries), 3)
+        wsj_prompt = next(prompt for prompt in summaries if 'WSJ' in prompt)
+        self.assertIn('Rates held.', wsj_prompt)
+        self.assertNotIn('[...]', wsj_prompt)
+
+    def test_each_issue_summary_input_is_capped(self):
+        long_issue = _block('WSJ', ' '.join(f"Story {i} ran long." for i in range(2000)))
+        sources = [('wsj-issue', long_issue), ('axios-issue', _block('Axios', 'Chips.')), ('nyt-issue', _block('NYT', 'Storm.'))]
+        text = _block('WSJ', 'Story 0 ran long. [...]') + sources[1][1] + sources[2][1]
+        with patch('main.ISSUE_SUMMARY_MAX_TOKENS', 300):
+            main.analyze_news_with_llm(text, issue_sources=sources)
+        wsj_prompt = next(p for p in self._prompts(main.ISSUE_SUMMARY_PROMPT_TEMPLATE) if 'WSJ' in p)
+        self.assertLessEqual(main._estimate_tokens(wsj_prompt[len(main.ISSUE_SUMMARY_PROMPT_TEMPLATE):]), 300)
+        self.assertIn('Story 0 ran long.', wsj_prompt)
+
+    def test_oversized_summary_inputs_fall_back_to_direct_analysis(self):
+        text = _block('WSJ', 'Chips.') + _block('Axios', 'Chips.') + _block('NYT', 'Storm.')
+        with patch('main.MAX_LLM_INPUT_TOKENS', 20):
+            self.assertIsNone(main._summarize_issues(text))
+        self.assertEqual(self._prompts(main.ISSUE_SUMMARY_PROMPT_TEMPLATE), [])
+
+    def test_failed_summary_is_retried_then_merged_as_text(self):
+        self.summary_fail.add('NYT')
+        text = _block('WSJ', 'Chips.') + _block('Axios', 'Chips.') + _block('NYT', 'Storm.')
+        self.assertEqual(main.analyze_news_with_llm(text), FINAL)
+        # Two attempts for the failing issue, one each for the others
+        self.assertEqual(len(self._prompts(main.ISSUE_SUMMARY_PROMPT_TEMPLATE)), 4)
+        self.assertEqual(self._prompts(main.ANALYSIS_PROMPT_TEMPLATE), [])
+        merge_prompt = self._prompts(main.MERGE_ISSUES_PROMPT_TEMPLATE)[-1]
+        issues = json.loads(merge_prompt[len(main.MERGE_ISSUES_PROMPT_TEMPLATE):])
+        self.assertEqual([sorted(i) for i in issues], [['priority', 'source', 'stories', 'subject']] * 2
+                         + [['priority', 'source', 'subject', 'text']])
+        self.assertIn('Storm.', issues[2]['text'])
+
+    def test_transient_failure_is_recovered_by_the_retry(self):
+        attempts = []
+
+        def generate(prompt, **kwargs):
+            if prompt.startswith(main.ISSUE_SUMMARY_PROMPT_TEMPLATE) and 'NYT' in prompt and not attempts:
+                attempts.append(prompt)
+                raise Exception("Some random error")
+            return self._generate(prompt, **kwargs)
+
+        self.model.generate_content.side_effect = generate
+        main.analyze_news_with_llm(_block('WSJ', 'Chips.') + _block('Axios', 'Chips.') + _block('NYT', 'Storm.'))
+        merge_prompt = self._prompts(main.MERGE_ISSUES_PROMPT_TEMPLATE)[-1]
+        issues = json.loads(merge_prompt[len(main.MERGE_ISSUES_PROMPT_TEMPLATE):])
+        self.assertTrue(all('stories' in issue for issue in issues))
+
+    def test_every_summary_failing_falls_back_to_direct_analysis(self):
+        self.summary_fail.update({'WSJ', 'Axios', 'NYT'})
+        text = _block('WSJ', 'Chips.') + _block('Axios', 'Chips.') + _block('NYT', 'Storm.')
+        self.assertEqual(main.analyze_news_with_llm(text), FINAL)
+        self.assertEqual(len(self._prompts(main.ANALYSIS_PROMPT_TEMPLATE)), 1)
+        self.assertEqual(self._prompts(main.MERGE_ISSUES_PROMPT_TEMPLATE), [])
+
+    def test_summaries_run_on_the_llm_pool(self):
+        with patch('main._worker_pool') as worker_pool:
+            main.analyze_news_with_llm(_block('WSJ', 'Chips.') + _block('Axios', 'Chips.') + _block('NYT', 'Storm.'))
+        worker_pool.for_user.assert_not_called()
+        self.assertEqual(len(self._prompts(main.MERGE_ISSUES_PROMPT_TEMPLATE)), 1)
+
+    def test_personalized_issue_summary_is_not_shared(self):
+        self.model.generate_content.side_effect = lambda prompt, **kwargs: (
+            _response({'stories': [{'headline': 'Jordan, your picks', 'summary': 'x', 'angle': 'y'}]})
+            if prompt.startswith(main.ISSUE_SUMMARY_PROMPT_TEMPLATE) else _response(FINAL))
+        text = _block('WSJ', 'Hi Jordan.') + _block('Axios', 'Chips.') + _block('NYT', 'Storm.')
+        main.analyze_news_with_llm(text, identifiers=['jordan@example.com', 'jordan'])
+        main.analyze_news_with_llm(text, identifiers=['jordan@example.com', 'jordan'])
+        self.assertEqual(len(self._prompts(main.ISSUE_SUMMARY_PROMPT_TEMPLATE)), 6)
+
+    def test_small_briefings_use_one_direct_call(self):
+        self.assertEqual(main.analyze_news_with_llm(_block('WSJ', 'Chips.') + _block('NYT', 'Storm.')), FINAL)
+        self.assertEqual(self.model.generate_content.call_count, 1)
+        self.assertEqual(len(self._prompts(main.ANALYSIS_PROMPT_TEMPLATE)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
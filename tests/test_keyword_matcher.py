@@ -0,0 +1,76 @@
+import unittest
+import random
+import re
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from tests.test_near_duplicates import _article
+
+
+def _naive_find(patterns, text, word_boundaries):
+    text = text.lower()
+    if word_boundaries:
+        return {p for p in patterns if re.search(rf"(?<!\w){re.escape(p)}(?!\w)", text)}
+    return {p for p in patterns if p in text}
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    def test_matches_naive_scan_on_random_watchlists(self):
+        rng = random.Random(7)
+        words = _article(1, words=600).lower().replace('.', '').split()
+        for trial in range(40):
+            text = _article(trial, words=200)
+            # Real words, word fragments and two-word phrases, many of them nested in each other
+            patterns = [rng.choice(words)[:rng.randint(2, 8)] for _ in range(rng.randint(1, 120))]
+            patterns += [' '.join(rng.sample(words, 2)) for _ in range(5)]
+            for word_boundaries in (False, True):
+                with self.subTest(trial=trial, word_boundaries=word_boundaries):
+                    matcher = main._KeywordMatcher(patterns, word_boundaries)
+                    expected = _naive_find(matcher.patterns, text, word_boundaries)
+                    self.assertEqual(matcher.find(text), expected)
+                    self.assertEqual(matcher.matches_any(text), bool(expected))
+
+    def test_nested_and_overlapping_patterns_are_all_reported(self):
+        patterns = ['fed', 'federal', 'federal reserve', 'reserve bank', 'rate'] + [f"filler{i}" for i in range(100)]
+        matcher = main._KeywordMatcher(patterns)
+        self.assertIsNotNone(matcher._regex)
+        self.assertEqual(matcher.find("The Federal Reserve Bank held rates."),
+                         {'fed', 'federal', 'federal reserve', 'reserve bank', 'rate'})
+
+    def test_small_substring_watchlist_is_compiled(self):
+        # The default mode with a typical watchlist takes the single-pass path too
+        matcher = main._KeywordMatcher(['Fed', 'chip', 'tariff'])
+        self.assertIsNotNone(matcher._regex)
+        self.assertEqual(matcher.find("Chipmakers brace for tariffs", "The Federal Reserve"), {'fed', 'chip', 'tariff'})
+        self.assertTrue(matcher.matches_any("new chips"))
+        self.assertFalse(matcher.matches_any("Weather", "Rain all week"))
+        self.assertIsNone(main._KeywordMatcher([])._regex)
+
+    def test_word_boundaries(self):
+        matcher = main._KeywordMatcher(['ai', 'wsj.com', 'chip'], word_boundaries=True)
+        self.assertEqual(matcher.find("He said chips are up"), set())
+        self.assertEqual(matcher.find("AI chip news", "via news@wsj.com"), {'ai', 'chip', 'wsj.com'})
+
+    def test_subject_and_body_do_not_join_into_a_match(self):
+        matcher = main._KeywordMatcher(['chip ban'] + [f"filler{i}" for i in range(100)])
+        self.assertEqual(matcher.find("Weekly chip", "ban on exports"), set())
+
+    def test_matchers_are_cached_per_watchlist(self):
+        first = main._get_keyword_matcher(['chips', 'tariff'], True)
+        self.assertIs(main._get_keyword_matcher(['chips', 'tariff'], True), first)
+        self.assertIsNot(main._get_keyword_matcher(['chips', 'tariff'], False), first)
+
+    def test_more_subject_hits_rank_higher(self):
+        ranked = main._rank_candidates([
+            {'index': 0, 'id': 'm0', 'sender': 'A <a@x.com>', 'subject': 'Chips', 'date': 5},
+            {'index': 1, 'id': 'm1', 'sender': 'B <b@y.com>', 'subject': 'Chips and tariffs', 'date': 1},
+        ], ['chips', 'tariffs'], [])
+        self.assertEqual([c['id'] for c in ranked], ['m1', 'm0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Other test modules may have replaced requests with a MagicMock; these tests need real HTTP
+if 'requests' in sys.modules and not hasattr(sys.modules['requests'], '__file__'):
+    del sys.modules['requests']
+import requests
+
+import main
+from tests.fake_gmail_server import FakeGmailServer, make_message
+
+
+def _record(message_id, text="Some story"):
+    return {'id': message_id, 'date': 0, 'sender': 'WSJ <news@wsj.com>', 'subject': 'Issue', 'text': text}
+
+
+class TestMessageRecordCache(unittest.TestCase):
+    def test_lru_is_bounded(self):
+        cache = main._MessageRecordCache(max_entries=2)
+        cache.put('a', _record('a'))
+        cache.put('b', _record('b'))
+        cache.get('a')
+        cache.put('c', _record('c'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_users_do_not_share_records(self):
+        cache = main._MessageRecordCache(max_entries=10)
+        cache.for_user('alice@example.com')['m1'] = _record('m1')
+        self.assertIsNotNone(cache.for_user('alice@example.com').get('m1'))
+        self.assertIsNone(cache.for_user('bob@example.com').get('m1'))
+
+    def test_sqlite_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'messages.db')
+            first = main._MessageRecordCache(10, main._SqliteRecordStore(path, 100))
+            first.put('k', _record('m1', text='persisted'))
+            second = main._MessageRecordCache(10, main._SqliteRecordStore(path, 100))
+            self.assertEqual(second.get('k')['text'], 'persisted')
+
+
+class TestRefreshUsesCachedText(unittest.TestCase):
+    def setUp(self):
+        main._message_cache.clear()
+        self.server = FakeGmailServer({
+            'm0': make_message('m0', 'WSJ <news@wsj.com>', 'Markets', '<p>Stocks rally on Fed news</p>'),
+            'm1': make_message('m1', 'Axios <hi@axios.com>', 'Tech', '<p>New chip launch</p>'),
+        })
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        patchers = [
+            patch('main._get_auth_session', side_effect=lambda creds_dict: requests.Session()),
+            patch('main.GMAIL_API_BASE', self.server.base_url),
+            patch('main.GMAIL_BATCH_URL', self.server.batch_url),
+            patch('main.GMAIL_FETCH_MODE', 'batch'),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_keyword_change_filters_cached_text_without_refetching(self):
+        stubs = [{'id': 'm0'}, {'id': 'm1'}]
+        store = main._message_cache.for_user('user@example.com')
+        main._process_email_messages(stubs, {}, [], [], record_store=store)
+        self.assertEqual(self.server.count('batch', contains='format=full'), 1)
+
+        text, normal_count, _priority, _count = main._process_email_messages(stubs, {}, ['chip'], ['axios'], record_store=store)
+        self.assertEqual(self.server.count('batch'), 2)
+        self.assertIn('New chip launch', text)
+        self.assertNotIn('Stocks rally', text)
+        self.assertTrue(text.startswith('*** PRIORITY SOURCE ***'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import patch
+import copy
+import time
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+ANALYSIS = {'story_groups': [{'group_headline': 'Rates hold', 'stories': []}], 'remaining_stories': []}
+SETTINGS = {'sources': ['wsj.com'], 'time_window_hours': 24, 'keywords': [], 'priority_sources': []}
+
+
+class TestMessageSetValidation(unittest.TestCase):
+    def setUp(self):
+        self.cache = {}
+        self.message_ids = ['m1', 'm2']
+        patchers = (patch('main.load_cache', side_effect=lambda: copy.deepcopy(self.cache)),
+                    patch('main.save_cache', side_effect=lambda data: self.cache.update(copy.deepcopy(data))),
+                    patch('main._search_gmail_messages', side_effect=self._search),
+                    patch('main._get_auth_session'), patch('main._get_gmail_history_id', return_value='h1'),
+                    patch('main._gmail_sync_states', main.OrderedDict()),
+                    patch('main._list_gmail_history', return_value=([], set(), 'h1')))
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.settings_hash = main._briefing_stage_keys(SETTINGS)['filter']
+
+    def _search(self, creds_dict, sources, hours):
+        return iter([{'id': mid, 'threadId': mid} for mid in self.message_ids])
+
+    def _request(self):
+        return {'email': 'u@example.com', 'user_info': {}, 'settings': SETTINGS, 'cache_key': 'u',
+                'settings_hash': self.settings_hash, 'creds_dict': {}}
+
+    def test_fingerprint_ignores_listing_order(self):
+        first = main._message_set_fingerprint(['m1', 'm2'])
+        self.assertEqual(main._message_set_fingerprint(['m2', 'm1']), first)
+        self.assertNotEqual(main._message_set_fingerprint(['m1', 'm2', 'm3']), first)
+
+    def test_unchanged_mailbox_reuses_the_analysis_past_the_old_ttl(self):
+        message_set = main._message_set_fingerprint(self.message_ids)
+        with patch('main.time.time', return_value=1000):
+            main._update_cached_analysis('u', self.settings_hash, ANALYSIS, 'fp', message_set)
+        with patch('main.time.time', return_value=1000 + 16 * 60):
+            self.assertEqual(main._cached_briefing(self._request()), ANALYSIS)
+        with patch('main.time.time', return_value=1000 + main.CACHE_TTL_SECONDS + 1):
+            self.assertIsNone(main._cached_briefing(self._request()))
+
+    def test_new_newsletter_invalidates_at_once(self):
+        main._update_cached_analysis('u', self.settings_hash, ANALYSIS, 'fp', main._message_set_fingerprint(self.message_ids))
+        self.message_ids.append('m3')
+        self.assertIsNone(main._cached_briefing(self._request()))
+
+    def test_entries_without_a_message_set_are_not_trusted(self):
+        main._update_cached_analysis('u', self.settings_hash, ANALYSIS, 'fp')
+        self.assertIsNone(main._cached_briefing(self._request()))
+
+    def test_cold_miss_lists_the_window_once(self):
+        request = self._request()
+        processed = []
+
+        def process(messages, *args, message_dates=None, **kwargs):
+            for message in messages:
+                processed.append(message['id'])
+                message_dates[message['id']] = 2_000_000_000_000
+            return "--- Newsletter from: WSJ ---\nRates held.", 1, 0, 1
+
+        with patch('main._process_email_messages', side_effect=process), patch('main._boilerplate_models'), \
+             patch('main._shared_analysis_cache', main._SharedAnalysisCache(10, 60)):
+            briefing, reply = main._prepare_briefing(request)
+            self.assertIsNone(reply)
+            self.assertEqual(main._search_gmail_messages.call_count, 1)
+            self.assertEqual(processed, ['m1', 'm2'])
+            self.assertEqual(main._gmail_sync_states['u']['history_id'], 'h1')
+            with patch('main._report_fetch_metrics'):
+                main._finish_briefing(briefing, ANALYSIS, 10)
+        self.assertEqual(self.cache['u']['message_set'], briefing['message_set'])
+        self.assertEqual(main._cached_briefing(self._request()), ANALYSIS)
+
+    def test_gmail_outage_serves_the_cached_briefing(self):
+        main._update_cached_analysis('u', self.settings_hash, ANALYSIS, 'fp', main._message_set_fingerprint(self.message_ids))
+        with patch('main._search_gmail_messages', side_effect=Exception("503 Service Unavailable")):
+            self.assertEqual(main._cached_briefing(self._request()), ANALYSIS)
+            with patch('main.time.time', return_value=time.time() + main.CACHE_TTL_SECONDS + 1):
+                with self.assertRaises(Exception):
+                    main._cached_briefing(self._request())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+import base64
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+
+def _part(mime_type, text, filename=''):
+    data = base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+    return {'mimeType': mime_type, 'filename': filename, 'body': {'data': data}}
+
+
+def _message(payload, sender='Digest <news@digest.example>'):
+    payload = dict(payload, headers=[{'name': 'From', 'value': sender}, {'name': 'Subject', 'value': 'Issue'}])
+    return {'id': 'm1', 'internalDate': '1', 'payload': payload}
+
+
+LONG_PLAIN = "Top story: " + "markets rallied as chipmakers led gains. " * 20
+LONG_HTML = "<html><body><p>" + "Markets rallied as chipmakers led gains. " * 20 + "</p></body></html>"
+
+
+class TestMimeWalker(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.dict(main._sender_part_preferences, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_finds_parts_nested_in_mixed_and_alternative(self):
+        payload = {'mimeType': 'multipart/mixed', 'parts': [
+            {'mimeType': 'multipart/related', 'parts': [
+                {'mimeType': 'multipart/alternative', 'parts': [
+                    _part('text/plain', LONG_PLAIN),
+                    _part('text/html', LONG_HTML),
+                ]},
+                _part('image/png', 'png bytes', filename='logo.png'),
+            ]},
+            _part('text/plain', 'attached notes', filename='notes.txt'),
+        ]}
+        record = main._parse_gmail_message(_message(payload))
+        self.assertTrue(record['text'].startswith("Top story: markets rallied"))
+        self.assertEqual(main._sender_part_preferences['news@digest.example'], 'plain')
+
+    def test_plain_text_drops_bare_links(self):
+        plain = LONG_PLAIN + " Read more <https://click.example.com/t?id=1> or [https://example.com/web] today."
+        text = main._extract_message_text({'mimeType': 'text/plain', **_part('text/plain', plain)}, 'a@b.c')
+        self.assertNotIn('https://', text)
+        self.assertTrue(text.endswith("Read more or today."))
+
+    def test_stub_plain_part_falls_back_to_html_and_is_remembered(self):
+        payload = {'mimeType': 'multipart/alternative', 'parts': [
+            _part('text/plain', 'View this email in your browser: https://example.com/web'),
+            _part('text/html', LONG_HTML),
+        ]}
+        record = main._parse_gmail_message(_message(payload))
+        self.assertTrue(record['text'].startswith("Markets rallied"))
+        self.assertEqual(main._sender_part_preferences['news@digest.example'], 'html')
+
+        # The next message from the same sender never decodes its plain part
+        with patch('main.extract_text_from_base64', wraps=main.extract_text_from_base64) as extract:
+            main._parse_gmail_message(_message(payload))
+        self.assertEqual([call.kwargs.get('plain', False) for call in extract.call_args_list], [False])
+
+    def test_html_only_and_empty_messages(self):
+        html_only = {'mimeType': 'multipart/alternative', 'parts': [_part('text/html', "<p>Only HTML</p>")]}
+        self.assertEqual(main._parse_gmail_message(_message(html_only))['text'], "Only HTML")
+        self.assertNotIn('news@digest.example', main._sender_part_preferences)
+        attachments_only = {'mimeType': 'multipart/mixed', 'parts': [_part('application/pdf', 'x', filename='a.pdf')]}
+        self.assertIsNone(main._parse_gmail_message(_message(attachments_only)))
+
+
+if __name__ == '__main__':
+    unittest.main()
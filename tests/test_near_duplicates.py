@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import patch
+import random
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Other test modules may have replaced requests with a MagicMock; these tests need real HTTP
+if 'requests' in sys.modules and not hasattr(sys.modules['requests'], '__file__'):
+    del sys.modules['requests']
+import requests
+
+import main
+from tests.fake_gmail_server import FakeGmailServer, make_message
+
+_VOCABULARY = ("market rates inflation election court ruling senate budget chip factory strike oil price "
+               "housing mortgage bank earnings quarter forecast climate storm tariff trade export startup "
+               "funding layoffs merger vaccine trial school district transit league season coach").split()
+
+
+def _article(seed, words=300):
+    rng = random.Random(seed)
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentences.append(' '.join(rng.choice(_VOCABULARY) for _ in range(length)).capitalize() + '.')
+        words -= length
+    return ' '.join(sentences)
+
+
+class TestNearDuplicates(unittest.TestCase):
+    def test_resend_with_small_edits_is_dropped(self):
+        original = _article(1)
+        resend = "View in browser. " + original.replace("market", "markets", 2) + " Unsubscribe here."
+        texts, stats = main._dedupe_near_duplicates([original, resend, _article(2)])
+        self.assertEqual(texts, [original, None, _article(2)])
+        self.assertEqual(stats['newsletters'], 1)
+        self.assertEqual(stats['tokens_saved'], main._estimate_tokens(resend))
+
+    def test_shared_story_is_collapsed_in_later_newsletter(self):
+        wire_story = _article(3, words=120)
+        first = _article(4) + ' ' + wire_story
+        second = wire_story + ' ' + _article(5)
+        texts, stats = main._dedupe_near_duplicates([first, second])
+        self.assertEqual(texts[0], first)
+        self.assertTrue(texts[1].startswith('[...] '))
+        self.assertIn(_article(5)[:200], texts[1])
+        self.assertGreaterEqual(stats['passages'], 2)
+        self.assertGreater(stats['tokens_saved'], 0)
+
+    def test_fully_collapsed_newsletter_is_counted_as_dropped(self):
+        # Too different as a whole to be a copy, but every passage of the teaser already appeared
+        teaser = _article(9, words=120)
+        texts, stats = main._dedupe_near_duplicates([teaser + ' ' + _article(10), teaser])
+        self.assertIsNone(texts[1])
+        self.assertEqual(stats['newsletters'], 1)
+        self.assertGreater(stats['passages'], 0)
+
+    def test_unrelated_and_short_texts_are_untouched(self):
+        texts = [_article(6), _article(7), 'Too short', '']
+        self.assertEqual(main._dedupe_near_duplicates(texts)[0], texts)
+
+    def test_priority_copy_survives_in_fetch(self):
+        story = f"<p>{_article(8)}</p>"
+        messages = {
+            'm0': make_message('m0', 'Axios <hi@axios.com>', 'Daily', story, 2),
+            'm1': make_message('m1', 'WSJ <news@wsj.com>', 'Markets', story, 1),
+        }
+        with FakeGmailServer(messages) as server, \
+                patch('main._get_auth_session', side_effect=lambda creds_dict: requests.Session()), \
+                patch('main.GMAIL_API_BASE', server.base_url), \
+                patch('main.GMAIL_BATCH_URL', server.batch_url), \
+                patch('main.GMAIL_FETCH_MODE', 'batch'):
+            text, normal_count, priority_count, message_count = main._process_email_messages(
+                [{'id': 'm0'}, {'id': 'm1'}], {'token': 'x'}, [], ['wsj.com']
+            )
+        self.assertEqual((normal_count, priority_count), (0, 1))
+        self.assertEqual(message_count, 1)
+        self.assertIn('news@wsj.com', text)
+        self.assertNotIn('hi@axios.com', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
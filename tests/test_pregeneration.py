@@ -0,0 +1,188 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import copy
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+ANALYSIS = {'story_groups': [{'group_headline': 'Rates hold', 'consensus_summary': 'Steady.', 'stories': []}],
+            'remaining_stories': [{'headline': 'Storm moves north'}]}
+CREDS = {'token': 'access', 'refresh_token': 'refresh', 'token_uri': 'https://oauth2.googleapis.com/token',
+         'client_id': 'client', 'scopes': ['gmail.readonly']}
+DAY = 20000 * 86400
+
+
+class TestOpenTimes(unittest.TestCase):
+    def test_usual_open_minute_wraps_around_midnight(self):
+        self.assertEqual(main._usual_open_minute([1430, 5, 10]), 2)
+        self.assertEqual(main._usual_open_minute([420, 440, 430]), 430)
+        self.assertIsNone(main._usual_open_minute([420, 440]))
+
+    def test_lead_times_are_stable_and_inside_the_window(self):
+        leads = [main._pregeneration_lead_seconds(f"user{i}@example.com") for i in range(200)]
+        self.assertEqual(leads[0], main._pregeneration_lead_seconds("user0@example.com"))
+        self.assertTrue(all(main.PREGENERATE_MIN_LEAD_SECONDS <= lead <= main.PREGENERATE_WINDOW_HOURS * 3600 for lead in leads))
+        # Spread over the window rather than bunched at one moment
+        self.assertGreater(len({lead // 600 for lead in leads}), 10)
+
+
+class TestBriefingSchedules(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('main.DATABASE_URL', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.schedules = main._BriefingSchedules()
+
+    def test_opt_in_keeps_only_what_is_needed_to_refresh(self):
+        with patch('main._briefing_schedules', self.schedules):
+            main._set_pregeneration('a@example.com', True, CREDS)
+        stored = self.schedules.get('a@example.com')['credentials']
+        self.assertNotIn('token', stored)
+        # The refresh token is only stored encrypted with the server's key
+        self.assertNotIn('refresh', stored['refresh_token'])
+        self.assertEqual(main._schedule_credentials(stored)['refresh_token'], 'refresh')
+        with patch('main.app', MagicMock(secret_key='another-key')):
+            self.assertIsNone(main._schedule_credentials(stored))
+        self.assertIsNone(main._schedule_credentials(dict(stored, refresh_token='refresh')))
+
+    def test_opens_are_only_recorded_for_opted_in_users(self):
+        self.schedules.record('b@example.com', open_ts=DAY + 400 * 60)
+        self.assertIsNone(self.schedules.get('b@example.com'))
+        with patch('main._briefing_schedules', self.schedules):
+            main._set_pregeneration('a@example.com', True, CREDS)
+        for day in range(10):
+            self.schedules.record('a@example.com', open_ts=DAY + day * 86400 + day * 60, greeting='Good morning')
+        schedule = self.schedules.get('a@example.com')
+        self.assertEqual(schedule['open_minutes'], list(range(3, 10)))
+        self.assertEqual(schedule['greeting'], 'Good morning')
+
+    def test_only_the_first_open_of_each_day_counts(self):
+        with patch('main._briefing_schedules', self.schedules):
+            main._set_pregeneration('a@example.com', True, CREDS)
+        for day in range(3):
+            self.schedules.record('a@example.com', open_ts=DAY + day * 86400 + 420 * 60)
+            # An afternoon of refreshes does not drag the usual open time away from the morning
+            for minute in range(900, 960, 5):
+                self.schedules.record('a@example.com', open_ts=DAY + day * 86400 + minute * 60)
+        self.assertEqual(self.schedules.get('a@example.com')['open_minutes'], [420, 420, 420])
+
+    def test_briefing_requests_record_opens_in_the_background(self):
+        writer = MagicMock()
+        with patch('main._briefing_schedule_writer', writer), patch('main._briefing_open_days', {}):
+            for _ in range(5):
+                main._record_briefing_open('a@example.com', CREDS)
+        self.assertEqual(writer.submit.call_count, 1)
+        _user_key, fn, email = writer.submit.call_args.args
+        self.assertEqual((fn, email), (main._briefing_schedules.record, 'a@example.com'))
+        self.assertEqual(writer.submit.call_args.kwargs['creds'], CREDS)
+
+    def test_opt_out_forgets_the_credentials(self):
+        with patch('main._briefing_schedules', self.schedules):
+            main._set_pregeneration('a@example.com', True, CREDS)
+            main._set_pregeneration('a@example.com', False, CREDS)
+        self.assertEqual(self.schedules.all(), {})
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('main.DATABASE_URL', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.schedules = main._BriefingSchedules()
+        self.schedules.put('a@example.com', {'credentials': main._stored_credentials(CREDS), 'open_minutes': [480] * 3})
+        self.schedules.put('new@example.com', {'credentials': main._stored_credentials(CREDS), 'open_minutes': [480]})
+        self.pool = MagicMock()
+        self.scheduler = main._PregenerationScheduler(self.schedules, self.pool)
+        self.run_at = DAY + 480 * 60 - main._pregeneration_lead_seconds('a@example.com')
+
+    def test_runs_once_per_open_time_after_the_users_lead_point(self):
+        self.scheduler.run_pending(now=self.run_at - 1)
+        self.pool.submit.assert_not_called()
+        self.scheduler.run_pending(now=self.run_at)
+        self.scheduler.run_pending(now=self.run_at + 600)
+        self.assertEqual(self.pool.submit.call_count, 1)
+        _user_key, fn, email, _schedule, open_ts = self.pool.submit.call_args.args
+        self.assertEqual((fn, email, open_ts), (main._pregenerate_briefing, 'a@example.com', DAY + 480 * 60))
+        # Next day's open time is scheduled again
+        self.scheduler.run_pending(now=self.run_at + 86400)
+        self.assertEqual(self.pool.submit.call_count, 2)
+
+
+class TestPregenerateBriefing(unittest.TestCase):
+    def setUp(self):
+        self.cache = {}
+        self.settings = {'sources': ['wsj.com'], 'personality': 'anchor', 'pregenerate_briefing': True}
+        self.settings_hash = main._briefing_stage_keys(self.settings)['filter']
+        patchers = (patch('main.load_cache', side_effect=lambda: copy.deepcopy(self.cache)),
+                    patch('main.save_cache', side_effect=lambda data: self.cache.update(copy.deepcopy(data))),
+                    patch('main.load_settings', return_value=self.settings),
+                    patch('main._run_briefing', side_effect=self._run_briefing),
+                    patch('main._get_access_token', return_value='access'),
+                    patch('main._synthesize_script', return_value='QUFB' * 40))
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _run_briefing(self, briefing_request):
+        self.briefing_request = briefing_request
+        main._update_cached_analysis(briefing_request['cache_key'], briefing_request['settings_hash'], ANALYSIS, 'fp', 'ms')
+        return ANALYSIS, 200
+
+    def test_results_wait_in_the_caches_until_the_user_opens_the_app(self):
+        schedule = {'credentials': main._stored_credentials(CREDS), 'greeting': 'Good morning'}
+        open_ts = 1_000_000 + 3 * 3600
+        with patch('main.time.time', return_value=1_000_000):
+            main._pregenerate_briefing('a@example.com', schedule, open_ts)
+        self.assertEqual(self.briefing_request['creds_dict']['refresh_token'], 'refresh')
+        self.assertEqual(self.briefing_request['creds_dict']['token'], 'access')
+
+        # At the usual open time the user's request is a cache hit
+        with patch('main.time.time', return_value=open_ts - 60):
+            self.assertEqual(main._check_cached_analysis('a@example.com', self.settings_hash, 'ms'), ANALYSIS)
+        # The grace period after the open time never cuts the normal TTL short
+        with patch('main.time.time', return_value=1_000_000 + main.CACHE_TTL_SECONDS - 60):
+            self.assertEqual(main._check_cached_analysis('a@example.com', self.settings_hash, 'ms'), ANALYSIS)
+        expired = max(open_ts + main.PREGENERATE_GRACE_SECONDS, 1_000_000 + main.CACHE_TTL_SECONDS) + 1
+        with patch('main.time.time', return_value=expired):
+            self.assertIsNone(main._check_cached_analysis('a@example.com', self.settings_hash, 'ms'))
+
+        # The page's audio request (analysis plus its greeting) finds the pre-generated audio
+        audio_key = main._audio_cache_key(dict(ANALYSIS, greeting='Good morning'), 'anchor')
+        self.assertEqual(self.cache['a@example.com']['audio_key'], audio_key)
+        self.assertEqual(self.cache['a@example.com']['audio'], 'QUFB' * 40)
+
+    def test_revoked_refresh_token_pauses_the_schedule(self):
+        schedules = main._BriefingSchedules()
+        with patch('main.DATABASE_URL', None), patch('main._briefing_schedules', schedules), \
+             patch('main._get_access_token', side_effect=Exception("invalid_grant: Token has been expired or revoked.")):
+            main._set_pregeneration('a@example.com', True, CREDS)
+            main._pregenerate_briefing('a@example.com', schedules.get('a@example.com'), 0)
+            self.assertNotIn('credentials', schedules.get('a@example.com'))
+            self.assertFalse(hasattr(self, 'briefing_request'))
+            # The next login stores fresh credentials and resumes it
+            schedules.record('a@example.com', creds=CREDS)
+        self.assertIn('credentials', schedules.get('a@example.com'))
+
+    def test_unreadable_credentials_pause_the_schedule(self):
+        schedules = main._BriefingSchedules()
+        schedule = {'credentials': dict(main._stored_credentials(CREDS), refresh_token='plaintext'), 'open_minutes': []}
+        with patch('main.DATABASE_URL', None), patch('main._briefing_schedules', schedules):
+            schedules.put('a@example.com', schedule)
+            main._pregenerate_briefing('a@example.com', schedule, 0)
+            self.assertNotIn('credentials', schedules.get('a@example.com'))
+        self.assertFalse(hasattr(self, 'briefing_request'))
+
+    def test_users_who_opted_out_are_dropped(self):
+        self.settings['pregenerate_briefing'] = False
+        with patch('main._briefing_schedules') as schedules:
+            main._pregenerate_briefing('a@example.com', {'credentials': {}}, 0)
+        schedules.delete.assert_called_once_with('a@example.com')
+        self.assertEqual(self.cache, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
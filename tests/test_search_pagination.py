@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Other test modules may have replaced requests with a MagicMock; these tests need real HTTP
+if 'requests' in sys.modules and not hasattr(sys.modules['requests'], '__file__'):
+    del sys.modules['requests']
+import requests
+
+import main
+from tests.fake_gmail_server import FakeGmailServer, make_message
+
+
+class TestSearchPagination(unittest.TestCase):
+    def setUp(self):
+        self.messages = {
+            f"m{i}": make_message(f"m{i}", "Daily <daily@axios.com>", f"Issue {i}", f"<p>{'word ' * 100}{i}</p>")
+            for i in range(25)
+        }
+        patchers = [
+            patch('main._get_auth_session', side_effect=lambda creds_dict: requests.Session()),
+            patch('main.GMAIL_SEARCH_PAGE_SIZE', 10),
+            patch('main.GMAIL_BATCH_SIZE', 10),
+            patch('main.GMAIL_FETCH_MODE', 'batch'),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _use_server(self, server):
+        for p in (patch('main.GMAIL_API_BASE', server.base_url), patch('main.GMAIL_BATCH_URL', server.batch_url)):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_search_follows_next_page_token(self):
+        with FakeGmailServer(self.messages) as server:
+            self._use_server(server)
+            ids = [m['id'] for m in main._search_gmail_messages(None, ['axios.com'], 24)]
+            self.assertEqual(server.count('list'), 3)
+        self.assertEqual(ids, list(self.messages))
+
+    def test_search_is_lazy(self):
+        with FakeGmailServer(self.messages) as server:
+            self._use_server(server)
+            search = main._search_gmail_messages(None, ['axios.com'], 24)
+            next(search)
+            self.assertEqual(server.count('list'), 1)
+
+    def test_pipeline_fetches_every_page(self):
+        with FakeGmailServer(self.messages) as server:
+            self._use_server(server)
+            search = main._search_gmail_messages(None, ['axios.com'], 24)
+            text, normal_count, _priority_count, message_count = main._process_email_messages(search, {}, [], [])
+        self.assertEqual((normal_count, message_count), (25, 25))
+        self.assertIn("Issue 24", text)
+
+    def test_pipeline_stops_downloading_bodies_once_budget_is_full(self):
+        with FakeGmailServer(self.messages) as server:
+            self._use_server(server)
+            with patch('main.GMAIL_FETCH_MODE', 'threads'):
+                search = main._search_gmail_messages(None, ['axios.com'], 24)
+                text, normal_count, _priority_count, message_count = main._process_email_messages(
+                    search, {}, [], [], token_budget=300
+                )
+            # The cheap metadata pass covers every page; full bodies stop at the budget
+            self.assertEqual(message_count, 25)
+            self.assertLess(server.count('get', contains='format=full'), 25)
+        self.assertLessEqual(main._estimate_tokens(text), 300)
+        self.assertGreater(normal_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+
+class TestSessionRegistry(unittest.TestCase):
+    def setUp(self):
+        patchers = [
+            patch('main.AuthorizedSession', side_effect=lambda creds: MagicMock()),
+            patch('main.get_credentials_from_session', side_effect=lambda creds_dict: creds_dict),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.clock = [1000.0]
+        time_patch = patch('main.time.monotonic', side_effect=lambda: self.clock[0])
+        time_patch.start()
+        self.addCleanup(time_patch.stop)
+
+    def test_same_user_reuses_session(self):
+        registry = main._SessionRegistry(10, 600)
+        creds = {'token': 'a1', 'refresh_token': 'alice'}
+        self.assertIs(registry.get(creds), registry.get(dict(creds)))
+        self.assertEqual(len(registry), 1)
+
+    def test_users_never_share_sessions(self):
+        registry = main._SessionRegistry(10, 600)
+        alice = registry.get({'token': 'a1', 'refresh_token': 'alice'})
+        bob = registry.get({'token': 'b1', 'refresh_token': 'bob'})
+        self.assertIsNot(alice, bob)
+        self.assertEqual(len(registry), 2)
+
+    def test_new_token_replaces_old_session(self):
+        registry = main._SessionRegistry(10, 600)
+        old = registry.get({'token': 'a1', 'refresh_token': 'alice'})
+        new = registry.get({'token': 'a2', 'refresh_token': 'alice'})
+        self.assertIsNot(old, new)
+        # A fetch may still be using the old session, so it is left to be garbage collected
+        old.close.assert_not_called()
+        self.assertEqual(len(registry), 1)
+
+    def test_lru_eviction_drops_session_without_closing_it(self):
+        registry = main._SessionRegistry(2, 600)
+        first = registry.get({'token': 't1', 'refresh_token': 'u1'})
+        second = registry.get({'token': 't2', 'refresh_token': 'u2'})
+        registry.get({'token': 't1', 'refresh_token': 'u1'})
+        registry.get({'token': 't3', 'refresh_token': 'u3'})
+        self.assertIs(registry.get({'token': 't1', 'refresh_token': 'u1'}), first)
+        self.assertIsNot(registry.get({'token': 't2', 'refresh_token': 'u2'}), second)
+        second.close.assert_not_called()
+        self.assertEqual(len(registry), 2)
+
+    def test_idle_sessions_expire(self):
+        registry = main._SessionRegistry(10, 600)
+        idle = registry.get({'token': 't1', 'refresh_token': 'u1'})
+        self.clock[0] += 601
+        registry.get({'token': 't2', 'refresh_token': 'u2'})
+        self.assertEqual(len(registry), 1)
+        idle.close.assert_not_called()
+        self.assertIsNot(registry.get({'token': 't1', 'refresh_token': 'u1'}), idle)
+
+    def test_sessions_are_built_outside_the_lock(self):
+        registry = main._SessionRegistry(10, 600)
+        built = []
+
+        def build(creds):
+            # Another user's lookup goes through while this session is being built
+            built.append(None)
+            if len(built) == 1:
+                built[0] = registry.get({'token': 'b1', 'refresh_token': 'bob'})
+            return MagicMock()
+
+        with patch('main.AuthorizedSession', side_effect=build):
+            alice = registry.get({'token': 'a1', 'refresh_token': 'alice'})
+        self.assertIs(registry.get({'token': 'a1', 'refresh_token': 'alice'}), alice)
+        self.assertIs(registry.get({'token': 'b1', 'refresh_token': 'bob'}), built[0])
+
+    def test_concurrent_builds_share_the_first_session(self):
+        registry = main._SessionRegistry(10, 600)
+        creds = {'token': 'a1', 'refresh_token': 'alice'}
+        first = []
+
+        def build(_creds):
+            # A second thread finishes its build for the same token first
+            first.append(None)
+            if len(first) == 1:
+                first[0] = registry.get(creds)
+            return MagicMock()
+
+        with patch('main.AuthorizedSession', side_effect=build):
+            self.assertIs(registry.get(creds), first[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from tests.test_near_duplicates import _article
+
+
+def _response(payload):
+    response = MagicMock()
+    response.candidates = [MagicMock()]
+    response.candidates[0].finish_reason = 1
+    response.text = json.dumps(payload)
+    return response
+
+
+def _group(headline, summary, *sources):
+    return {'group_headline': headline, 'consensus_summary': summary,
+            'stories': [{'headline': headline, 'source': s, 'angle': f"{s} angle"} for s in sources]}
+
+
+class TestShardSplitting(unittest.TestCase):
+    def test_blocks_stay_whole_and_shards_respect_the_size(self):
+        blocks = [main._format_email_block(f"News {i} <n{i}@x.com>", f"Issue {i}", _article(i, words=150)) for i in range(6)]
+        blocks[0] = f"*** PRIORITY SOURCE ***\n{blocks[0]}"
+        text = ''.join(blocks)
+        shard_tokens = main._estimate_tokens(blocks[1]) * 2 + 10
+        shards = main._split_into_shards(text, shard_tokens)
+        self.assertEqual(''.join(shards), text)
+        self.assertGreater(len(shards), 2)
+        self.assertTrue(shards[0].startswith("*** PRIORITY SOURCE ***"))
+        for shard in shards:
+            self.assertLessEqual(main._estimate_tokens(shard), shard_tokens)
+            self.assertTrue(shard.startswith(("*** PRIORITY SOURCE ***", "\n\n--- Newsletter from:")))
+
+    def test_oversized_block_is_cut_at_whitespace(self):
+        text = _article(1, words=3000)
+        shards = main._split_into_shards(text, 500)
+        self.assertEqual(''.join(shards), text)
+        self.assertTrue(all(main._estimate_tokens(s) <= 500 for s in shards))
+
+
+class TestMergePartialAnalyses(unittest.TestCase):
+    def test_same_event_from_different_shards_is_merged(self):
+        merged = main._merge_partial_analyses([
+            {'story_groups': [_group("Fed holds interest rates steady", "The Federal Reserve kept interest rates steady.", "WSJ", "NYT"),
+                              _group("Storm hits Gulf coast", "A hurricane made landfall.", "AP")],
+             'remaining_stories': [{'headline': "Local team wins"}]},
+            {'story_groups': [_group("Federal Reserve holds rates steady", "The Federal Reserve kept rates steady again.", "NYT", "Axios")],
+             'remaining_stories': [{'headline': "Local team wins"}, {'headline': "New park opens"}]},
+        ])
+        fed, storm = merged['story_groups']
+        self.assertEqual([s['source'] for s in fed['stories']], ['WSJ', 'NYT', 'Axios'])
+        self.assertEqual(storm['group_headline'], "Storm hits Gulf coast")
+        self.assertEqual([s['headline'] for s in merged['remaining_stories']], ["Local team wins", "New park opens"])
+
+
+class TestShardedAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.model = MagicMock()
+        # Other test modules may have mocked out google.api_core, so give the except clauses real exceptions
+        patchers = (patch('main.model', self.model), patch('main.genai'), patch('main.ANALYSIS_SHARD_TOKENS', 400),
+                    # These cover the raw-text map-reduce path
+                    patch('main.ISSUE_SUMMARIES_ENABLED', False),
+                    patch('main.ResourceExhausted', type('ResourceExhausted', (Exception,), {})),
+                    patch('main.InvalidArgument', type('InvalidArgument', (Exception,), {})))
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.text = ''.join(main._format_email_block(f"News {i} <n{i}@x.com>", f"Issue {i}", _article(i, words=200))
+                            for i in range(4))
+
+    def _map_response(self, prompt):
+        source = prompt.split('--- Newsletter from: ')[1].split(' ')[:2]
+        return _response({'story_groups': [_group("Chip export rules tighten", "New chip export rules.", ' '.join(source))],
+                          'remaining_stories': []})
+
+    def test_shards_are_analyzed_then_reconciled(self):
+        final = {'story_groups': [_group("Chip export rules tighten", "Reconciled.", "News 0", "News 1")], 'remaining_stories': []}
+        self.model.generate_content.side_effect = lambda prompt, **kwargs: (
+            _response(final) if prompt.startswith(main.RECONCILE_PROMPT_TEMPLATE) else self._map_response(prompt))
+        result = main.analyze_news_with_llm(self.text)
+        self.assertEqual(result, final)
+        prompts = [call.args[0] for call in self.model.generate_content.call_args_list]
+        shard_count = len(main._split_into_shards(self.text, 400))
+        self.assertEqual(len(prompts), shard_count + 1)
+        reconcile_prompt = prompts[-1]
+        self.assertTrue(reconcile_prompt.startswith(main.RECONCILE_PROMPT_TEMPLATE))
+        self.assertNotIn(_article(0, words=200)[:100], reconcile_prompt)
+
+    def test_shards_run_on_the_llm_pool(self):
+        self.model.generate_content.side_effect = lambda prompt, **kwargs: self._map_response(prompt)
+        with patch('main._worker_pool') as worker_pool:
+            main.analyze_news_with_llm(self.text)
+        worker_pool.for_user.assert_not_called()
+        self.assertGreater(main._llm_pool.stats()['completed'], 0)
+
+    def test_local_merge_is_used_when_reconcile_fails(self):
+        def generate(prompt, **kwargs):
+            if prompt.startswith(main.RECONCILE_PROMPT_TEMPLATE):
+                raise Exception("Some random error")
+            return self._map_response(prompt)
+        self.model.generate_content.side_effect = generate
+        result = main.analyze_news_with_llm(self.text)
+        self.assertEqual(len(result['story_groups']), 1)
+        self.assertEqual([s['source'] for s in result['story_groups'][0]['stories']],
+                         ['News 0', 'News 1', 'News 2', 'News 3'])
+
+    def test_error_when_every_shard_fails(self):
+        self.model.generate_content.side_effect = Exception("Some quota error")
+        result = main.analyze_news_with_llm(self.text)
+        self.assertEqual(result.get('error'), "AI rate limit reached. Please try again in a few minutes.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+ANALYSIS = {'story_groups': [{'group_headline': 'Fed holds rates', 'stories': []}], 'remaining_stories': []}
+
+
+def _briefing_text(*blocks):
+    return ''.join(main._format_email_block(sender, subject, text) for sender, subject, text in blocks)
+
+
+class TestContentFingerprint(unittest.TestCase):
+    def test_same_newsletters_in_any_order_share_a_fingerprint(self):
+        wsj = ('WSJ <access@wsj.com>', 'Markets AM', 'Stocks rose.')
+        axios = ('Axios <hi@axios.com>', 'AM', 'Chips news.')
+        self.assertEqual(main._content_fingerprint(_briefing_text(wsj, axios)),
+                         main._content_fingerprint(_briefing_text(axios, wsj)))
+
+    def test_any_content_difference_changes_it(self):
+        wsj = ('WSJ <access@wsj.com>', 'Markets AM', 'Stocks rose.')
+        base = main._content_fingerprint(_briefing_text(wsj))
+        self.assertNotEqual(base, main._content_fingerprint(_briefing_text(('WSJ <access@wsj.com>', 'Markets AM', 'Stocks fell.'))))
+        self.assertNotEqual(base, main._content_fingerprint("*** PRIORITY SOURCE ***\n" + _briefing_text(wsj)))
+
+
+class TestSharedAnalysisCache(unittest.TestCase):
+    def test_entries_are_copies(self):
+        cache = main._SharedAnalysisCache(10, 60)
+        cache.put('fp', ANALYSIS)
+        cache.get('fp')['story_groups'].clear()
+        self.assertEqual(cache.get('fp'), ANALYSIS)
+
+    def test_ttl_and_size_eviction(self):
+        cache = main._SharedAnalysisCache(2, 60)
+        with patch('main.time.time', return_value=1000):
+            cache.put('a', ANALYSIS)
+            cache.put('b', ANALYSIS)
+            cache.get('a')
+            cache.put('c', ANALYSIS)
+            self.assertIsNone(cache.get('b'))
+            self.assertIsNotNone(cache.get('a'))
+        with patch('main.time.time', return_value=1061):
+            self.assertIsNone(cache.get('a'))
+            self.assertIsNone(cache.get('c'))
+
+    def test_analysis_mentioning_the_user_is_not_shared(self):
+        cache = main._SharedAnalysisCache(10, 60)
+        personal = {'story_groups': [{'group_headline': 'Jordan Smith, your picks', 'stories': []}]}
+        self.assertFalse(cache.put('fp', personal, ['jordan@example.com', 'jordan', 'Jordan Smith']))
+        self.assertIsNone(cache.get('fp'))
+        self.assertTrue(cache.put('fp', ANALYSIS, ['jordan@example.com', 'jordan', 'Jordan Smith']))
+
+    def test_finished_briefing_is_shared_without_user_data(self):
+        text = _briefing_text(('WSJ <access@wsj.com>', 'Markets AM', 'Stocks rose.'))
+        briefing = {'email': 'jordan@example.com', 'cache_key': 'jordan@example.com', 'settings_hash': 'h',
+                    'hours': 24, 'message_count': 1, 'normal_count': 1, 'priority_count': 0, 'text': text,
+                    'fingerprint': main._content_fingerprint(text), 'message_set': 'm', 'identifiers': ['jordan@example.com', 'jordan', None]}
+        with patch('main._shared_analysis_cache', main._SharedAnalysisCache(10, 60)) as cache, \
+             patch('main._update_cached_analysis'):
+            main._finish_briefing(briefing, ANALYSIS, 10)
+            self.assertEqual(cache.get(briefing['fingerprint']), ANALYSIS)
+            stored = repr(cache._entries)
+        self.assertNotIn('jordan', stored)
+        self.assertNotIn(main.anonymize_user('jordan@example.com'), stored)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import sys
+import os
+import threading
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+
+class TestSingleFlight(unittest.TestCase):
+    def _run_concurrently(self, flights, key, fn, callers=4):
+        """Start the leader, then attach the other callers while fn is blocked."""
+        results = [None] * callers
+        errors = [None] * callers
+
+        def call(i):
+            try:
+                results[i] = flights.do(key, fn)
+            except Exception as e:
+                errors[i] = e
+
+        attached = threading.Semaphore(0)
+        begin = flights.begin
+
+        def counting_begin(k):
+            future, leader = begin(k)
+            if not leader:
+                attached.release()
+            return future, leader
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+        with patch.object(flights, 'begin', side_effect=counting_begin):
+            threads[0].start()
+            self.started.wait(5)
+            for t in threads[1:]:
+                t.start()
+            for _ in threads[1:]:
+                attached.acquire(timeout=5)
+        self.release.set()
+        for t in threads:
+            t.join(5)
+        return results, errors
+
+    def setUp(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def _work(self, result=None, error=None):
+        def fn():
+            self.calls += 1
+            self.started.set()
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return fn
+
+    def test_concurrent_callers_share_one_run(self):
+        flights = main._SingleFlight(timeout_seconds=30)
+        results, errors = self._run_concurrently(flights, ('u', 'h'), self._work(result=({'ok': 1}, 200)))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [({'ok': 1}, 200)] * 4)
+        self.assertEqual(errors, [None] * 4)
+        self.assertEqual(flights._flights, {})
+
+    def test_leader_exception_reaches_every_caller(self):
+        flights = main._SingleFlight(timeout_seconds=30)
+        _results, errors = self._run_concurrently(flights, 'k', self._work(error=RuntimeError("tts quota")), callers=3)
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(e, RuntimeError) for e in errors))
+
+    def test_finished_flights_are_not_reused(self):
+        flights = main._SingleFlight(timeout_seconds=30)
+        self.assertEqual(flights.do('k', lambda: 1), 1)
+        self.assertEqual(flights.do('k', lambda: 2), 2)
+
+    def test_abandoned_leader_is_replaced_after_the_timeout(self):
+        flights = main._SingleFlight(timeout_seconds=60)
+        with patch('main.time.monotonic', return_value=1000):
+            stale, leader = flights.begin('k')
+        self.assertTrue(leader)
+        with patch('main.time.monotonic', return_value=1030):
+            self.assertEqual(flights.begin('k'), (stale, False))
+        with patch('main.time.monotonic', return_value=1061):
+            fresh, leader = flights.begin('k')
+        self.assertTrue(leader)
+        self.assertIsNot(fresh, stale)
+        # The old leader finishing late must not release the new flight
+        flights.finish('k', stale, result=1)
+        self.assertIs(flights._flights['k'][1], fresh)
+
+    def test_follower_runs_itself_if_the_leader_never_finishes(self):
+        flights = main._SingleFlight(timeout_seconds=0.05)
+        flights.begin('k')
+        self.assertEqual(flights.do('k', lambda: 'own'), 'own')
+
+
+class TestBriefingStreamFlight(unittest.TestCase):
+    def setUp(self):
+        patchers = (patch('main.model', MagicMock()), patch('main.genai'),
+                    patch('main._update_cached_analysis'), patch('main._shared_analysis_cache'),
+                    patch('main.ResourceExhausted', type('ResourceExhausted', (Exception,), {})),
+                    patch('main.InvalidArgument', type('InvalidArgument', (Exception,), {})))
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.briefing = {'email': None, 'cache_key': 'u', 'settings_hash': 'h', 'hours': 24, 'message_count': 1,
+                         'normal_count': 1, 'priority_count': 0, 'text': 'Valid newsletter text', 'fingerprint': 'f',
+                         'message_set': 'm', 'identifiers': []}
+
+    def _stream(self, pieces):
+        response = MagicMock()
+        response.candidates = [MagicMock(finish_reason=1)]
+        response.__iter__ = lambda _self: iter([MagicMock(text=piece) for piece in pieces])
+        main.model.generate_content.return_value = response
+
+    def test_stream_leader_releases_attached_requests(self):
+        analysis = {'story_groups': [], 'remaining_stories': [{'headline': 'Rates hold'}]}
+        self._stream([json.dumps(analysis)])
+        with patch('main._briefing_flights', main._SingleFlight(timeout_seconds=30)) as flights:
+            future, _leader = flights.begin(('u', 'h'))
+            follower_future, leader = flights.begin(('u', 'h'))
+            self.assertFalse(leader)
+            list(main._briefing_stream_lines(self.briefing, (('u', 'h'), future)))
+            self.assertEqual(flights.wait(follower_future), (analysis, 200))
+            self.assertEqual(flights._flights, {})
+
+    def test_disconnected_stream_does_not_strand_followers(self):
+        self._stream(['{"story_groups": [{"group_headline": "A"}, ', '{"group_headline": "B"}], '])
+        with patch('main._briefing_flights', main._SingleFlight(timeout_seconds=30)) as flights:
+            future, _leader = flights.begin(('u', 'h'))
+            lines = main._briefing_stream_lines(self.briefing, (('u', 'h'), future))
+            next(lines)
+            lines.close()
+            self.assertEqual(flights.wait(future), ({"error": "AI analysis failed."}, 503))
+
+
+if __name__ == '__main__':
+    unittest.main()
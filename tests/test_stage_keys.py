@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import copy
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+SETTINGS = {'sources': ['wsj.com', 'axios.com'], 'time_window_hours': 24, 'personality': 'anchor',
+            'priority_sources': ['wsj.com'], 'keywords': ['Fed']}
+ANALYSIS = {'story_groups': [{'group_headline': 'Rates hold', 'stories': []}], 'remaining_stories': []}
+
+
+class TestBriefingStageKeys(unittest.TestCase):
+    def _keys(self, **changes):
+        return main._briefing_stage_keys(dict(SETTINGS, **changes))
+
+    def test_persona_and_unrelated_settings_keep_every_key(self):
+        self.assertEqual(self._keys(personality='dj', pregenerate_briefing=True), self._keys())
+
+    def test_watchlist_changes_only_the_filter_stage(self):
+        changed = self._keys(keywords=['Fed', 'tariffs'])
+        self.assertEqual(changed['selection'], self._keys()['selection'])
+        self.assertNotEqual(changed['filter'], self._keys()['filter'])
+        self.assertNotEqual(self._keys(priority_sources=[])['filter'], self._keys()['filter'])
+
+    def test_selection_changes_flow_downstream(self):
+        for changes in ({'sources': ['wsj.com']}, {'time_window_hours': 72}):
+            changed = self._keys(**changes)
+            self.assertNotEqual(changed['selection'], self._keys()['selection'])
+            self.assertNotEqual(changed['filter'], self._keys()['filter'])
+
+    def test_keys_ignore_order_and_case(self):
+        self.assertEqual(self._keys(sources=['Axios.com', 'WSJ.com'], keywords=['fed']), self._keys())
+
+
+class TestStageCaches(unittest.TestCase):
+    def setUp(self):
+        self.cache = {}
+        patchers = (patch('main.load_cache', side_effect=lambda: copy.deepcopy(self.cache)),
+                    patch('main.save_cache', side_effect=lambda data: self.cache.update(copy.deepcopy(data))))
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_audio_survives_a_rewrite_of_the_same_analysis(self):
+        main._update_cached_analysis('u', 'h1', ANALYSIS, 'fp')
+        main._update_cached_audio('u', 'audio-key', 'QUFB')
+        main._update_cached_analysis('u', 'h2', copy.deepcopy(ANALYSIS), 'fp')
+        self.assertEqual(self.cache['u']['audio'], 'QUFB')
+        main._update_cached_analysis('u', 'h2', {'story_groups': [], 'remaining_stories': []}, 'fp2')
+        self.assertNotIn('audio', self.cache['u'])
+
+    def test_watchlist_change_with_the_same_content_skips_gemini(self):
+        main._update_cached_analysis('u', main._briefing_stage_keys(SETTINGS)['filter'], ANALYSIS,
+                                     main._content_fingerprint("--- Newsletter from: WSJ ---\nRates held."), 'ms')
+        settings = dict(SETTINGS, keywords=['Fed', 'rates'])
+        briefing_request = {'email': 'u@example.com', 'user_info': {}, 'settings': settings, 'cache_key': 'u',
+                            'settings_hash': main._briefing_stage_keys(settings)['filter'], 'creds_dict': {},
+                            'message_set': 'ms'}
+        with patch('main._sync_gmail_messages', return_value=([], {'records': {}, 'dates': {}})), \
+             patch('main._process_email_messages', return_value=("--- Newsletter from: WSJ ---\nRates held.", 1, 0, 1)), \
+             patch('main._commit_gmail_sync'), patch('main._boilerplate_models'), \
+             patch('main.analyze_news_with_llm') as analyze:
+            briefing, reply = main._prepare_briefing(briefing_request)
+        self.assertIsNone(briefing)
+        self.assertEqual(reply, (ANALYSIS, 200))
+        analyze.assert_not_called()
+        self.assertEqual(self.cache['u']['settings_hash'], briefing_request['settings_hash'])
+
+
+if __name__ == '__main__':
+    unittest.main()
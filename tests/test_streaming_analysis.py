@@ -0,0 +1,125 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import random
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+
+ANALYSIS = {
+    "story_groups": [
+        {"group_headline": "Fed holds {rates}", "consensus_summary": "Quote: \"hold\" [steady] \\ done",
+         "stories": [{"headline": "A", "source": "WSJ", "angle": "Argues {x}"}]},
+        {"group_headline": "Storm été hits", "consensus_summary": "Brace } yourself ]",
+         "stories": [{"headline": "B", "source": "AP", "angle": "Cites \"data\""}]},
+    ],
+    "remaining_stories": [{"headline": "Local team wins"}, {"headline": "Park opens \\ [soon]"}],
+}
+
+
+def _chunk(text, rng):
+    chunks, i = [], 0
+    while i < len(text):
+        step = rng.randint(1, 12)
+        chunks.append(text[i:i + step])
+        i += step
+    return chunks
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class TestAnalysisStreamParser(unittest.TestCase):
+    def test_elements_come_out_whole_for_any_chunking(self):
+        text = "Here is the analysis: " + json.dumps(ANALYSIS, indent=2)
+        rng = random.Random(3)
+        for trial in range(50):
+            with self.subTest(trial=trial):
+                parser = main._AnalysisStreamParser()
+                emitted = [item for chunk in _chunk(text, rng) for item in parser.feed(chunk)]
+                self.assertEqual(emitted, [('story_groups', g) for g in ANALYSIS['story_groups']] +
+                                 [('remaining_stories', s) for s in ANALYSIS['remaining_stories']])
+
+    def test_group_is_emitted_as_soon_as_it_closes(self):
+        text = json.dumps(ANALYSIS)
+        first_end = text.index(json.dumps(ANALYSIS['story_groups'][0])) + len(json.dumps(ANALYSIS['story_groups'][0]))
+        parser = main._AnalysisStreamParser()
+        self.assertEqual(parser.feed(text[:first_end - 1]), [])
+        self.assertEqual(parser.feed(text[first_end - 1:first_end]), [('story_groups', ANALYSIS['story_groups'][0])])
+
+
+class TestStreamAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.model = MagicMock()
+        for p in (patch('main.model', self.model), patch('main.genai'),
+                  patch('main.ResourceExhausted', type('ResourceExhausted', (Exception,), {})),
+                  patch('main.InvalidArgument', type('InvalidArgument', (Exception,), {}))):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _stream(self, text, finish_reason=1):
+        consumed = []
+        response = MagicMock()
+        response.candidates = [MagicMock()]
+        response.candidates[0].finish_reason = finish_reason
+
+        def chunks():
+            for piece in _chunk(text, random.Random(1)):
+                consumed.append(piece)
+                yield _Chunk(piece)
+        response.__iter__ = lambda _self: chunks()
+        self.model.generate_content.return_value = response
+        return consumed
+
+    def test_first_group_arrives_before_generation_ends(self):
+        text = json.dumps(ANALYSIS)
+        consumed = self._stream(text)
+        events = main.analyze_news_with_llm_stream("Valid newsletter text")
+        kind, group = next(events)
+        self.assertEqual((kind, group), ('story_group', ANALYSIS['story_groups'][0]))
+        self.assertLess(len(''.join(consumed)), len(text) / 2)
+        rest = list(events)
+        self.assertEqual(rest[-1], ('result', ANALYSIS))
+        self.assertEqual([k for k, _ in rest[:-1]], ['story_group', 'remaining_story', 'remaining_story'])
+        self.assertTrue(self.model.generate_content.call_args.kwargs['stream'])
+
+    def test_finish_reason_errors_match_the_blocking_call(self):
+        self._stream(json.dumps(ANALYSIS)[:40], finish_reason=2)
+        events = list(main.analyze_news_with_llm_stream("Valid newsletter text"))
+        self.assertEqual(events[-1], ('result', {"error": "The briefing was too long to generate. Try reducing your sources or lookback period."}))
+
+    def test_ndjson_lines_end_with_result_and_cache_the_briefing(self):
+        self._stream(json.dumps(ANALYSIS))
+        briefing = {'email': None, 'cache_key': 'u', 'settings_hash': 'h', 'hours': 24, 'message_count': 2,
+                    'normal_count': 2, 'priority_count': 0, 'text': 'Valid newsletter text', 'fingerprint': 'f',
+                    'message_set': 'm', 'identifiers': []}
+        with patch('main._update_cached_analysis') as update_cache, patch('main._shared_analysis_cache'), \
+             patch('main.limiter') as limiter:
+            lines = [json.loads(line) for line in main._briefing_stream_lines(briefing, None, [('3 per day', ['u', 's'])])]
+        self.assertEqual([line['type'] for line in lines],
+                         ['story_group', 'story_group', 'remaining_story', 'remaining_story', 'result'])
+        self.assertEqual(lines[-1]['data'], ANALYSIS)
+        update_cache.assert_called_once_with('u', 'h', ANALYSIS, 'f', 'm')
+        limiter.limiter.hit.assert_called_once_with('3 per day', 'u', 's')
+
+    def test_ndjson_error_line_is_not_cached(self):
+        self.model.generate_content.side_effect = Exception("Some quota error")
+        briefing = {'email': None, 'cache_key': 'u', 'settings_hash': 'h', 'hours': 24, 'message_count': 1,
+                    'normal_count': 1, 'priority_count': 0, 'text': 'Valid newsletter text', 'fingerprint': 'f',
+                    'message_set': 'm', 'identifiers': []}
+        with patch('main._update_cached_analysis') as update_cache, patch('main.limiter') as limiter:
+            lines = [json.loads(line) for line in main._briefing_stream_lines(briefing, None, [('3 per day', ['u', 's'])])]
+        self.assertEqual(lines, [{'type': 'error', 'error': "AI rate limit reached. Please try again in a few minutes."}])
+        update_cache.assert_not_called()
+        # A stream that fails partway is not charged against the daily limit
+        limiter.limiter.hit.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import sys
+import os
+import tempfile
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from tests.test_near_duplicates import _article
+
+
+class TestEstimateTokens(unittest.TestCase):
+    def setUp(self):
+        main._token_estimate_cache.clear()
+        main._token_estimate_cache_chars = 0
+
+    def test_english_prose_is_about_four_chars_per_token(self):
+        text = _article(1, words=2000)
+        self.assertAlmostEqual(len(text) / main._estimate_tokens(text), 4.2, delta=0.8)
+
+    def test_links_and_non_latin_text_cost_more_per_char(self):
+        prose = _article(2, words=400)[:2000]
+        links = ' '.join(f"https://click.example.com/ls/{i:08x}?u=a1b2c3&id=9f8e7d" for i in range(40))[:2000]
+        cjk = ('経済ニュースの要約です。' * 200)[:2000]
+        for other in (links, cjk):
+            self.assertGreater(main._estimate_tokens(other), main._estimate_tokens(prose) * 1.3)
+
+    def test_long_unbroken_runs_still_count(self):
+        self.assertGreater(main._estimate_tokens('a' * 4000), 500)
+
+    def test_repeat_estimates_hit_the_cache(self):
+        text = _article(3)
+        with patch('main._token_features', wraps=main._token_features) as features:
+            first = main._estimate_tokens(text)
+            self.assertEqual(main._estimate_tokens(text), first)
+            self.assertEqual(main._estimate_tokens(''.join(text)), first)
+        self.assertEqual(features.call_count, 1)
+
+    def test_cache_is_keyed_by_the_text_itself(self):
+        # Not by its per-process hash, which two different texts can share
+        text = _article(6)
+        tokens = main._estimate_tokens(text)
+        self.assertEqual(main._token_estimate_cache, {text: tokens})
+
+    def test_cache_is_bounded_by_characters(self):
+        with patch('main.TOKEN_ESTIMATE_CACHE_MAX_CHARS', 5000):
+            for seed in range(10):
+                main._estimate_tokens(_article(seed, words=300))
+        self.assertLessEqual(sum(map(len, main._token_estimate_cache)), 5000)
+
+    def test_concurrent_estimates_keep_the_size_count(self):
+        texts = [_article(seed, words=300) for seed in range(40)]
+        with patch('main.TOKEN_ESTIMATE_CACHE_MAX_CHARS', 20000), ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(main._estimate_tokens, texts * 5))
+            self.assertLessEqual(main._token_estimate_cache_chars, 20000)
+        self.assertEqual(main._token_estimate_cache_chars, sum(map(len, main._token_estimate_cache)))
+
+    def test_cached_estimate_is_microseconds(self):
+        text = _article(4, words=2500)
+        main._estimate_tokens(text)
+        self.assertLess(min(timeit.repeat(lambda: main._estimate_tokens(text), number=1000, repeat=3)) / 1000, 20e-6)
+
+    def test_calibration_file_overrides_defaults(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'coefficients': {'words': 2.0, 'chars': 0.0, 'bogus': 9}}, f)
+        self.addCleanup(os.remove, f.name)
+        coefficients = main._load_token_coefficients(f.name)
+        self.assertEqual(coefficients['words'], 2.0)
+        self.assertEqual(coefficients['chars'], 0.0)
+        self.assertNotIn('bogus', coefficients)
+        self.assertEqual(main._load_token_coefficients('/nonexistent.json'), main._DEFAULT_TOKEN_COEFFICIENTS)
+
+
+class TestPreValidationUsesTokens(unittest.TestCase):
+    def test_dense_text_under_char_limit_is_rejected(self):
+        mock_model = MagicMock()
+        with patch('main.model', mock_model), patch('main.genai'), patch('main.MAX_LLM_INPUT_TOKENS', 1000):
+            result = main.analyze_news_with_llm(_article(5, words=2000))
+        self.assertIn('Too much newsletter content', result['error'])
+        mock_model.generate_content.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
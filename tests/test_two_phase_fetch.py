@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add parent dir to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Other test modules may have replaced requests with a MagicMock; these tests need real HTTP
+if 'requests' in sys.modules and not hasattr(sys.modules['requests'], '__file__'):
+    del sys.modules['requests']
+import requests
+
+import main
+from tests.fake_gmail_server import FakeGmailServer, make_message
+
+
+def _candidate(index, sender, subject, date=0, list_id=''):
+    return {'index': index, 'id': f"m{index}", 'sender': sender, 'subject': subject, 'date': date, 'list_id': list_id, 'size': 1000}
+
+
+class TestRankCandidates(unittest.TestCase):
+    def test_resends_and_forwards_are_deduped(self):
+        ranked = main._rank_candidates([
+            _candidate(0, 'WSJ <news@wsj.com>', 'Morning Brief', date=3),
+            _candidate(1, 'WSJ <news@wsj.com>', 'Fwd: Morning Brief', date=2),
+            _candidate(2, 'Axios <hi@axios.com>', 'Morning Brief', date=1),
+        ], [], [])
+        self.assertEqual([c['id'] for c in ranked], ['m0', 'm2'])
+
+    def test_list_id_identifies_the_same_list_across_addresses(self):
+        ranked = main._rank_candidates([
+            _candidate(0, 'A <a@nyt.com>', 'The Morning', list_id='<morning.nyt.com>'),
+            _candidate(1, 'B <b@nyt.com>', 'The Morning', list_id='<morning.nyt.com>'),
+        ], [], [])
+        self.assertEqual(len(ranked), 1)
+
+    def test_daily_issues_with_a_fixed_subject_are_kept(self):
+        day_ms = 24 * 3600 * 1000
+        ranked = main._rank_candidates([
+            _candidate(0, 'NYT <nyt@nytimes.com>', 'The Morning', date=2 * day_ms),
+            _candidate(1, 'NYT <nyt@nytimes.com>', 'The Morning', date=day_ms),
+            _candidate(2, 'NYT <nyt@nytimes.com>', 'Fwd: The Morning', date=day_ms - 3600 * 1000),
+        ], [], [])
+        self.assertEqual([c['id'] for c in ranked], ['m0', 'm1'])
+
+    def test_cached_and_fresh_copies_share_a_key(self):
+        message = make_message('m0', 'A <a@nyt.com>', 'The Morning', '<p>Story</p>', 5)
+        message['payload']['headers'].append({'name': 'List-Id', 'value': '<morning.nyt.com>'})
+        record = main._parse_gmail_message(message)
+        self.assertEqual(record['list_id'], '<morning.nyt.com>')
+        ranked = main._rank_candidates([
+            dict(record, index=0, record=record),
+            _candidate(1, 'B <b@nyt.com>', 'The Morning', date=4, list_id='<morning.nyt.com>'),
+        ], [], [])
+        self.assertEqual(len(ranked), 1)
+
+    def test_priority_then_subject_keyword_then_newest(self):
+        ranked = main._rank_candidates([
+            _candidate(0, 'Axios <hi@axios.com>', 'Tech roundup', date=5),
+            _candidate(1, 'Axios <hi@axios.com>', 'Chips and AI', date=4),
+            _candidate(2, 'WSJ <news@wsj.com>', 'Markets', date=1),
+        ], ['chips'], ['wsj.com'])
+        self.assertEqual([c['id'] for c in ranked], ['m2', 'm1', 'm0'])
+
+
+class TestTwoPhaseFetch(unittest.TestCase):
+    def setUp(self):
+        patchers = [
+            patch('main._get_auth_session', side_effect=lambda creds_dict: requests.Session()),
+            patch('main.GMAIL_FETCH_MODE', 'batch'),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_only_surviving_bodies_are_downloaded(self):
+        messages = {
+            'm0': make_message('m0', 'WSJ <news@wsj.com>', 'Brief', '<p>first copy</p>', 2),
+            'm1': make_message('m1', 'WSJ <news@wsj.com>', 'Re: Brief', '<p>resend</p>', 1),
+            'm2': make_message('m2', 'Axios <hi@axios.com>', 'AM', '<p>other news</p>', 1),
+        }
+        with FakeGmailServer(messages) as server:
+            with patch('main.GMAIL_API_BASE', server.base_url), patch('main.GMAIL_BATCH_URL', server.batch_url):
+                text, normal_count, _priority, message_count = main._process_email_messages(
+                    [{'id': mid} for mid in messages], {}, [], []
+                )
+            full_batches = [body for kind, body in server.requests if kind == 'batch' and 'format=full' in body]
+        self.assertEqual(message_count, 3)
+        self.assertEqual(normal_count, 2)
+        self.assertEqual(len(full_batches), 1)
+        self.assertNotIn('/messages/m1?', full_batches[0])
+        self.assertNotIn('resend', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
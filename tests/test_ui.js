@@ -45,13 +45,24 @@ const server = app.listen(5002, async () => {
                     contentType: 'application/json',
                     body: JSON.stringify({ sources: [], time_window_hours: 24, personality: "anchor", priority_sources: [], keywords: [] })
                 });
-            } else if (url.includes('/api/fetch_emails')) {
+            } else if (url.includes('/api/briefing_jobs') && req.method() === 'POST') {
+                // Briefings are queued as a job, then polled until the result event arrives
+                req.respond({
+                    status: 202,
+                    contentType: 'application/json',
+                    body: JSON.stringify({ job_id: "job1", status: "queued" })
+                });
+            } else if (url.includes('/api/briefing_jobs/')) {
                 req.respond({
                     status: 200,
                     contentType: 'application/json',
                     body: JSON.stringify({
-                        story_groups: [{ group_headline: "Testing Success", group_summary: "Test UI logic" }],
-                        remaining_stories: []
+                        status: "done",
+                        events: [{ type: "result", data: {
+                            story_groups: [{ group_headline: "Testing Success", group_summary: "Test UI logic" }],
+                            remaining_stories: []
+                        } }],
+                        next: 1
                     })
                 });
             } else if (url.includes('posthog') || url.includes('sentry')) {
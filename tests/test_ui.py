@@ -34,7 +34,7 @@ def test_frontend_loads_without_errors(page: Page, live_server):
         body='{"sources": ["example.com"], "time_window_hours": 24, "personality": "anchor", "priority_sources": [], "keywords": []}'
     ))
 
-    # 3) Mock /api/fetch_emails
+    # 3) Mock /api/briefing_jobs: the POST queues a job and polling it returns the finished briefing
     mock_analysis = {
         "story_groups": [{
             "group_headline": "Mocked News Feature Verified",
@@ -43,11 +43,14 @@ def test_frontend_loads_without_errors(page: Page, live_server):
         }],
         "remaining_stories": [{"headline": "Mocked remaining brief."}]
     }
-    page.route("**/api/fetch_emails", lambda route: route.fulfill(
-        status=200,
-        content_type="application/json",
-        body=json.dumps(mock_analysis)
-    ))
+    def briefing_jobs(route):
+        if route.request.method == "POST":
+            route.fulfill(status=202, content_type="application/json",
+                          body=json.dumps({"job_id": "job1", "status": "queued"}))
+        else:
+            route.fulfill(status=200, content_type="application/json",
+                          body=json.dumps({"status": "done", "events": [{"type": "result", "data": mock_analysis}], "next": 1}))
+    page.route("**/api/briefing_jobs**", briefing_jobs)
 
     # Test Step 1: Browse to the server
     print(f"Navigating to {live_server.url}")
@@ -108,6 +108,18 @@ class TestUpdateSettingsRoute(unittest.TestCase):
             self.assertEqual(response.status_code, 400)
             self.assertEqual(response.get_json()['error'], 'Invalid type for personality. Expected a string.')
 
+    def test_update_settings_invalid_type_pregenerate(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess['credentials'] = 'dummy_token'
+
+            response = c.post('/api/settings', json={
+                'pregenerate_briefing': 'yes'
+            })
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()['error'], 'Invalid type for pregenerate_briefing. Expected a boolean.')
+
     @patch('main.save_settings')
     @patch('main.get_user_info')
     def test_update_settings_sanitization(self, mock_get_user_info, mock_save_settings):
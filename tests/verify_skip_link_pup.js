@@ -45,7 +45,7 @@ const server = app.listen(5002, async () => {
                     contentType: 'application/json',
                     body: JSON.stringify({ sources: [], time_window_hours: 24, personality: "anchor", priority_sources: [], keywords: [] })
                 });
-            } else if (url.includes('/api/fetch_emails')) {
+            } else if (url.includes('/api/briefing_jobs')) {
                 req.respond({
                     status: 200,
                     contentType: 'application/json',